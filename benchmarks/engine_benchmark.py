@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+""" Benchmark of the NetCDF write engines and file formats
+
+Writes the same synthetic variable on several grid sizes with each engine
+and reports the file size and the write and read time of each file.
+Engines whose package is not installed are skipped.
+
+usage: python benchmarks/engine_benchmark.py [--nyears N] [--dlat DLAT ...]
+       [--timeres TIMERES] [--chunk-cache SIZE] [--repeat N]
+"""
+
+import argparse
+import importlib
+import os
+import tempfile
+import time
+
+from mdtf_test_data.synthetic import generate_synthetic_dataset
+from mdtf_test_data.synthetic import write_to_netcdf
+from mdtf_test_data.synthetic.planner import format_size
+from mdtf_test_data.synthetic.planner import parse_size
+
+import xarray as xr
+
+# name and storage options of each benchmarked engine
+SETTINGS = [
+    ("netcdf4", {"engine": "netcdf4"}),
+    ("netcdf4-zlib", {"engine": "netcdf4", "compression": "zlib", "complevel": 1}),
+    ("netcdf4-nc3", {"engine": "netcdf4", "format": "NETCDF3_64BIT"}),
+    ("h5netcdf", {"engine": "h5netcdf"}),
+    ("h5netcdf-zlib", {"engine": "h5netcdf", "compression": "zlib", "complevel": 1}),
+    ("scipy-nc3", {"engine": "scipy"}),
+]
+
+# package imported by each engine
+ENGINE_MODULES = {"netcdf4": "netCDF4", "h5netcdf": "h5netcdf", "scipy": "scipy"}
+
+
+def parse():
+    """Parses the command line options"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nyears", type=int, default=1, help="Years of data")
+    parser.add_argument(
+        "--dlat",
+        type=float,
+        nargs="+",
+        default=[20.0, 5.0, 1.0],
+        help="Grid spacings, one file size per spacing",
+    )
+    parser.add_argument("--timeres", type=str, default="day", help="Time resolution")
+    parser.add_argument(
+        "--chunk-cache", type=str, default=None, help="HDF5 chunk cache, e.g. 64M"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions")
+    return parser.parse_args()
+
+
+def best_time(func, repeat):
+    """Returns the shortest of several timings of a function"""
+    timings = []
+    for _ in range(0, repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def available(engine):
+    """Checks whether the package behind an engine is installed"""
+    try:
+        importlib.import_module(ENGINE_MODULES[engine])
+    except ImportError:
+        return False
+    return True
+
+
+def main():
+    args = parse()
+    chunk_cache = parse_size(args.chunk_cache)
+    print(f"{'grid':>8} {'engine':<14} {'size':>9} {'write':>9} {'read':>9}")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for dlat in args.dlat:
+            dset = generate_synthetic_dataset(
+                dlat,
+                dlat,
+                1,
+                args.nyears,
+                "tas",
+                timeres=args.timeres,
+                attrs={"units": "K"},
+                stats=[(280.0, 10.0)],
+            )
+            grid = f"{dlat:g}deg"
+
+            for name, storage in SETTINGS:
+                if not available(storage["engine"]):
+                    print(f"{grid:>8} {name:<14} skipped: {storage['engine']} missing")
+                    continue
+                if chunk_cache is not None:
+                    storage = dict(storage, chunk_cache=chunk_cache)
+                outfile = os.path.join(tmpdir, f"{name}-{grid}.nc")
+
+                def write():
+                    write_to_netcdf(dset.copy(), outfile, storage=storage)
+
+                def read():
+                    with xr.open_dataset(
+                        outfile, engine=storage["engine"], decode_times=False
+                    ) as result:
+                        result["tas"].load()
+
+                try:
+                    write_seconds = best_time(write, args.repeat)
+                except (ValueError, RuntimeError, OSError) as exc:
+                    print(f"{grid:>8} {name:<14} unavailable: {exc}")
+                    continue
+                read_seconds = best_time(read, args.repeat)
+                size = os.path.getsize(outfile)
+                print(
+                    f"{grid:>8} {name:<14} {format_size(size):>9} "
+                    + f"{write_seconds * 1000.0:>7.1f}ms {read_seconds * 1000.0:>7.1f}ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
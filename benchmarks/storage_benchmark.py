@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+""" Benchmark of NetCDF compression and chunk-layout settings
+
+Writes the same synthetic variable with each storage setting and reports
+the file size and the write and read throughput.
+
+usage: python benchmarks/storage_benchmark.py [--nyears N] [--dlat DLAT]
+       [--dlon DLON] [--timeres TIMERES] [--repeat N]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from mdtf_test_data.synthetic import generate_synthetic_dataset
+from mdtf_test_data.synthetic import write_to_netcdf
+from mdtf_test_data.synthetic.planner import format_size
+
+import xarray as xr
+
+# name and storage options of each benchmarked setting
+SETTINGS = [
+    ("uncompressed", None),
+    ("zlib-1", {"compression": "zlib", "complevel": 1}),
+    ("zlib-4", {"compression": "zlib", "complevel": 4}),
+    ("zlib-4-noshuffle", {"compression": "zlib", "complevel": 4, "shuffle": False}),
+    ("zlib-9", {"compression": "zlib", "complevel": 9}),
+    ("zstd-3", {"compression": "zstd", "complevel": 3}),
+    ("zlib-4-time1", {"compression": "zlib", "complevel": 4, "chunks": {"time": 1}}),
+    ("zlib-4-time12", {"compression": "zlib", "complevel": 4, "chunks": {"time": 12}}),
+]
+
+
+def parse():
+    """Parses the command line options"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nyears", type=int, default=1, help="Years of data")
+    parser.add_argument("--dlat", type=float, default=2.0, help="Latitude spacing")
+    parser.add_argument("--dlon", type=float, default=2.0, help="Longitude spacing")
+    parser.add_argument("--timeres", type=str, default="day", help="Time resolution")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions")
+    return parser.parse_args()
+
+
+def best_time(func, repeat):
+    """Returns the shortest of several timings of a function"""
+    timings = []
+    for _ in range(0, repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    args = parse()
+    dset = generate_synthetic_dataset(
+        args.dlon,
+        args.dlat,
+        1,
+        args.nyears,
+        "tas",
+        timeres=args.timeres,
+        attrs={"units": "K"},
+        stats=[(280.0, 10.0)],
+    )
+    nbytes = dset["tas"].nbytes
+    print(f"tas{dset['tas'].shape}: {format_size(nbytes)} in memory")
+    print(f"{'setting':<18} {'size':>9} {'ratio':>6} {'write':>11} {'read':>11}")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, storage in SETTINGS:
+            outfile = os.path.join(tmpdir, f"{name}.nc")
+
+            def write():
+                write_to_netcdf(dset.copy(), outfile, storage=storage)
+
+            def read():
+                with xr.open_dataset(outfile, decode_times=False) as result:
+                    result["tas"].load()
+
+            try:
+                write_seconds = best_time(write, args.repeat)
+            except (ValueError, RuntimeError) as exc:
+                print(f"{name:<18} unavailable: {exc}")
+                continue
+            read_seconds = best_time(read, args.repeat)
+            size = os.path.getsize(outfile)
+            print(
+                f"{name:<18} {format_size(size):>9} {nbytes / size:>6.2f} "
+                + f"{format_size(nbytes / write_seconds):>9}/s "
+                + f"{format_size(nbytes / read_seconds):>9}/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,22 @@
 """ Init file for mdtf_test_data directory """
 
-from . import generators
-from . import synthetic
-from . import util
+import importlib
+
+# subpackages are imported on first access to keep startup fast
+_LAZY_MODULES = ["generators", "synthetic", "util"]
+_LAZY_ATTRS = {"generate_suite": "synthetic.suite"}
+
+__all__ = sorted(_LAZY_ATTRS) + _LAZY_MODULES
+
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        return importlib.import_module(f".{name}", __name__)
+    elif name in _LAZY_ATTRS:
+        module = importlib.import_module(f".{_LAZY_ATTRS[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
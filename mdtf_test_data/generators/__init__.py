@@ -1,8 +1,14 @@
+import inspect
+
 import numpy as np
 
 from .normal import normal
 from .convective import convective
 
+# synthetic data generators by the name used in the configuration files;
+# other names in this module, such as the helpers below, are not generators
+GENERATORS = {"normal": normal, "convective": convective}
+
 
 def generate_random_array(
     xyshape, ntimes, dtype="float32", generator=None, generator_kwargs=None
@@ -28,3 +34,43 @@ def generate_random_array(
     result = generator(xyshape, ntimes, **generator_kwargs)
 
     return np.array(result).astype(dtype)
+
+
+def supports_slabs(generator):
+    """Checks whether a generator can produce a range of time levels
+
+    Generators that accept a `tstart` argument return time levels
+    `tstart` to `tstart + ntimes - 1` of the full array, so a variable can
+    be generated in consecutive slabs with identical results.
+
+    Parameters
+    ----------
+    generator : function
+        Synthetic data generator
+
+    Returns
+    -------
+    bool
+        True if the generator accepts `tstart`
+    """
+    return "tstart" in inspect.signature(generator).parameters
+
+
+def supports_members(generator):
+    """Checks whether a generator can produce distinct ensemble members
+
+    Generators that accept a `member` argument draw each ensemble member
+    from its own deterministic seed stream; member 0 reproduces the
+    single-member output.
+
+    Parameters
+    ----------
+    generator : function
+        Synthetic data generator
+
+    Returns
+    -------
+    bool
+        True if the generator accepts `member`
+    """
+    return "member" in inspect.signature(generator).parameters
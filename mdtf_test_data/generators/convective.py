@@ -1,9 +1,9 @@
 import numpy as np
 
 
-def convective(xyshape, ntimes, varname="missing"):
+def convective(xyshape, ntimes, varname="missing", member=0):
 
-    np.random.seed(ntimes)
+    np.random.seed(ntimes if member == 0 else [ntimes, member])
 
     valid_varnames = ["tave", "qsat_int", "cwv", "pr"]
     assert (
@@ -1,11 +1,12 @@
 import numpy as np
 
 
-def normal(xyshape, ntimes, stats=None):
+def normal(xyshape, ntimes, stats=None, tstart=0, member=0):
     stats = (1.0, 1.0) if stats is None else stats
     stats = [stats] if not isinstance(stats, list) else stats
     data = []
-    for time in range(ntimes):
-        np.random.seed(time)
+    for time in range(tstart, tstart + ntimes):
+        # ensemble members other than the first get their own seed stream
+        np.random.seed(time if member == 0 else [time, member])
         data.append(np.array([np.random.normal(x[0], x[1], xyshape) for x in stats]))
     return data
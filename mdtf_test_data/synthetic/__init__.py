@@ -1,11 +1,39 @@
 """ Init file for generating synthetic datasets """
 
-from .synthetic_data import (
-    dataset_stats,
-    generate_synthetic_dataset,
-    write_to_netcdf,
-)
-
-from . import time
-from . import vertical
-from . import horizontal
+import importlib
+
+# public names and the modules that define them; modules are imported on
+# first access so that importing the package does not load xarray
+_LAZY_ATTRS = {
+    "combine_datasets": "synthetic_data",
+    "dataset_stats": "synthetic_data",
+    "generate_synthetic_dataset": "synthetic_data",
+    "generate_synthetic_slabs": "synthetic_data",
+    "round_trip_dataset": "synthetic_data",
+    "split_dataset": "synthetic_data",
+    "write_slabs_to_netcdf": "synthetic_data",
+    "write_to_netcdf": "synthetic_data",
+    "SyntheticContext": "context",
+    "get_context": "context",
+    "gather_wet_points": "gathering",
+    "scatter_wet_points": "gathering",
+    "VariableSpec": "variable_spec",
+    "compile_config": "variable_spec",
+    "generate_suite": "suite",
+}
+_LAZY_MODULES = ["time", "vertical", "horizontal"]
+
+__all__ = sorted(_LAZY_ATTRS) + _LAZY_MODULES
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        module = importlib.import_module(f".{_LAZY_ATTRS[name]}", __name__)
+        return getattr(module, name)
+    elif name in _LAZY_MODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
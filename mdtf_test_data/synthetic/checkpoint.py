@@ -0,0 +1,107 @@
+""" Partial output files and slab checkpoints for resumable generation """
+
+__all__ = [
+    "PARTIAL_SUFFIX",
+    "commit_partial",
+    "discard_partial",
+    "partial_path",
+    "read_checkpoint",
+    "write_checkpoint",
+]
+
+import json
+import os
+import shutil
+
+import netCDF4
+
+# files are written under this suffix and renamed once they are complete
+PARTIAL_SUFFIX = ".part"
+
+
+def partial_path(outfile):
+    """Returns the path a file or Zarr store is written to until complete"""
+    return f"{outfile}{PARTIAL_SUFFIX}"
+
+
+def _checkpoint_path(outfile):
+    return f"{partial_path(outfile)}.json"
+
+
+def _remove(path):
+    """Removes a file, link or directory if it exists"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def write_checkpoint(outfile, key, ntimes):
+    """Records the number of time levels complete in a partial NetCDF file
+
+    Parameters
+    ----------
+    outfile : str, path-like
+        Path to output file; the partial file is `partial_path(outfile)`
+    key : str
+        Identifies the inputs of the file, e.g. a hash of its manifest
+        record, so a checkpoint of other inputs is never resumed
+    ntimes : int
+        Number of time levels written and flushed to the partial file
+    """
+    path = _checkpoint_path(outfile)
+    with open(f"{path}.tmp", "w") as fhandle:
+        json.dump({"key": key, "ntimes": int(ntimes)}, fhandle)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_checkpoint(outfile, key):
+    """Returns the number of time levels a partial NetCDF file can resume from
+
+    Parameters
+    ----------
+    outfile : str, path-like
+        Path to output file
+    key : str
+        Inputs of the file, see `write_checkpoint`
+
+    Returns
+    -------
+    int
+        Time levels complete in the partial file; 0 if there is no
+        checkpoint, it was written for other inputs, or the partial file
+        can not be read
+    """
+    path = _checkpoint_path(outfile)
+    if not os.path.exists(path) or not os.path.exists(partial_path(outfile)):
+        return 0
+    try:
+        with open(path, "r") as fhandle:
+            checkpoint = json.load(fhandle)
+        with netCDF4.Dataset(partial_path(outfile), "r") as ncfile:
+            available = len(ncfile.dimensions["time"])
+    except (OSError, KeyError, ValueError):
+        # e.g. the process died while the file was being flushed
+        return 0
+    if checkpoint.get("key") != key or checkpoint.get("ntimes", 0) > available:
+        return 0
+    return int(checkpoint["ntimes"])
+
+
+def commit_partial(outfile):
+    """Renames a complete partial file or Zarr store to its final path
+
+    Any previous output at the final path is replaced, and the checkpoint
+    of the partial file is removed.
+    """
+    if os.path.isdir(partial_path(outfile)) or os.path.isdir(outfile):
+        # directories can not be replaced in a single rename
+        _remove(outfile)
+    os.replace(partial_path(outfile), outfile)
+    _remove(_checkpoint_path(outfile))
+
+
+def discard_partial(outfile):
+    """Removes the partial file or Zarr store of an output and its checkpoint"""
+    _remove(partial_path(outfile))
+    _remove(_checkpoint_path(outfile))
@@ -0,0 +1,438 @@
+""" Shared coordinate context for generating synthetic datasets """
+
+__all__ = ["SyntheticContext", "clear_caches", "get_context", "horizontal_grid"]
+
+import functools
+
+import numpy as np
+import xarray as xr
+
+from mdtf_test_data.synthetic.horizontal import construct_rect_grid
+from mdtf_test_data.synthetic.horizontal import construct_tripolar_grid
+from mdtf_test_data.synthetic.gathering import wet_point_index
+
+from mdtf_test_data.synthetic.time import generate_monthly_time_axis
+from mdtf_test_data.synthetic.time import generate_daily_time_axis
+from mdtf_test_data.synthetic.time import generate_hourly_time_axis
+
+from mdtf_test_data.synthetic.vertical import gfdl_plev19_vertical_coord
+from mdtf_test_data.synthetic.vertical import gfdl_vertical_coord
+from mdtf_test_data.synthetic.vertical import ncar_hybrid_coord
+from mdtf_test_data.synthetic.vertical import mom6_z_coord
+from mdtf_test_data.synthetic.vertical import cmip_vertical_coord
+
+# list dimension of variables compressed by gathering, see `gather_wet_points`
+GATHERED_DIM = "landpoint"
+
+# number of contexts, grids and time axes kept per process; a long-lived
+# service asked for many grids or periods would otherwise grow without bound
+CACHE_SIZE = 32
+
+CMIP_GLOBAL_ATTS = [
+    "external_variables",
+    "history",
+    "table_id",
+    "activity_id",
+    "branch_method",
+    "branch_time_in_child",
+    "branch_time_in_parent",
+    "comment",
+    "contact",
+    "Conventions",
+    "creation_date",
+    "data_specs_version",
+    "experiment",
+    "experiment_id",
+    "forcing_index",
+    "frequency",
+    "further_info_url",
+    "grid",
+    "grid_label",
+    "initialization_index",
+    "institution",
+    "institution_id",
+    "license",
+    "mip_era",
+    "nominal_resolution",
+    "parent_activity_id",
+    "parent_experiment_id",
+    "parent_mip_era",
+    "parent_source_id",
+    "parent_time_units",
+    "parent_variant_label",
+    "physics_index",
+    "product",
+    "realization_index",
+    "realm",
+    "source",
+    "source_id",
+    "source_type",
+    "sub_experiment",
+    "sub_experiment_id",
+    "title",
+    "tracking_id",
+    "variable_id",
+    "variant_info",
+    "references",
+    "variant_label",
+]
+
+
+class SyntheticContext(object):
+    """Prebuilt coordinates shared by all variables of a synthetic run
+
+    The horizontal grid, time axis and vertical coordinates are identical
+    for every variable of a given convention and frequency.  They are built
+    once here and assembled into template datasets, so that each variable
+    only needs its data array attached.
+
+    Parameters
+    ----------
+    fmt : str, optional
+        Modeling center format, either "cmip", "gfdl" or "ncar", "ncar" by default
+    timeres : str, optional
+        Time resolution, one of "mon", "day", "3hr" or "1hr", by default "mon"
+    grid : str, optional
+        Type of output grid, either "standard" or "tripolar",
+        by default "standard"
+    dlon : float, optional
+        Grid spacing in the x-dimension (longitude), by default 20.0
+    dlat : float, optional
+        Grid spacing in the y-dimension (latitude), by default 20.0
+    startyear : int, optional
+        Start year for requested time axis, by default 1
+    nyears : int, optional
+        Number of years in requested time axis, by default 1
+    """
+
+    def __init__(
+        self,
+        fmt="ncar",
+        timeres="mon",
+        grid="standard",
+        dlon=20.0,
+        dlat=20.0,
+        startyear=1,
+        nyears=1,
+    ):
+        assert grid in [
+            "tripolar",
+            "standard",
+        ], f"Unknown grid `{grid}` requested"
+
+        self.fmt = fmt
+        self.timeres = timeres
+        self.grid = grid
+        self.dlon = dlon
+        self.dlat = dlat
+        self.startyear = startyear
+        self.nyears = nyears
+
+        # set up the horizontal grid; the tripolar grid has a fixed resolution
+        res = (None, None) if grid == "tripolar" else (dlon, dlat)
+        dset = horizontal_grid(grid, fmt, *res)
+        if grid == "tripolar":
+            latvar = "nlat" if "nlat" in list(dset.variables) else "yh"
+            lonvar = "nlon" if "nlon" in list(dset.variables) else "xh"
+            self.xyshape = dset["mask"].shape
+            self.mask = dset["mask"].values
+            self.wet = dset["wet"]
+            self.wet_index = wet_point_index(self.wet)
+        else:
+            latvar = "lat"
+            lonvar = "lon"
+            self.xyshape = (len(dset["lat"]), len(dset["lon"]))
+            self.mask = None
+            self.wet = None
+            self.wet_index = None
+
+        self.grid_dset = dset
+        self.lat = dset[latvar]
+        self.lon = dset[lonvar]
+
+        self._time_dset = None
+        self._vertical = {}
+        self._templates = {}
+
+    @property
+    def time_dset(self):
+        """Dataset containing the time axis and its bounds"""
+        if self._time_dset is None:
+            self._time_dset = _time_axis(
+                self.timeres, self.startyear, self.nyears, self.fmt
+            )
+        return self._time_dset
+
+    @property
+    def time(self):
+        """Time coordinate DataArray"""
+        return self.template()["time"]
+
+    @property
+    def ntimes(self):
+        """Number of time levels in the time axis"""
+        return len(self.time_dset["time"])
+
+    def vertical_coord(self, nlev):
+        """Returns the vertical coordinate for a variable with `nlev` levels
+
+        Parameters
+        ----------
+        nlev : int
+            Number of vertical levels
+
+        Returns
+        -------
+        tuple
+            Dataset containing the vertical coordinate and the name of the
+            level dimension, or (None, None) for single-level variables
+        """
+        if nlev <= 1:
+            return (None, None)
+
+        key = nlev if self.fmt == "gfdl" else None
+        if key not in self._vertical:
+            if self.fmt == "ncar":
+                dset = ncar_hybrid_coord()
+                levname = "lev"
+            elif self.fmt == "gfdl":
+                if nlev == 19:
+                    dset = gfdl_plev19_vertical_coord()
+                    levname = "plev19"
+                else:
+                    dset = gfdl_vertical_coord()
+                    levname = "pfull"
+            elif self.fmt == "cmip":
+                if self.grid == "tripolar":
+                    dset = mom6_z_coord()
+                    levname = "lev"
+                else:
+                    dset = cmip_vertical_coord()
+                    levname = "plev"
+            else:
+                raise ValueError(f"Unknown model attribute format `{self.fmt}`")
+            self._vertical[key] = (dset, levname)
+
+        dset, levname = self._vertical[key]
+        if self.fmt == "cmip":
+            assert nlev == len(
+                dset[levname]
+            ), f" Length of stats {nlev} must match number of levels {len(dset[levname])}."
+
+        return (dset, levname)
+
+    def template(self, static=False, nlev=1):
+        """Returns a shell dataset with all coordinates for a variable
+
+        Templates are cached and should be treated as read-only; use
+        `dataset` to obtain a dataset containing a variable.
+
+        Parameters
+        ----------
+        static : bool, optional
+            Omit the time axis, by default False
+        nlev : int, optional
+            Number of vertical levels, by default 1
+
+        Returns
+        -------
+        xarray.Dataset
+            Dataset with coordinates and global attributes
+        """
+        ds_vert, levname = self.vertical_coord(nlev)
+        key = (static, levname)
+
+        if key not in self._templates:
+            dset = self.grid_dset
+            if static is False:
+                dset = self.time_dset.merge(dset)
+            if ds_vert is not None:
+                dset = dset.merge(ds_vert)
+
+            # the grid and time datasets are shared, so modify a copy
+            dset = dset.copy()
+            dset.attrs["convention"] = self.fmt
+
+            if self.fmt == "cmip":
+                if "bnds" in dset.variables:
+                    dset["bnds"].attrs = {"long_name": "vertex number"}
+                cmip_global_atts = {x: "" for x in CMIP_GLOBAL_ATTS}
+                dset.attrs = {**dset.attrs, **cmip_global_atts}
+
+            # remove unused fields
+            if self.grid == "tripolar":
+                dset = dset.drop_vars(["mask", "wet", "depth"])
+
+            self._templates[key] = dset
+
+        return self._templates[key]
+
+    def dataset(
+        self,
+        varname,
+        data,
+        attrs=None,
+        static=False,
+        coords=None,
+        compress=False,
+        tslice=None,
+    ):
+        """Assembles a dataset for a single variable
+
+        The data array is attached to a shallow copy of the cached template,
+        so no coordinate merging or index alignment takes place.
+
+        Parameters
+        ----------
+        varname : str
+            Variable name in output dataset
+        data : np.ndarray
+            Data array with dimensions ([time,] [lev,] y, x)
+        attrs : dict, optional
+            Variable attributes, by default None
+        static : bool, optional
+            Flag denoting if variable is static, by default False
+        coords : dict, optional
+            Scalar coordinate with `name`, `value` and `atts` keys,
+            by default None
+        compress : bool, optional
+            Store tripolar fields on wet points only using CF compression
+            by gathering, by default False
+        tslice : slice, optional
+            Range of time levels covered by `data` when writing a variable
+            in slabs, by default None (the full time axis)
+
+        Returns
+        -------
+        xarray.Dataset
+            Dataset of synthetic data
+        """
+        attrs = {} if attrs is None else attrs
+
+        ndims = 2 if static else 3
+        nlev = data.shape[-3] if len(data.shape) > ndims else 1
+
+        # land points are discarded when gathering, so masking is unnecessary;
+        # the wet points are taken before the data are converted or attached
+        compress = compress and self.grid == "tripolar"
+        if compress:
+            data = np.asarray(data)
+            data = data.reshape(data.shape[:-2] + (-1,))
+            data = np.take(data, self.wet_index, axis=-1)
+        elif self.mask is not None:
+            data = data * self.mask
+        data = np.array(data, dtype=np.float32)
+
+        template = self.template(static=static, nlev=nlev)
+        if tslice is not None:
+            template = template.isel(time=tslice)
+        _, levname = self.vertical_coord(nlev)
+
+        dims = (GATHERED_DIM,) if compress else (self.lat.name, self.lon.name)
+        dims = dims if levname is None else (levname,) + dims
+        dims = dims if static else ("time",) + dims
+
+        dset = template.copy(deep=False)
+        dset.attrs = dict(template.attrs)
+        dset[varname] = xr.Variable(dims, data, attrs=attrs)
+
+        if coords is not None:
+            dset[coords["name"]] = xr.DataArray(coords["value"], attrs=coords["atts"])
+            dset[varname].attrs = {**dset[varname].attrs, "coordinates": coords["name"]}
+
+        if compress:
+            dset[GATHERED_DIM] = xr.DataArray(
+                self.wet_index,
+                dims=(GATHERED_DIM,),
+                attrs={"compress": " ".join(self.wet.dims)},
+            )
+
+        return dset
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def horizontal_grid(grid, fmt, dlon, dlat):
+    """Returns a cached horizontal grid dataset
+
+    The dataset is shared by every caller in the process and must be
+    treated as read-only; see also `clear_caches`.
+
+    Parameters
+    ----------
+    grid : str
+        "standard" or "tripolar"
+    fmt : str
+        Output format, "ncar", "gfdl" or "cmip"
+    dlon, dlat : float
+        Grid spacing in degrees; None for the tripolar grid, whose
+        resolution is fixed
+
+    Returns
+    -------
+    xarray.Dataset
+        Grid coordinates, and the land mask and wet points of the
+        tripolar grid
+    """
+    if grid == "tripolar":
+        return construct_tripolar_grid(attr_fmt=fmt, retain_coords=True, add_attrs=True)
+    return construct_rect_grid(
+        dlon, dlat, add_attrs=True, attr_fmt=fmt, bounds=(fmt == "cmip")
+    )
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _time_axis(timeres, startyear, nyears, fmt):
+    """Returns a cached time axis dataset; treat as read-only"""
+    if timeres == "mon":
+        return generate_monthly_time_axis(startyear, nyears, timefmt=fmt)
+    elif timeres == "day":
+        return generate_daily_time_axis(startyear, nyears, timefmt=fmt)
+    elif timeres == "3hr":
+        return generate_hourly_time_axis(startyear, nyears, 3, timefmt=fmt)
+    elif timeres == "1hr":
+        return generate_hourly_time_axis(startyear, nyears, 1, timefmt=fmt)
+    else:
+        print(timeres)
+        raise ValueError("Unknown time resolution requested")
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def get_context(
+    fmt="ncar",
+    timeres="mon",
+    grid="standard",
+    dlon=20.0,
+    dlat=20.0,
+    startyear=1,
+    nyears=1,
+):
+    """Returns a cached SyntheticContext for the requested coordinates
+
+    Contexts are cached per process, so repeated requests for the same
+    convention, frequency and grid reuse the coordinates already built.
+    Horizontal grids and time axes are cached separately, so contexts that
+    differ only by grid share one time axis.  Each cache keeps the
+    CACHE_SIZE most recently used entries, see also `clear_caches`.
+    Arguments are the same as for `SyntheticContext`.
+
+    Returns
+    -------
+    SyntheticContext
+        Shared coordinate context
+    """
+    return SyntheticContext(
+        fmt=fmt,
+        timeres=timeres,
+        grid=grid,
+        dlon=dlon,
+        dlat=dlat,
+        startyear=startyear,
+        nyears=nyears,
+    )
+
+
+def clear_caches():
+    """Empties the caches of contexts, horizontal grids and time axes"""
+    get_context.cache_clear()
+    horizontal_grid.cache_clear()
+    _time_axis.cache_clear()
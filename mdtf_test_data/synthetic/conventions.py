@@ -0,0 +1,74 @@
+""" Output case names, data formats and frequencies of each convention """
+
+__all__ = ["CONVENTIONS", "config_file", "convention_grid", "resolve_conventions"]
+
+from mdtf_test_data.util.resources import resource_filename
+
+# output case name, data format and frequencies for each convention
+CONVENTIONS = {
+    "GFDL": {"casename": "GFDL.Synthetic", "fmt": "gfdl", "time_res": ["day"]},
+    "NCAR": {
+        "casename": "NCAR.Synthetic",
+        "fmt": "ncar",
+        "time_res": ["mon", "day", "3hr", "1hr"],
+    },
+    "CMIP": {"casename": "CMIP.Synthetic", "fmt": "cmip", "time_res": ["mon", "day"]},
+}
+
+
+def resolve_conventions(names):
+    """Returns the known conventions among a list of requested names
+
+    "all" selects every convention and "CESM" is an alias for "NCAR"; the
+    requested order is kept without repeats.
+
+    Parameters
+    ----------
+    names : str or list of str
+        Requested convention names
+
+    Returns
+    -------
+    list of str
+        Keys of `CONVENTIONS`
+    """
+    names = [names] if isinstance(names, str) else list(names)
+    conventions = list(CONVENTIONS.keys()) if "all" in names else []
+    for convention in names:
+        convention = "NCAR" if convention == "CESM" else convention
+        if convention in CONVENTIONS and convention not in conventions:
+            conventions.append(convention)
+    return conventions
+
+
+def config_file(convention, time_res):
+    """Returns the path to the packaged variable config of a convention
+
+    Parameters
+    ----------
+    convention : str
+        Key of `CONVENTIONS`
+    time_res : str
+        Output frequency, e.g. "mon"
+
+    Returns
+    -------
+    str
+        Path to the YAML config file
+    """
+    return resource_filename(f"config/{CONVENTIONS[convention]['fmt']}_{time_res}.yml")
+
+
+def convention_grid(convention, time_res, DLAT=20.0, DLON=20.0):
+    """Returns the grid spacing used for a convention and frequency
+
+    NCAR daily output is always generated on a 5-degree grid.
+
+    Returns
+    -------
+    tuple of float
+        Latitude and longitude spacing in degrees
+    """
+    if convention == "NCAR" and time_res == "day":
+        return (5.0, 5.0)
+    return (DLAT, DLON)
@@ -0,0 +1,121 @@
+""" Tools for CF compression by gathering of masked ocean fields """
+
+__all__ = ["gather_wet_points", "scatter_wet_points", "wet_point_index"]
+
+import numpy as np
+import xarray as xr
+
+
+def wet_point_index(wet):
+    """Returns the zero-based indices of the wet points in a flattened grid
+
+    Parameters
+    ----------
+    wet : xarray.DataArray
+        2-dimensional wet mask (1 for ocean, 0 for land)
+
+    Returns
+    -------
+    np.ndarray
+        Indices of the wet points, as stored in the list variable
+    """
+    return np.flatnonzero(np.asarray(wet.values).ravel() > 0.0).astype(np.intc)
+
+
+def gather_wet_points(dset, wet, varnames=None, index_name="landpoint"):
+    """Compresses masked variables onto the wet points of a grid
+
+    The horizontal dimensions of each variable are replaced by a single
+    list dimension following the CF "compression by gathering" convention.
+    The list variable holds the zero-based indices of the wet points in the
+    flattened horizontal grid and carries a `compress` attribute naming
+    the dimensions it replaces.
+
+    Parameters
+    ----------
+    dset : xarray.Dataset
+        Dataset containing the variables to compress
+    wet : xarray.DataArray
+        2-dimensional wet mask (1 for ocean, 0 for land) defining the
+        horizontal dimensions to gather
+    varnames : list of str, optional
+        Variables to compress. By default, every data variable whose
+        trailing dimensions match those of `wet`
+    index_name : str, optional
+        Name of the list dimension, by default "landpoint"
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset with gathered variables and the list variable
+    """
+
+    hdims = tuple(wet.dims)
+    assert len(hdims) == 2, "Wet mask must be 2-dimensional"
+
+    if varnames is None:
+        varnames = [x for x in dset.data_vars if tuple(dset[x].dims[-2:]) == hdims]
+
+    index = wet_point_index(wet)
+    npoints = wet.shape[0] * wet.shape[1]
+
+    dset_out = dset.copy()
+    dset_out[index_name] = xr.DataArray(
+        index,
+        dims=(index_name,),
+        attrs={"compress": " ".join(hdims)},
+    )
+
+    for var in varnames:
+        _da = dset[var]
+        assert (
+            tuple(_da.dims[-2:]) == hdims
+        ), f"Variable `{var}` does not end with dimensions {hdims}"
+        data = np.asarray(_da.values)
+        data = data.reshape(data.shape[:-2] + (npoints,))
+        data = np.take(data, index, axis=-1)
+        dset_out[var] = xr.DataArray(
+            data, dims=_da.dims[:-2] + (index_name,), attrs=_da.attrs
+        )
+        dset_out[var].encoding = _da.encoding
+
+    return dset_out
+
+
+def scatter_wet_points(dset, index_name="landpoint"):
+    """Restores gathered variables to their full horizontal grid
+
+    Land points are filled with NaN.  This is the inverse of
+    `gather_wet_points`.
+
+    Parameters
+    ----------
+    dset : xarray.Dataset
+        Dataset containing gathered variables and the list variable
+    index_name : str, optional
+        Name of the list dimension, by default "landpoint"
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset with uncompressed variables
+    """
+
+    hdims = tuple(dset[index_name].attrs["compress"].split())
+    hshape = tuple(dset.sizes[x] for x in hdims)
+    index = np.asarray(dset[index_name].values).astype(np.intp)
+
+    dset_out = dset.copy()
+    for var in list(dset.data_vars):
+        _da = dset[var]
+        if index_name not in _da.dims or var == index_name:
+            continue
+        data = np.asarray(_da.values)
+        full = np.full(
+            data.shape[:-1] + (hshape[0] * hshape[1],), np.nan, dtype=data.dtype
+        )
+        full[..., index] = data
+        full = full.reshape(data.shape[:-1] + hshape)
+        dset_out[var] = xr.DataArray(full, dims=_da.dims[:-1] + hdims, attrs=_da.attrs)
+
+    return dset_out.drop_vars(index_name)
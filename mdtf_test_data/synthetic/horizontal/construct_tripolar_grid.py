@@ -5,7 +5,8 @@ __all__ = ["construct_tripolar_grid"]
 
 import numpy as np
 import xarray as xr
-import pkg_resources as pkgr
+
+from mdtf_test_data.util.resources import resource_filename
 
 
 def construct_tripolar_grid(
@@ -30,8 +31,11 @@ def construct_tripolar_grid(
         Shell dataset with masked variable and ocean depth field
     """
 
-    ds_in = pkgr.resource_filename("mdtf_test_data", "resources/ocean_static_5deg.nc")
-    ds_in = xr.open_dataset(ds_in)
+    ds_in = resource_filename("resources/ocean_static_5deg.nc")
+    # read eagerly so the grid does not hold an open file handle, which
+    # would otherwise be shared with forked worker processes
+    with xr.open_dataset(ds_in) as _ds:
+        ds_in = _ds.load()
 
     # -- if CMIP format is requested, use CESM version as output
     attr_fmt = "ncar" if attr_fmt == "cmip" else attr_fmt
@@ -0,0 +1,331 @@
+""" Output manifest used to skip up-to-date files in incremental builds """
+
+__all__ = [
+    "ENCODING_ATTRS",
+    "MANIFEST_NAME",
+    "attribute_changes",
+    "code_files",
+    "code_version",
+    "exists",
+    "file_checksum",
+    "is_up_to_date",
+    "output_root",
+    "read_manifest",
+    "stable_hash",
+    "task_record",
+    "write_manifest",
+]
+
+import functools
+import glob
+import hashlib
+import json
+import os
+
+from .targets import filesystem
+from .targets import is_url
+
+MANIFEST_NAME = ".mdtf_manifest.json"
+MANIFEST_VERSION = 1
+
+# variable attributes that change how the data are encoded, so they can
+# not be patched into an existing file
+ENCODING_ATTRS = [
+    "_FillValue",
+    "add_offset",
+    "calendar",
+    "compress",
+    "coordinates",
+    "missing_value",
+    "scale_factor",
+]
+
+# modules and resources, relative to the package, that determine the
+# contents of the output files; run drivers such as the planner, the
+# service or the shards do not, so editing them keeps outputs up to date.
+# The packaged configurations are left out: each file's manifest entry
+# already records its own variable's configuration, see `task_record`
+CODE_PATTERNS = [
+    "generators/*.py",
+    "synthetic/context.py",
+    "synthetic/gathering.py",
+    "synthetic/synthetic_data.py",
+    "synthetic/synthetic_setup.py",
+    "synthetic/variable_spec.py",
+    "synthetic/zarr_output.py",
+    "synthetic/horizontal/*.py",
+    "synthetic/time/*.py",
+    "synthetic/vertical/*.py",
+    "resources/*",
+]
+
+
+def stable_hash(obj):
+    """Returns a stable hash of a JSON-serializable object"""
+    text = json.dumps(obj, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def code_files():
+    """Returns the package files that determine the contents of the outputs
+
+    Returns
+    -------
+    list of str
+        Sorted paths of the files matching `CODE_PATTERNS`
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return sorted(
+        set(
+            path
+            for pattern in CODE_PATTERNS
+            for path in glob.glob(os.path.join(root, pattern))
+        )
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """Returns a hash of the generator code and packaged resources
+
+    Any change to the modules that generate and write the data, the
+    generators or the packaged static files invalidates every manifest
+    entry, see `code_files`.
+
+    Returns
+    -------
+    str
+        Hex digest identifying the generator code version
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    files = code_files()
+    sha = hashlib.sha256()
+    for path in files:
+        sha.update(os.path.relpath(path, root).encode("utf-8"))
+        with open(path, "rb") as fhandle:
+            sha.update(fhandle.read())
+    return sha.hexdigest()
+
+
+def file_checksum(path, blocksize=1 << 20):
+    """Returns the SHA-256 checksum of a file or directory
+
+    Directories, such as Zarr stores, are hashed over the relative paths
+    and contents of the files they contain, in sorted order.
+
+    Parameters
+    ----------
+    path : str, path-like
+        Path to file or directory, or fsspec URL
+    blocksize : int, optional
+        Read size in bytes, by default 1 MiB
+
+    Returns
+    -------
+    str
+        Hex digest of the file contents
+    """
+    if is_url(path):
+        return _url_checksum(path, blocksize)
+
+    sha = hashlib.sha256()
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(root, x) for root, _, names in os.walk(path) for x in names
+        )
+    else:
+        files = [path]
+    for fname in files:
+        if fname != path:
+            sha.update(os.path.relpath(fname, path).encode("utf-8"))
+        with open(fname, "rb") as fhandle:
+            for block in iter(lambda: fhandle.read(blocksize), b""):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def _url_checksum(url, blocksize):
+    """Same as `file_checksum` for a file or directory at an fsspec URL"""
+    fs, path = filesystem(url)
+    files = sorted(fs.find(path)) if fs.isdir(path) else [path]
+    sha = hashlib.sha256()
+    for fname in files:
+        if fname != path:
+            sha.update(os.path.relpath(fname, path).encode("utf-8"))
+        with fs.open(fname, "rb") as fhandle:
+            for block in iter(lambda: fhandle.read(blocksize), b""):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def exists(path):
+    """Checks whether a local path or fsspec URL exists"""
+    if is_url(path):
+        fs, path = filesystem(path)
+        return fs.exists(path)
+    return os.path.exists(path)
+
+
+def task_record(spec, kwargs):
+    """Returns the manifest fields describing the inputs of a file
+
+    Parameters
+    ----------
+    spec : VariableSpec or tuple of VariableSpec
+        Variable description, or the group of variables in a shared file
+    kwargs : dict
+        Run parameters passed to `generate_variable`
+
+    Returns
+    -------
+    dict
+        Hashes of the variable's configuration block without its
+        attributes, the run parameters and the generator code version,
+        and the variable attributes themselves
+    """
+    specs = spec if isinstance(spec, tuple) else (spec,)
+    blocks = [{x: y for x, y in z.to_dict().items() if x != "attrs"} for z in specs]
+    # attributes are kept as JSON so they compare equal once read back
+    attrs = json.loads(json.dumps({x.name: x.attrs for x in specs}, default=str))
+    return {
+        "variable": [x.name for x in specs] if isinstance(spec, tuple) else spec.name,
+        "time_res": kwargs["TIME_RES"],
+        "spec": stable_hash(blocks if isinstance(spec, tuple) else blocks[0]),
+        "attrs": attrs,
+        "params": stable_hash(kwargs),
+        "code": code_version(),
+    }
+
+
+def read_manifest(out_dir_root):
+    """Reads the manifest of an output directory
+
+    Parameters
+    ----------
+    out_dir_root : str, path-like
+        Output root directory
+
+    Returns
+    -------
+    dict
+        Manifest entries keyed by path relative to the output root; empty
+        if there is no manifest or it was written by another version
+    """
+    path = os.path.join(out_dir_root, MANIFEST_NAME)
+    if not exists(path):
+        return {}
+    if is_url(path):
+        fs, path = filesystem(path)
+        manifest = json.loads(fs.cat_file(path))
+    else:
+        with open(path, "r") as fhandle:
+            manifest = json.load(fhandle)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest["files"]
+
+
+def write_manifest(out_dir_root, files):
+    """Atomically writes the manifest of an output directory
+
+    At an fsspec URL, the manifest is written as a single object.
+
+    Parameters
+    ----------
+    out_dir_root : str, path-like
+        Output root directory
+    files : dict
+        Manifest entries keyed by path relative to the output root
+    """
+    path = os.path.join(out_dir_root, MANIFEST_NAME)
+    manifest = {"version": MANIFEST_VERSION, "files": files}
+    if is_url(path):
+        fs, path = filesystem(path)
+        fs.pipe_file(path, json.dumps(manifest, indent=2, sort_keys=True).encode())
+        return
+    with open(f"{path}.tmp", "w") as fhandle:
+        json.dump(manifest, fhandle, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def output_root(outfile):
+    """Returns the output root directory, which holds the manifest, of a file"""
+    return os.path.dirname(os.path.dirname(outfile))
+
+
+def is_up_to_date(files, spec, outfile, kwargs):
+    """Checks whether an output file can be reused
+
+    Parameters
+    ----------
+    files : dict
+        Manifest entries of the file's output root
+    spec : VariableSpec or tuple of VariableSpec
+        Variable description, or the group of variables in a shared file
+    outfile : str, path-like
+        Path to output file
+    kwargs : dict
+        Run parameters passed to `generate_variable`
+
+    Returns
+    -------
+    bool
+        True if the file exists, its inputs are unchanged and its contents
+        match the recorded checksum
+    """
+    root = output_root(outfile)
+    entry = files.get(os.path.relpath(outfile, root))
+    if entry is None:
+        return False
+    record = task_record(spec, kwargs)
+    return (
+        all(entry.get(key) == value for key, value in record.items())
+        and exists(outfile)
+        and entry.get("checksum") == file_checksum(outfile)
+    )
+
+
+def attribute_changes(files, spec, outfile, kwargs):
+    """Lists the attribute edits that bring an output file up to date
+
+    A local NetCDF file whose manifest entry differs from its variables'
+    configuration only in their attributes can be patched in place
+    instead of being regenerated, unless an attribute that affects the
+    encoding of the data, see `ENCODING_ATTRS`, has changed.
+
+    Parameters are the same as for `is_up_to_date`.
+
+    Returns
+    -------
+    dict or None
+        Attributes to set and names of attributes to delete, as a tuple
+        (dict, list), keyed by variable name; None if the file can not be
+        patched
+    """
+    root = output_root(outfile)
+    entry = files.get(os.path.relpath(outfile, root))
+    if entry is None or is_url(outfile) or not str(outfile).endswith(".nc"):
+        return None
+    record = task_record(spec, kwargs)
+    if any(entry.get(x) != y for x, y in record.items() if x != "attrs"):
+        return None
+    old = entry.get("attrs", None)
+    if old is None or sorted(old) != sorted(record["attrs"]):
+        return None
+
+    specs = spec if isinstance(spec, tuple) else (spec,)
+    changes = {}
+    for var in specs:
+        before, after = old[var.name], record["attrs"][var.name]
+        edited = [x for x in set(before) | set(after) if before.get(x) != after.get(x)]
+        if len(edited) == 0:
+            continue
+        if len(set(edited) & set(ENCODING_ATTRS)) > 0:
+            return None
+        changes[var.name] = (
+            {x: y for x, y in var.attrs.items() if x in edited},
+            sorted(x for x in edited if x not in after),
+        )
+    if not (exists(outfile) and entry.get("checksum") == file_checksum(outfile)):
+        return None
+    return changes
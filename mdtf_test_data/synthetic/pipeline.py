@@ -0,0 +1,163 @@
+""" Bounded producer/consumer pipeline that overlaps generation and writing """
+
+__all__ = ["WritePipeline"]
+
+import multiprocessing
+import queue
+import traceback
+from collections.abc import Iterator
+
+from .manifest import file_checksum
+
+
+class _ProducerFailed(Exception):
+    """Raised in the writer when the producer stopped in the middle of a file"""
+
+
+def _stream(jobs):
+    """Yields the slabs of one file from the job queue until its end marker"""
+    while True:
+        kind, payload = jobs.get()
+        if kind == "end":
+            if not payload:
+                raise _ProducerFailed("producer stopped before the last slab")
+            return
+        yield payload
+
+
+def _writer_loop(jobs, results):
+    """Writes every file received on the job queue until a stop marker
+
+    For each file, the path and checksum of the written file, or the
+    formatted traceback of the failure, are sent back on the result queue.
+    """
+    while True:
+        message = jobs.get()
+        if message is None:
+            return
+        writer, data, outfile, kwargs = message
+        streamed = data is None
+        if streamed:
+            data = _stream(jobs)
+        try:
+            writer(data, outfile, **kwargs)
+            results.put((outfile, file_checksum(outfile), None))
+        except Exception:
+            results.put((outfile, None, traceback.format_exc()))
+        finally:
+            # keep the queue in step if the writer stopped early
+            if streamed:
+                try:
+                    for _ in data:
+                        pass
+                except _ProducerFailed:
+                    pass
+
+
+class WritePipeline(object):
+    """Writes files in a dedicated process while the caller generates data
+
+    Datasets and time slabs are passed to the writer process through a
+    queue holding at most `depth` items, so the caller can generate
+    variable N+1 (or slab k+1) while variable N (or slab k) is encoded and
+    flushed to disk, and blocks once `depth` items are waiting.  At most
+    `depth` queued items plus the one being written are held in memory in
+    addition to the one being generated.
+
+    Parameters
+    ----------
+    depth : int, optional
+        Maximum number of datasets or slabs waiting to be written,
+        by default 2
+    """
+
+    def __init__(self, depth=2):
+        assert depth >= 1, "Pipeline depth must be at least 1"
+        self.depth = depth
+        self.checksums = {}
+        self._jobs = multiprocessing.Queue(maxsize=depth)
+        self._results = multiprocessing.Queue()
+        self._submitted = 0
+        self._process = multiprocessing.Process(
+            target=_writer_loop, args=(self._jobs, self._results), daemon=True
+        )
+        self._process.start()
+
+    def _put(self, item):
+        """Adds an item to the job queue, failing if the writer has died"""
+        while True:
+            try:
+                return self._jobs.put(item, timeout=1.0)
+            except queue.Full:
+                self._check_alive()
+
+    def _check_alive(self):
+        if not self._process.is_alive():
+            raise RuntimeError(
+                f"Writer process exited with code {self._process.exitcode}"
+            )
+
+    def submit(self, writer, data, outfile, **kwargs):
+        """Queues a file to be written by the writer process
+
+        Parameters
+        ----------
+        writer : callable
+            Module-level function called as `writer(data, outfile, **kwargs)`
+            in the writer process, e.g. `write_to_netcdf`
+        data : xarray.Dataset, list or iterator of xarray.Dataset
+            Data to write; iterators, such as `generate_synthetic_slabs`,
+            are consumed here and sent one slab at a time
+        outfile : str, path-like
+            Path to output file
+        **kwargs
+            Extra arguments for the writer
+        """
+        self._submitted = self._submitted + 1
+        if not isinstance(data, Iterator):
+            self._put((writer, data, outfile, kwargs))
+            return
+
+        self._put((writer, None, outfile, kwargs))
+        complete = False
+        try:
+            for slab in data:
+                self._put(("slab", slab))
+            complete = True
+        finally:
+            self._put(("end", complete))
+
+    def close(self):
+        """Waits for every queued file to be written
+
+        Returns
+        -------
+        dict
+            Checksum of each written file, keyed by path
+        """
+        self._put(None)
+        errors = []
+        while len(self.checksums) + len(errors) < self._submitted:
+            try:
+                outfile, checksum, error = self._results.get(timeout=1.0)
+            except queue.Empty:
+                self._check_alive()
+                continue
+            if error is None:
+                self.checksums[outfile] = checksum
+            else:
+                errors.append(f"Failed to write {outfile}:\n{error}")
+        self._process.join()
+        if len(errors) > 0:
+            raise RuntimeError("\n".join(errors))
+        return self.checksums
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._process.terminate()
+            self._process.join()
@@ -0,0 +1,331 @@
+""" Dry-run planner estimating the cost of a synthetic data run """
+
+__all__ = [
+    "calibrate",
+    "check_budget",
+    "format_size",
+    "parse_size",
+    "plan_tasks",
+    "print_plan",
+    "task_shape",
+]
+
+import functools
+import os
+import tempfile
+import time
+
+import numpy as np
+import xarray as xr
+
+import mdtf_test_data.generators as generators
+from mdtf_test_data.synthetic.context import horizontal_grid
+from mdtf_test_data.synthetic.manifest import attribute_changes
+from mdtf_test_data.synthetic.manifest import is_up_to_date
+from mdtf_test_data.synthetic.manifest import output_root
+from mdtf_test_data.synthetic.manifest import read_manifest
+
+# number of time levels per year for each time resolution (noleap calendar)
+TIMES_PER_YEAR = {"mon": 12, "day": 365, "3hr": 365 * 8, "1hr": 365 * 24}
+
+# peak bytes held per output array element while generating and writing:
+# the generators build float64 intermediates that are converted to float32
+PEAK_BYTES_PER_ELEMENT = {"normal": 20, "convective": 48}
+DEFAULT_PEAK_BYTES_PER_ELEMENT = 48
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(size):
+    """Parses a human-readable size such as "512M" or "4G" into bytes
+
+    Parameters
+    ----------
+    size : str or int
+        Size in bytes, optionally with a K, M, G or T suffix
+
+    Returns
+    -------
+    int
+        Size in bytes
+    """
+    if size is None or isinstance(size, (int, float)):
+        return size
+    size = str(size).strip().upper().rstrip("B")
+    unit = size[-1] if size and size[-1] in SIZE_UNITS else ""
+    value = size[: -len(unit)] if unit else size
+    return int(float(value) * SIZE_UNITS[unit])
+
+
+def format_size(nbytes):
+    """Formats a number of bytes for display"""
+    for unit in ["B", "K", "M", "G"]:
+        if abs(nbytes) < 1024.0:
+            return f"{nbytes:.1f}{unit}"
+        nbytes = nbytes / 1024.0
+    return f"{nbytes:.1f}T"
+
+
+@functools.lru_cache(maxsize=None)
+def calibrate():
+    """Measures generation and write throughput on this machine
+
+    A small sample of each generator is timed, along with a NetCDF write
+    of the same size.  Results are cached for the life of the process.
+
+    Returns
+    -------
+    dict
+        Seconds per output element for each generator, and for writing
+        under the key "write"
+    """
+    xyshape = (90, 180)
+    ntimes = 24
+    nelem = xyshape[0] * xyshape[1] * ntimes
+
+    costs = {}
+    samples = {"normal": {"stats": [(1.0, 1.0)]}, "convective": {"varname": "pr"}}
+    for name, kwargs in samples.items():
+        start = time.perf_counter()
+        data = generators.generate_random_array(
+            xyshape,
+            ntimes,
+            generator=generators.GENERATORS[name],
+            generator_kwargs=kwargs,
+        )
+        costs[name] = (time.perf_counter() - start) / nelem
+
+    dset = xr.Dataset({"sample": (("time", "lat", "lon"), data.reshape(-1, *xyshape))})
+    with tempfile.TemporaryDirectory() as tmpdir:
+        start = time.perf_counter()
+        dset.to_netcdf(os.path.join(tmpdir, "sample.nc"))
+        costs["write"] = (time.perf_counter() - start) / nelem
+
+    return costs
+
+
+def task_shape(spec, kwargs):
+    """Returns the output array shape of a variable
+
+    Parameters
+    ----------
+    spec : VariableSpec
+        Variable description
+    kwargs : dict
+        Run parameters passed to `generate_variable`
+
+    Returns
+    -------
+    tuple of int
+        Shape of the variable in its output file, with time first
+    """
+    grid = spec.grid
+    if grid == "tripolar":
+        dset = horizontal_grid(grid, kwargs["DATA_FORMAT"], None, None)
+        if kwargs.get("COMPRESS", False):
+            hshape = (int((dset["wet"].values > 0.0).sum()),)
+        else:
+            hshape = dset["mask"].shape
+    else:
+        dset = horizontal_grid(
+            grid, kwargs["DATA_FORMAT"], kwargs["DLON"], kwargs["DLAT"]
+        )
+        hshape = (len(dset["lat"]), len(dset["lon"]))
+
+    vshape = (spec.nlev,) if spec.nlev > 1 else ()
+
+    if spec.static:
+        return vshape + hshape
+    ntimes = TIMES_PER_YEAR[kwargs["TIME_RES"]] * kwargs["NYEARS"]
+    return (ntimes,) + vshape + hshape
+
+
+def _estimate(spec, kwargs, costs, PIPELINE_DEPTH=None):
+    """Returns the shape, file size, peak memory and runtime of a variable"""
+    shape = task_shape(spec, kwargs)
+    nelem = int(np.prod(shape))
+    ntimes = shape[0] if not spec.static else 1
+    # data plus time axis, bounds and horizontal coordinates
+    storage = {**(kwargs.get("STORAGE", None) or {}), **(spec.encoding or {})}
+    itemsize = 2 if storage.get("packing", None) not in [None, "none"] else 4
+    nbytes = itemsize * nelem + 8 * 4 * ntimes + 8 * 4 * int(np.prod(shape[-2:]))
+    # only one slab is held in memory when writing in slabs
+    slab = kwargs.get("SLAB_SIZE", None)
+    if (
+        slab is not None
+        and not spec.static
+        and generators.supports_slabs(generators.GENERATORS[spec.generator])
+    ):
+        nresident = (nelem // ntimes) * min(slab, ntimes)
+    else:
+        nresident = nelem
+    peak = nresident * PEAK_BYTES_PER_ELEMENT.get(
+        spec.generator, DEFAULT_PEAK_BYTES_PER_ELEMENT
+    )
+    if PIPELINE_DEPTH is not None:
+        peak = peak + (PIPELINE_DEPTH + 1) * 4 * nresident
+    seconds = nelem * (costs.get(spec.generator, max(costs.values())) + costs["write"])
+
+    return (shape, nbytes, peak, seconds)
+
+
+def plan_tasks(tasks, FORCE=False, PIPELINE_DEPTH=None):
+    """Estimates file size, peak memory and runtime for each task
+
+    Nothing is generated; shapes are derived from the grid, the time axis
+    length and the number of levels in each variable's statistics.
+
+    Parameters
+    ----------
+    tasks : list of tuples
+        Tasks from `synthetic_tasks`
+    FORCE : bool, optional
+        Plan every file regardless of the output manifest, by default False
+    PIPELINE_DEPTH : int, optional
+        Depth of the write pipeline; the queued datasets or slabs and the
+        one in the writer process add to the peak memory, by default None
+
+    Returns
+    -------
+    list of dict
+        One entry per task with the output file, shape, uncompressed size
+        in bytes, peak memory in bytes, runtime in seconds, whether the
+        file is already up to date, and the attribute edits that would
+        bring it up to date, see `attribute_changes`
+    """
+    costs = calibrate()
+    manifests = {}
+
+    plan = []
+    for spec, outfile, kwargs in tasks:
+        root = output_root(outfile)
+        if root not in manifests:
+            manifests[root] = read_manifest(root)
+
+        if isinstance(spec, tuple):
+            # variables of a shared file are all held in memory together
+            whole = {x: y for x, y in kwargs.items() if x != "SLAB_SIZE"}
+            estimates = [_estimate(x, whole, costs, PIPELINE_DEPTH) for x in spec]
+            shape = max(estimates, key=lambda x: int(np.prod(x[0])))[0]
+            nbytes, peak, seconds = [sum(x[i] for x in estimates) for i in [1, 2, 3]]
+        elif "LINK_TO" in kwargs:
+            # hard links to the static fields of the first ensemble member
+            shape, nbytes, peak, seconds = task_shape(spec, kwargs), 0, 0, 0.0
+        else:
+            shape, nbytes, peak, seconds = _estimate(
+                spec, kwargs, costs, PIPELINE_DEPTH
+            )
+
+        up_to_date = not FORCE and is_up_to_date(manifests[root], spec, outfile, kwargs)
+        changes = None
+        if not (FORCE or up_to_date or "LINK_TO" in kwargs):
+            changes = attribute_changes(manifests[root], spec, outfile, kwargs)
+        if changes is not None:
+            # only the attribute headers are rewritten
+            nbytes, peak, seconds = 0, 0, 0.0
+
+        plan.append(
+            {
+                "outfile": outfile,
+                "shape": shape,
+                "nbytes": nbytes,
+                "peak_memory": peak,
+                "seconds": seconds,
+                "up_to_date": up_to_date,
+                "attribute_changes": changes,
+            }
+        )
+
+    return plan
+
+
+def _pending(plan):
+    return [x for x in plan if not x["up_to_date"]]
+
+
+def print_plan(plan, JOBS=1):
+    """Prints a table summarizing a plan
+
+    Parameters
+    ----------
+    plan : list of dict
+        Plan from `plan_tasks`
+    JOBS : int, optional
+        Number of worker processes, by default 1
+    """
+    width = max([len(x["outfile"]) for x in plan] + [4])
+    print(f"{'file':<{width}}  {'shape':<24} {'size':>9} {'memory':>9} {'time':>9}")
+    for entry in plan:
+        status = "  (up to date)" if entry["up_to_date"] else ""
+        print(
+            f"{entry['outfile']:<{width}}  {str(entry['shape']):<24} "
+            + f"{format_size(entry['nbytes']):>9} "
+            + f"{format_size(entry['peak_memory']):>9} "
+            + f"{entry['seconds']:>8.1f}s{status}"
+        )
+
+    pending = _pending(plan)
+    total_bytes = sum(x["nbytes"] for x in pending)
+    total_seconds = sum(x["seconds"] for x in pending)
+    peaks = sorted([x["peak_memory"] for x in pending], reverse=True)
+    print(
+        f"{len(pending)} of {len(plan)} files to generate: "
+        + f"{format_size(total_bytes)} on disk, "
+        + f"{format_size(sum(peaks[0:JOBS]))} peak memory with {JOBS} job(s), "
+        + f"~{total_seconds / max(1, min(JOBS, len(pending))):.1f}s"
+    )
+
+
+def check_budget(plan, max_memory=None, max_disk=None, JOBS=1):
+    """Checks a plan against memory and disk budgets
+
+    Parameters
+    ----------
+    plan : list of dict
+        Plan from `plan_tasks`
+    max_memory : int, optional
+        Memory budget in bytes, by default None (unlimited)
+    max_disk : int, optional
+        Disk budget in bytes, by default None (unlimited)
+    JOBS : int, optional
+        Requested number of worker processes, by default 1
+
+    Returns
+    -------
+    int
+        Number of worker processes that keeps the concurrent peak memory
+        within the budget
+
+    Raises
+    ------
+    ValueError
+        If the output exceeds the disk budget or a single file exceeds the
+        memory budget
+    """
+    pending = _pending(plan)
+
+    if max_disk is not None:
+        total = sum(x["nbytes"] for x in pending)
+        if total > max_disk:
+            raise ValueError(
+                f"Planned output of {format_size(total)} exceeds the disk "
+                + f"budget of {format_size(max_disk)}"
+            )
+
+    if max_memory is not None and len(pending) > 0:
+        over = [x["outfile"] for x in pending if x["peak_memory"] > max_memory]
+        if len(over) > 0:
+            raise ValueError(
+                f"Generating {', '.join(over)} exceeds the memory budget of "
+                + f"{format_size(max_memory)}"
+            )
+        # limit concurrency so the largest files fit side by side
+        peaks = sorted([x["peak_memory"] for x in pending], reverse=True)
+        jobs = JOBS
+        while jobs > 1 and sum(peaks[0:jobs]) > max_memory:
+            jobs = jobs - 1
+        if jobs < JOBS:
+            print(f"Reducing jobs from {JOBS} to {jobs} to fit the memory budget")
+        return jobs
+
+    return JOBS
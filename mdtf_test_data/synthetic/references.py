@@ -0,0 +1,524 @@
+""" Virtual Zarr reference files over generated NetCDF4 files
+
+A reference file, in the JSON format of kerchunk (version 1), holds the
+Zarr metadata of the variables of one or more NetCDF4 files and the byte
+range of each of their HDF5 chunks.  xarray opens it with the zarr engine
+through fsspec's reference file system, see `open_references`, and reads
+the chunks straight from the NetCDF files.  A multi-file archive then
+opens as one dataset from a single JSON file, without opening each file
+or scanning its metadata.
+"""
+
+__all__ = [
+    "INLINE_THRESHOLD",
+    "REFERENCE_MODES",
+    "combine_references",
+    "file_references",
+    "grid_signature",
+    "open_references",
+    "reference_path",
+    "write_output_references",
+    "write_references",
+]
+
+import base64
+import json
+import os
+import re
+import warnings
+
+import netCDF4
+import numpy as np
+import xarray as xr
+
+from .targets import is_url
+
+# h5py is only needed to locate the chunks of the files
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+# arrays up to this many bytes are stored in the reference file itself, so
+# coordinates are read without touching the NetCDF files
+INLINE_THRESHOLD = 512
+
+# HDF5 compression filters and the numcodecs codecs that decode them
+HDF5_CODECS = {1: "zlib", 307: "bz2", 32015: "zstd"}
+HDF5_SHUFFLE = 2
+
+# reference files per output file or split variable, or per output tree
+# and frequency
+REFERENCE_MODES = ["none", "variable", "tree"]
+
+# suffix of the pieces of a split variable, see `shards.piece_path`
+PIECE_PATTERN = re.compile(r"\.t\d+-\d+(\.nc)$")
+
+# coordinates whose dimensions and sizes identify the horizontal grid of a
+# file; a tree reference file covers the files of one grid
+GRID_COORDS = ["lat", "lon"]
+
+
+def _json_value(value):
+    """Converts a NetCDF attribute value to a JSON-serializable value"""
+    if isinstance(value, np.ndarray):
+        return [_json_value(x) for x in value.tolist()]
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
+
+def _fill_value(value):
+    """Encodes a fill value as in Zarr v2 array metadata"""
+    if value is None:
+        return None
+    value = _json_value(value)
+    if isinstance(value, float) and not np.isfinite(value):
+        return "NaN" if np.isnan(value) else ("Infinity" if value > 0 else "-Infinity")
+    return value
+
+
+def _inline(values):
+    """Returns the inline reference of the raw contents of an array"""
+    data = np.ascontiguousarray(values).tobytes()
+    return "base64:" + base64.b64encode(data).decode("ascii")
+
+
+def _codecs(dset, name):
+    """Returns the Zarr v2 filters and compressor matching an HDF5 filter pipeline"""
+    plist = dset.id.get_create_plist()
+    filters, compressor = None, None
+    for number in range(plist.get_nfilters()):
+        code, _, values, label = plist.get_filter(number)
+        if code == HDF5_SHUFFLE and filters is None and compressor is None:
+            filters = [{"id": "shuffle", "elementsize": dset.dtype.itemsize}]
+        elif code in HDF5_CODECS and compressor is None:
+            compressor = {"id": HDF5_CODECS[code]}
+            if len(values) > 0:
+                compressor["level"] = int(values[0])
+        else:
+            raise ValueError(f"HDF5 filter `{label}` of `{name}` has no Zarr codec")
+    return filters, compressor
+
+
+def _chunk_refs(dset, url):
+    """Returns the byte ranges of the stored chunks of a chunked dataset"""
+    refs = {}
+
+    def add(info):
+        if info.filter_mask != 0:
+            raise ValueError(f"A chunk of `{dset.name}` skips some of its filters")
+        key = ".".join(str(x // y) for x, y in zip(info.chunk_offset, dset.chunks))
+        refs[key] = [url, int(info.byte_offset), int(info.size)]
+
+    try:
+        dset.id.chunk_iter(add)
+    except (AttributeError, NotImplementedError):
+        # HDF5 before 1.12.3 has no chunk iterator
+        for number in range(dset.id.get_num_chunks()):
+            add(dset.id.get_chunk_info(number))
+    return refs
+
+
+def _consolidate(refs):
+    """Adds consolidated metadata, so the references open with a single read"""
+    metadata = {
+        x: json.loads(y)
+        for x, y in refs.items()
+        if x.split("/")[-1] in [".zgroup", ".zattrs", ".zarray"]
+    }
+    refs[".zmetadata"] = json.dumps(
+        {"zarr_consolidated_format": 1, "metadata": metadata}
+    )
+    return refs
+
+
+def file_references(path, INLINE_DIM=None):
+    """Builds the references of every variable of a NetCDF4 file
+
+    Arrays of at most INLINE_THRESHOLD bytes, and arrays stored in the
+    object header, are inlined; the chunks of other arrays are referenced
+    by file path, byte offset and size.
+
+    Parameters
+    ----------
+    path : str, path-like
+        Local NetCDF4 file
+    INLINE_DIM : str, optional
+        Also inline the arrays along this dimension that hold at most
+        INLINE_THRESHOLD bytes per index, e.g. the time coordinate and
+        bounds of the pieces of a split variable, whose chunks need not
+        line up with the pieces.  By default None
+
+    Returns
+    -------
+    dict
+        References in the kerchunk version 1 format
+
+    Raises
+    ------
+    ValueError
+        If the file is not a NetCDF4 file, or a variable uses an HDF5
+        filter that has no Zarr codec
+    """
+    if h5py is None:
+        raise ImportError("Please install `h5py` to write reference files")
+    path = os.path.abspath(path)
+    if not h5py.is_hdf5(path):
+        raise ValueError(f"{path} is not a NetCDF4 file")
+
+    refs = {".zgroup": json.dumps({"zarr_format": 2})}
+    with netCDF4.Dataset(path, "r") as ncfile, h5py.File(path, "r") as h5file:
+        refs[".zattrs"] = json.dumps(
+            {x: _json_value(ncfile.getncattr(x)) for x in ncfile.ncattrs()}
+        )
+        for name, var in ncfile.variables.items():
+            dset = h5file[name]
+            attrs = {
+                x: _json_value(var.getncattr(x))
+                for x in var.ncattrs()
+                if x != "_FillValue"
+            }
+            attrs["_ARRAY_DIMENSIONS"] = list(var.dimensions)
+            fill = (
+                var.getncattr("_FillValue") if "_FillValue" in var.ncattrs() else None
+            )
+            layout = dset.id.get_create_plist().get_layout()
+
+            inline = layout == h5py.h5d.COMPACT or dset.nbytes <= INLINE_THRESHOLD
+            if INLINE_DIM in var.dimensions:
+                size = max(var.shape[var.dimensions.index(INLINE_DIM)], 1)
+                inline = inline or dset.nbytes // size <= INLINE_THRESHOLD
+            if inline:
+                values = np.asarray(dset[()])
+                filters, compressor = None, None
+                chunks = list(dset.shape)
+                data = {".".join(["0"] * max(len(chunks), 1)): _inline(values)}
+                dtype = values.dtype.str
+            else:
+                filters, compressor = _codecs(dset, name)
+                dtype = dset.dtype.str
+                if layout == h5py.h5d.CHUNKED:
+                    chunks = list(dset.chunks)
+                    data = _chunk_refs(dset, path)
+                else:
+                    chunks = list(dset.shape)
+                    offset = dset.id.get_offset()
+                    # unallocated arrays are read as their fill value
+                    data = {}
+                    if offset is not None:
+                        key = ".".join(["0"] * max(len(chunks), 1))
+                        data[key] = [path, int(offset), int(dset.id.get_storage_size())]
+
+            refs[f"{name}/.zarray"] = json.dumps(
+                {
+                    "chunks": chunks,
+                    "compressor": compressor,
+                    "dtype": dtype,
+                    "fill_value": _fill_value(fill),
+                    "filters": filters,
+                    "order": "C",
+                    "shape": list(dset.shape),
+                    "zarr_format": 2,
+                }
+            )
+            refs[f"{name}/.zattrs"] = json.dumps(attrs)
+            for key, value in data.items():
+                refs[f"{name}/{key}"] = value
+
+    return {"version": 1, "refs": _consolidate(refs)}
+
+
+def _variables(refs):
+    """Returns the Zarr metadata and chunk references of each variable"""
+    result = {}
+    for key, value in refs.items():
+        name, _, item = key.rpartition("/")
+        if name == "":
+            continue
+        entry = result.setdefault(name, {"chunks": {}})
+        if item == ".zarray":
+            entry["zarray"] = json.loads(value)
+        elif item == ".zattrs":
+            entry["zattrs"] = json.loads(value)
+        else:
+            entry["chunks"][item] = value
+    return result
+
+
+def _concat_inline(pieces, axis):
+    """Concatenates variables held in single inline chunks along an axis"""
+    arrays = []
+    for piece in pieces:
+        data = base64.b64decode(list(piece["chunks"].values())[0][len("base64:") :])
+        dtype = np.dtype(piece["zarray"]["dtype"])
+        arrays.append(np.frombuffer(data, dtype).reshape(piece["zarray"]["shape"]))
+    values = np.concatenate(arrays, axis=axis)
+    zarray = dict(pieces[0]["zarray"], shape=list(values.shape))
+    zarray["chunks"] = list(values.shape)
+    return zarray, {".".join(["0"] * values.ndim): _inline(values)}
+
+
+def _concat_chunks(name, pieces, axis):
+    """Concatenates the chunk references of a variable's pieces along an axis"""
+    zarray = dict(pieces[0]["zarray"])
+    size = zarray["chunks"][axis]
+    chunks = {}
+    offset = 0
+    for number, piece in enumerate(pieces):
+        other = piece["zarray"]
+        if (
+            other["chunks"] != zarray["chunks"]
+            or other["dtype"] != zarray["dtype"]
+            or [x for i, x in enumerate(other["shape"]) if i != axis]
+            != [x for i, x in enumerate(zarray["shape"]) if i != axis]
+        ):
+            raise ValueError(f"The pieces of `{name}` have different layouts")
+        if offset % size != 0:
+            raise ValueError(
+                f"The pieces of `{name}` do not start on a chunk boundary "
+                + f"of {size} time levels"
+            )
+        for key, value in piece["chunks"].items():
+            index = [int(x) for x in key.split(".")]
+            index[axis] = index[axis] + offset // size
+            chunks[".".join(str(x) for x in index)] = value
+        offset = offset + other["shape"][axis]
+    zarray["shape"] = list(zarray["shape"])
+    zarray["shape"][axis] = offset
+    return zarray, chunks
+
+
+def combine_references(references, concat_dim="time"):
+    """Combines the references of several files into one dataset
+
+    Variables with the concatenation dimension are concatenated in the
+    order of the references, e.g. the time pieces of a split variable.
+    Other variables appear once, and must have the same shape, type and
+    attributes wherever they appear, e.g. the coordinates shared by the
+    files of several variables.  Without a concatenation dimension the
+    references are only merged.
+
+    Parameters
+    ----------
+    references : list of dict
+        References from `file_references`
+    concat_dim : str, optional
+        Dimension to concatenate along, or None, by default "time"
+
+    Returns
+    -------
+    dict
+        Combined references in the kerchunk version 1 format
+
+    Raises
+    ------
+    ValueError
+        If a shared variable differs between references, or the chunks of
+        a variable's pieces can not be laid end to end
+    """
+    variables = {}
+    for refs in references:
+        for name, entry in _variables(refs["refs"]).items():
+            variables.setdefault(name, []).append(entry)
+
+    combined = {
+        ".zgroup": references[0]["refs"][".zgroup"],
+        ".zattrs": references[0]["refs"][".zattrs"],
+    }
+    for name, pieces in variables.items():
+        dims = pieces[0]["zattrs"]["_ARRAY_DIMENSIONS"]
+        if concat_dim is not None and concat_dim in dims and len(pieces) > 1:
+            axis = dims.index(concat_dim)
+            single = all(
+                len(x["chunks"]) == 1
+                and isinstance(list(x["chunks"].values())[0], str)
+                and x["zarray"]["compressor"] is None
+                and x["zarray"]["filters"] is None
+                for x in pieces
+            )
+            if single:
+                zarray, chunks = _concat_inline(pieces, axis)
+            else:
+                zarray, chunks = _concat_chunks(name, pieces, axis)
+        else:
+            for other in pieces[1:]:
+                if (
+                    other["zattrs"] != pieces[0]["zattrs"]
+                    or other["zarray"]["shape"] != pieces[0]["zarray"]["shape"]
+                    or other["zarray"]["dtype"] != pieces[0]["zarray"]["dtype"]
+                ):
+                    raise ValueError(f"Variable `{name}` differs between the files")
+            zarray, chunks = pieces[0]["zarray"], pieces[0]["chunks"]
+        combined[f"{name}/.zarray"] = json.dumps(zarray)
+        combined[f"{name}/.zattrs"] = json.dumps(pieces[0]["zattrs"])
+        for key, value in chunks.items():
+            combined[f"{name}/{key}"] = value
+
+    return {"version": 1, "refs": _consolidate(combined)}
+
+
+def write_references(files, reffile):
+    """Writes the reference file of one or more NetCDF4 files
+
+    The pieces of a split variable, see `shards.piece_path`, are
+    concatenated along time in the order given, and the variables of all
+    other files are merged into the same dataset.
+
+    Parameters
+    ----------
+    files : list of str
+        NetCDF4 files
+    reffile : str, path-like
+        Path of the JSON reference file
+
+    Returns
+    -------
+    str
+        Path of the reference file
+    """
+    variables = {}
+    for path in files:
+        variables.setdefault(PIECE_PATTERN.sub(r"\1", str(path)), []).append(path)
+    references = []
+    for pieces in variables.values():
+        if len(pieces) > 1:
+            refs = [file_references(x, INLINE_DIM="time") for x in pieces]
+            refs = [combine_references(refs, concat_dim="time")]
+        else:
+            refs = [file_references(pieces[0])]
+        references.extend(refs)
+    if len(references) > 1:
+        references = [combine_references(references, concat_dim=None)]
+    with open(f"{reffile}.tmp", "w") as fhandle:
+        json.dump(references[0], fhandle)
+    os.replace(f"{reffile}.tmp", reffile)
+    return str(reffile)
+
+
+def grid_signature(path):
+    """Returns the dimensions and sizes of the horizontal coordinates of a file
+
+    Parameters
+    ----------
+    path : str, path-like
+        NetCDF file
+
+    Returns
+    -------
+    tuple of tuple
+        (dimension, size) of each dimension of the GRID_COORDS variables,
+        in order of appearance, e.g. (("lat", 9), ("lon", 18)) for a
+        regular grid and (("nlat", 576), ("nlon", 720)) for the tripolar
+        grid
+    """
+    signature = []
+    with netCDF4.Dataset(path, "r") as ncfile:
+        for name in GRID_COORDS:
+            if name not in ncfile.variables:
+                continue
+            var = ncfile.variables[name]
+            for dim, size in zip(var.dimensions, var.shape):
+                if (dim, size) not in signature:
+                    signature.append((dim, size))
+    return tuple(signature)
+
+
+def reference_path(files, MODE="variable", GRID=None):
+    """Returns the reference file path of a group of output files
+
+    With MODE "variable", the files are one output file or the pieces of
+    one split variable, referenced by `<file>.json`.  With MODE "tree",
+    they are the files of one frequency directory, referenced by
+    `<case>.<frequency>.json` in that directory, or by
+    `<case>.<frequency>.<grid>.json` when GRID, a `grid_signature`, is
+    given, e.g. `<case>.mon.nlat576-nlon720.json`.
+    """
+    if MODE == "tree":
+        directory = os.path.dirname(files[0])
+        case = os.path.basename(os.path.dirname(directory))
+        name = f"{case}.{os.path.basename(directory)}"
+        if GRID is not None:
+            name = name + "." + "-".join(f"{x}{y}" for x, y in GRID)
+        return os.path.join(directory, f"{name}.json")
+    return PIECE_PATTERN.sub(r"\1", files[0])[: -len(".nc")] + ".json"
+
+
+def write_output_references(files, MODE="variable"):
+    """Writes the reference files of the outputs of a run
+
+    Zarr stores, files at fsspec URLs and files that are not NetCDF4 are
+    skipped, and groups of files that can not be combined are skipped with
+    a warning.
+
+    Parameters
+    ----------
+    files : list of str
+        Output files of a run, e.g. from `run_tasks`, including the pieces
+        of split variables, see `finalize_work_plan`
+    MODE : str, optional
+        One of REFERENCE_MODES: "variable" for one reference file per
+        output file or split variable, "tree" for one per output directory
+        and horizontal grid, see `grid_signature`, by default "variable"
+
+    Returns
+    -------
+    list of str
+        Paths of the reference files written
+    """
+    assert MODE in REFERENCE_MODES, f"Unknown reference mode `{MODE}`"
+    if MODE == "none":
+        return []
+
+    groups = {}
+    for path in sorted(files):
+        if is_url(path) or not str(path).endswith(".nc") or not os.path.isfile(path):
+            continue
+        if MODE == "tree":
+            key = (os.path.dirname(path), grid_signature(path))
+        else:
+            key = (PIECE_PATTERN.sub(r"\1", path), None)
+        groups.setdefault(key, []).append(path)
+
+    # directories holding more than one grid get one reference file per grid
+    grids = {}
+    for directory, grid in groups:
+        grids.setdefault(directory, []).append(grid)
+
+    written = []
+    for (directory, grid), group in groups.items():
+        grid = grid if len(grids[directory]) > 1 else None
+        reffile = reference_path(group, MODE=MODE, GRID=grid)
+        try:
+            written.append(write_references(group, reffile))
+        except ValueError as exc:
+            warnings.warn(f"No reference file {reffile}: {exc}")
+    return written
+
+
+def open_references(reffile, **kwargs):
+    """Opens a reference file as an xarray dataset
+
+    Parameters
+    ----------
+    reffile : str, path-like
+        Path of the JSON reference file
+    kwargs
+        Passed to `xarray.open_dataset`
+
+    Returns
+    -------
+    xarray.Dataset
+        Lazily loaded dataset
+    """
+    return xr.open_dataset(
+        "reference://",
+        engine="zarr",
+        backend_kwargs={
+            "consolidated": True,
+            "storage_options": {"fo": str(reffile), "remote_protocol": "file"},
+        },
+        **kwargs,
+    )
@@ -0,0 +1,379 @@
+""" Local generation service that keeps imports and caches warm between requests
+
+The service answers HTTP requests on a TCP port or a Unix socket:
+
+``GET /status``
+    Number of worker processes, requests served and compiled configurations
+``POST /generate``
+    Writes files under an output directory and returns their paths
+``POST /netcdf``
+    Returns a single variable as NetCDF file contents, nothing is written
+
+The body of a POST request is a JSON object with the keys
+
+``convention`` (required), ``frequencies``, ``variables``, ``startyear``,
+``nyears``, ``dlat``, ``dlon``, ``compress``, ``storage``,
+``output`` (required by ``/generate``) and ``force``.
+
+The generators and their cached grids, time axes and static fields are
+loaded once, so a request only pays for generating and writing its data.
+"""
+
+__all__ = ["SyntheticService", "make_server", "serve"]
+
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from .conventions import CONVENTIONS
+from .conventions import config_file
+from .conventions import convention_grid
+from .conventions import resolve_conventions
+from .synthetic_data import apply_encoding
+from .synthetic_data import netcdf_engine
+from .synthetic_data import netcdf_in_memory
+from .synthetic_setup import build_variable
+from .synthetic_setup import link_static_duplicates
+from .synthetic_setup import quantize_storage
+from .synthetic_setup import run_tasks
+from .synthetic_setup import synthetic_tasks
+from .variable_spec import compile_config
+
+UNIX_PREFIX = "unix:"
+
+# longest period a request may ask for, so one request cannot hold the
+# service for hours
+MAX_NYEARS = 100
+
+
+def netcdf_bytes(spec, **kwargs):
+    """Generates a variable and returns the contents of its NetCDF file
+
+    Parameters
+    ----------
+    spec : VariableSpec
+        Variable description
+    kwargs
+        Parameters of `build_variable`
+
+    Returns
+    -------
+    bytes
+        File contents, encoded as by `write_to_netcdf`
+    """
+    storage = {**(kwargs.get("STORAGE", None) or {}), **(spec.encoding or {})}
+    storage = quantize_storage(spec, storage)
+    dset_out, packing = build_variable(spec, **kwargs)
+    apply_encoding(dset_out, storage=storage, packing=packing)
+    ncfile = netcdf_in_memory(dset_out, fmt=netcdf_engine(storage)[1])
+    return bytes(ncfile.close())
+
+
+class SyntheticService(object):
+    """Generates synthetic data on request, reusing caches across requests
+
+    Parameters
+    ----------
+    JOBS : int, optional
+        Number of worker processes, by default 1.  With one job data is
+        generated in this process, one request at a time, since the
+        generators seed numpy's global random state.  With more jobs the
+        requests are spread over a pool of processes that live as long as
+        the service, so their caches stay warm too.
+    """
+
+    def __init__(self, JOBS=1):
+        assert JOBS >= 1, "Error: number of jobs must be at least 1"
+        self.jobs = JOBS
+        self.requests = 0
+        self._executor = ProcessPoolExecutor(max_workers=JOBS) if JOBS > 1 else None
+        self._configs = {}
+        self._lock = threading.Lock()
+        self._generate_lock = threading.Lock()
+        self._output_locks = {}
+
+    def config(self, convention, frequency):
+        """Returns the compiled variable specs of a convention and frequency"""
+        key = (convention, frequency)
+        with self._lock:
+            if key not in self._configs:
+                self._configs[key] = compile_config(config_file(convention, frequency))
+            return self._configs[key]
+
+    def warm(self):
+        """Compiles the configuration of every convention and frequency"""
+        for convention, settings in CONVENTIONS.items():
+            for frequency in settings["time_res"]:
+                self.config(convention, frequency)
+
+    def status(self):
+        """Returns a summary of the service state"""
+        with self._lock:
+            return {
+                "jobs": self.jobs,
+                "requests": self.requests,
+                "configs": sorted("/".join(key) for key in self._configs),
+            }
+
+    def _output_lock(self, output):
+        """Returns the lock serializing requests that write to one directory"""
+        key = os.path.abspath(output)
+        with self._lock:
+            return self._output_locks.setdefault(key, threading.Lock())
+
+    def _variables(self, request):
+        """Resolves a request into (specs, kwargs, casename), one per frequency"""
+        assert "convention" in request, "Request has no `convention`"
+        conventions = resolve_conventions(request["convention"])
+        assert len(conventions) == 1, f"Unknown convention `{request['convention']}`"
+        convention = conventions[0]
+        settings = CONVENTIONS[convention]
+
+        frequencies = request.get("frequencies", settings["time_res"])
+        if isinstance(frequencies, str):
+            frequencies = [frequencies]
+        for frequency in frequencies:
+            assert (
+                frequency in settings["time_res"]
+            ), f"No `{frequency}` configuration for convention `{convention}`"
+        variables = request.get("variables", None)
+        if isinstance(variables, str):
+            variables = [variables]
+
+        # same ranges as the command line
+        dlat = float(request.get("dlat", 20.0))
+        dlon = float(request.get("dlon", 20.0))
+        startyear = int(request.get("startyear", 1))
+        nyears = int(request.get("nyears", 1))
+        assert 0.5 <= dlat <= 30.0, "dlat value is invalid; valid range is [0.5 30.0]"
+        assert 0.5 <= dlon <= 60.0, "dlon value is invalid; valid range is [0.5 60.0]"
+        assert startyear >= 1, "startyear must be at least 1"
+        assert (
+            1 <= nyears <= MAX_NYEARS
+        ), f"nyears value is invalid; valid range is [1 {MAX_NYEARS}]"
+
+        with self._lock:
+            self.requests += 1
+
+        result = []
+        for frequency in frequencies:
+            grid_dlat, grid_dlon = convention_grid(
+                convention, frequency, DLAT=dlat, DLON=dlon
+            )
+            kwargs = dict(
+                DLAT=grid_dlat,
+                DLON=grid_dlon,
+                STARTYEAR=startyear,
+                NYEARS=nyears,
+                TIME_RES=frequency,
+                DATA_FORMAT=settings["fmt"],
+                COMPRESS=bool(request.get("compress", False)),
+                STORAGE=request.get("storage", None),
+            )
+            specs = [
+                spec
+                for spec in self.config(convention, frequency)
+                if variables is None or spec.name in variables
+            ]
+            result.append((specs, kwargs, settings["casename"]))
+
+        found = set(spec.name for specs, _, _ in result for spec in specs)
+        missing = sorted(set(variables or []) - found)
+        assert len(missing) == 0, f"Unknown variables {missing} for `{convention}`"
+        return result
+
+    def generate(self, request):
+        """Writes the requested variables under `request["output"]`
+
+        Files already up to date in the output manifest are not written
+        again unless the request sets `force`.  A request names only some
+        of the variables, so the files of other requests are kept.
+
+        Returns
+        -------
+        list of str
+            Paths of the requested files
+        """
+        assert "output" in request, "Request has no `output` directory"
+        output = request["output"]
+        tasks = []
+        for specs, kwargs, casename in self._variables(request):
+            tasks += synthetic_tasks(
+                specs,
+                CASENAME=casename,
+                OUTPUT_URL=output,
+                **kwargs,
+            )
+        tasks = link_static_duplicates(tasks)
+
+        force = bool(request.get("force", False))
+        with self._output_lock(output):
+            if self._executor is not None:
+                run_tasks(tasks, FORCE=force, EXECUTOR=self._executor, PRUNE=False)
+            else:
+                with self._generate_lock:
+                    run_tasks(tasks, FORCE=force, PRUNE=False)
+        return [outfile for _, outfile, _ in tasks]
+
+    def netcdf(self, request):
+        """Returns the NetCDF file contents of a single requested variable"""
+        variables = [
+            (spec, kwargs)
+            for specs, kwargs, _ in self._variables(request)
+            for spec in specs
+        ]
+        assert len(variables) == 1, "Request one variable at one frequency"
+        spec, kwargs = variables[0]
+        if self._executor is not None:
+            return self._executor.submit(netcdf_bytes, spec, **kwargs).result()
+        with self._generate_lock:
+            return netcdf_bytes(spec, **kwargs)
+
+    def close(self):
+        """Stops the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Routes HTTP requests to the service of the server"""
+
+    server_version = "mdtf_synthetic"
+
+    def _reply(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self._reply(200, self.server.service.status())
+        else:
+            self._reply(404, {"error": f"Unknown path `{self.path}`"})
+
+    def do_POST(self):
+        service = self.server.service
+        if self.path not in ["/generate", "/netcdf"]:
+            self._reply(404, {"error": f"Unknown path `{self.path}`"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            assert isinstance(request, dict), "Request body must be a JSON object"
+            if self.path == "/generate":
+                self._reply(200, {"files": service.generate(request)})
+            else:
+                self._reply(200, service.netcdf(request), "application/x-netcdf")
+        except (AssertionError, KeyError, TypeError, ValueError) as exc:
+            self._reply(400, {"error": str(exc)})
+        except Exception:
+            self._reply(500, {"error": traceback.format_exc()})
+
+    def address_string(self):
+        # clients of a Unix socket have no address
+        return str(self.client_address[0]) if self.client_address else "local"
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _remove_stale_socket(path):
+    """Removes a Unix socket left behind by a service that was killed
+
+    Raises
+    ------
+    ValueError
+        If the path is not a socket, or a service is listening on it
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError(f"{path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            pass
+        else:
+            raise ValueError(f"A service is already listening on {path}")
+    os.remove(path)
+
+
+def make_server(address, service):
+    """Creates a threaded HTTP server for a service
+
+    Parameters
+    ----------
+    address : str
+        `host:port` or `port` to listen on TCP, or the path of a Unix
+        socket, optionally prefixed with `unix:`
+    service : SyntheticService
+        Service answering the requests
+
+    Returns
+    -------
+    socketserver.BaseServer
+        Server with the service as its `service` attribute
+
+    Raises
+    ------
+    ValueError
+        If the path of a Unix socket holds another file or a running service
+    """
+    if address.startswith(UNIX_PREFIX) or os.sep in address:
+        path = (
+            address[len(UNIX_PREFIX) :] if address.startswith(UNIX_PREFIX) else address
+        )
+        _remove_stale_socket(path)
+        server = _UnixHTTPServer(path, _Handler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), _Handler)
+    server.service = service
+    return server
+
+
+def serve(address, JOBS=1):
+    """Runs a generation service until interrupted
+
+    Parameters
+    ----------
+    address : str
+        Address to listen on, see `make_server`
+    JOBS : int, optional
+        Number of worker processes, by default 1
+    """
+    service = SyntheticService(JOBS=JOBS)
+    try:
+        server = make_server(address, service)
+    except BaseException:
+        service.close()
+        raise
+    service.warm()
+    print(f"Serving synthetic data on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if isinstance(server, _UnixHTTPServer) and os.path.exists(
+            server.server_address
+        ):
+            os.remove(server.server_address)
@@ -0,0 +1,494 @@
+""" Work plans that split a synthetic data run between independent shards
+
+A run is planned once, with `write_work_plan`, into units of work: whole
+files, or ranges of time levels of a time-dependent variable.  Each unit
+belongs to one of a fixed number of shards, and `run_shard` generates the
+units of one shard, e.g. as one task of a batch array on its own node.
+Shards share nothing but the output file system.  Every time level is
+generated from its own seed, see `generate_synthetic_slabs`, so the pieces
+of a variable hold the same values as the file written by a single run,
+whichever shard generates them.  `finalize_work_plan` checks that every
+unit of the plan is complete, stitches the pieces of each variable into
+its file or leaves them split, links repeated static fields and updates
+the output manifests.
+"""
+
+__all__ = [
+    "WORK_PLAN_VERSION",
+    "finalize_work_plan",
+    "piece_path",
+    "read_work_plan",
+    "run_shard",
+    "stitch_pieces",
+    "write_work_plan",
+]
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+
+import netCDF4
+import numpy as np
+
+import mdtf_test_data.generators as generators
+from .checkpoint import commit_partial
+from .checkpoint import discard_partial
+from .checkpoint import partial_path
+from .context import get_context
+from .manifest import code_version
+from .manifest import file_checksum
+from .manifest import is_up_to_date
+from .manifest import output_root
+from .manifest import read_manifest
+from .manifest import task_record
+from .manifest import write_manifest
+from .planner import task_shape
+from .synthetic_setup import generate_task
+from .synthetic_setup import generate_variable
+from .synthetic_setup import packing_mode
+from .synthetic_setup import run_task
+from .targets import is_url
+from .variable_spec import VariableSpec
+
+WORK_PLAN_VERSION = 1
+
+# NetCDF4 compression filters copied when stitching pieces
+COMPRESSION_FILTERS = ["zlib", "zstd", "bzip2"]
+
+
+def piece_path(outfile, tstart, tstop):
+    """Returns the path of the file holding time levels [tstart, tstop) of an output"""
+    root, ext = os.path.splitext(outfile)
+    return f"{root}.t{tstart:06d}-{tstop - 1:06d}{ext}"
+
+
+def _status_path(plan_file, shard):
+    """Returns the path recording the completed units of a shard"""
+    return f"{plan_file}.shard{shard:04d}.json"
+
+
+def _write_json(path, obj):
+    """Atomically writes a JSON file"""
+    with open(f"{path}.tmp", "w") as fhandle:
+        json.dump(obj, fhandle, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def _read_status(plan_file, shard):
+    """Returns the checksums of the completed units of a shard keyed by unit id"""
+    path = _status_path(plan_file, shard)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as fhandle:
+        return json.load(fhandle)["units"]
+
+
+def _task(entry):
+    """Returns the (spec, outfile, kwargs) task of a work plan entry"""
+    if isinstance(entry["spec"], list):
+        spec = tuple(VariableSpec(**x) for x in entry["spec"])
+    else:
+        spec = VariableSpec(**entry["spec"])
+    return spec, entry["outfile"], dict(entry["kwargs"])
+
+
+def _splittable(spec, kwargs):
+    """Checks whether a task can be written in ranges of time levels"""
+    if isinstance(spec, tuple) or spec.static or "LINK_TO" in kwargs:
+        return False
+    if kwargs.get("OUTPUT_FORMAT", "netcdf") != "netcdf":
+        return False
+    # packing from the data range needs the whole variable
+    storage = {**(kwargs.get("STORAGE", None) or {}), **(spec.encoding or {})}
+    if packing_mode(spec, storage) == "minmax":
+        return False
+    return generators.supports_slabs(generators.GENERATORS[spec.generator])
+
+
+def write_work_plan(tasks, plan_file, SHARDS=1, PIECE_SIZE=None, FORCE=False):
+    """Splits a list of tasks into the units of work of several shards
+
+    The plan depends only on the tasks and options, so planning the same
+    run again gives the same plan.  Units are assigned to shards largest
+    first, each to the shard with the fewest array elements so far.
+    Files that the output manifest shows to be up to date get no units
+    unless FORCE is set; links, see `run_tasks`, are made by
+    `finalize_work_plan`.
+
+    Parameters
+    ----------
+    tasks : list of tuples
+        Tasks from `synthetic_tasks`, with output on a local or shared
+        file system
+    plan_file : str, path-like
+        Path of the JSON work plan
+    SHARDS : int, optional
+        Number of shards, by default 1
+    PIECE_SIZE : int, optional
+        Split time-dependent NetCDF variables into ranges of this many
+        time levels, by default None (one unit per file)
+    FORCE : bool, optional
+        Plan every file regardless of the manifest, by default False
+
+    Returns
+    -------
+    dict
+        The work plan
+    """
+    assert SHARDS >= 1, "Number of shards must be at least 1"
+    assert PIECE_SIZE is None or PIECE_SIZE >= 1, "Piece size must be at least 1"
+
+    manifests = {}
+    entries = []
+    units = []
+    for index, (spec, outfile, kwargs) in enumerate(tasks):
+        assert not is_url(outfile), "Work plans need output on a shared file system"
+        root = output_root(outfile)
+        if root not in manifests:
+            manifests[root] = read_manifest(root)
+        up_to_date = not FORCE and is_up_to_date(manifests[root], spec, outfile, kwargs)
+        entries.append(
+            {
+                "spec": (
+                    [x.to_dict() for x in spec]
+                    if isinstance(spec, tuple)
+                    else spec.to_dict()
+                ),
+                "outfile": outfile,
+                "kwargs": kwargs,
+                "up_to_date": up_to_date,
+            }
+        )
+        if up_to_date or "LINK_TO" in kwargs:
+            continue
+
+        specs = spec if isinstance(spec, tuple) else (spec,)
+        nelem = sum(int(np.prod(task_shape(x, kwargs))) for x in specs)
+        ntimes = None
+        if PIECE_SIZE is not None and _splittable(spec, kwargs):
+            ntimes = get_context(
+                fmt=kwargs["DATA_FORMAT"],
+                timeres=kwargs["TIME_RES"],
+                grid=spec.grid,
+                dlon=kwargs["DLON"],
+                dlat=kwargs["DLAT"],
+                startyear=kwargs["STARTYEAR"],
+                nyears=kwargs["NYEARS"],
+            ).ntimes
+        if ntimes is None or ntimes <= PIECE_SIZE:
+            units.append(
+                {
+                    "task": index,
+                    "path": outfile,
+                    "tstart": None,
+                    "tstop": None,
+                    "cost": nelem,
+                }
+            )
+            continue
+        for tstart in range(0, ntimes, PIECE_SIZE):
+            tstop = min(tstart + PIECE_SIZE, ntimes)
+            units.append(
+                {
+                    "task": index,
+                    "path": piece_path(outfile, tstart, tstop),
+                    "tstart": tstart,
+                    "tstop": tstop,
+                    "cost": nelem * (tstop - tstart) // ntimes,
+                }
+            )
+
+    # largest units first, each to the least loaded shard
+    loads = [0] * SHARDS
+    for number in sorted(range(len(units)), key=lambda x: (-units[x]["cost"], x)):
+        shard = min(range(SHARDS), key=lambda x: (loads[x], x))
+        units[number]["shard"] = shard
+        loads[shard] += units[number]["cost"]
+    for number, unit in enumerate(units):
+        unit["id"] = number
+
+    plan = {
+        "version": WORK_PLAN_VERSION,
+        "code": code_version(),
+        "shards": SHARDS,
+        "tasks": entries,
+        "units": units,
+    }
+    _write_json(plan_file, plan)
+    return plan
+
+
+def read_work_plan(plan_file):
+    """Reads a work plan written by `write_work_plan`
+
+    Parameters
+    ----------
+    plan_file : str, path-like
+        Path of the JSON work plan
+
+    Returns
+    -------
+    dict
+        The work plan
+    """
+    with open(plan_file, "r") as fhandle:
+        plan = json.load(fhandle)
+    assert (
+        plan.get("version") == WORK_PLAN_VERSION
+    ), f"Unsupported work plan version in {plan_file}"
+    assert (
+        plan["code"] == code_version()
+    ), f"{plan_file} was planned with another version of the generator code"
+    return plan
+
+
+def _run_unit(spec, outfile, kwargs, unit):
+    """Generates one unit of a work plan and returns its id and checksum"""
+    if unit["tstart"] is None:
+        generate_task(spec, outfile, **kwargs)
+    else:
+        os.makedirs(os.path.dirname(unit["path"]), exist_ok=True)
+        generate_variable(
+            spec, unit["path"], TIME_RANGE=(unit["tstart"], unit["tstop"]), **kwargs
+        )
+    return unit["id"], file_checksum(unit["path"])
+
+
+def run_shard(plan_file, SHARD, JOBS=1):
+    """Generates the units of one shard of a work plan
+
+    The output manifests are not touched, so shards can run at the same
+    time on different nodes; each records its completed units next to
+    the plan instead.  Running a shard again skips its completed units.
+
+    Parameters
+    ----------
+    plan_file : str, path-like
+        Path of the JSON work plan
+    SHARD : int
+        Shard to run, numbered from 0
+    JOBS : int, optional
+        Number of worker processes, by default 1
+
+    Returns
+    -------
+    list of str
+        Paths of the files of the shard's units
+    """
+    plan = read_work_plan(plan_file)
+    assert (
+        0 <= SHARD < plan["shards"]
+    ), f"Shard {SHARD} is not in the plan's {plan['shards']} shards"
+
+    status = _read_status(plan_file, SHARD)
+    units = [x for x in plan["units"] if x["shard"] == SHARD]
+    pending = [
+        x for x in units if str(x["id"]) not in status or not os.path.exists(x["path"])
+    ]
+    print(
+        f"Generating shard {SHARD} of {plan['shards']} "
+        + f"({len(pending)} of {len(units)} units to do)"
+    )
+
+    def record(result):
+        number, checksum = result
+        status[str(number)] = checksum
+        _write_json(_status_path(plan_file, SHARD), {"units": status})
+
+    arguments = [(*_task(plan["tasks"][x["task"]]), x) for x in pending]
+    if JOBS > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=JOBS) as executor:
+            futures = [executor.submit(_run_unit, *x) for x in arguments]
+            for future in as_completed(futures):
+                record(future.result())
+    else:
+        for x in arguments:
+            record(_run_unit(*x))
+
+    return [x["path"] for x in units]
+
+
+def stitch_pieces(pieces, outfile):
+    """Concatenates NetCDF files holding consecutive time levels of a variable
+
+    The encoded values are copied without decoding them, so packed,
+    quantized and masked data are unchanged.  Variables without a time
+    dimension, the attributes, compression and chunking are those of the
+    first piece, and the time dimension of the file is unlimited.
+
+    Parameters
+    ----------
+    pieces : list of str
+        Paths of the pieces, in time order
+    outfile : str, path-like
+        Path of the stitched file, replaced if it exists
+    """
+    discard_partial(outfile)
+    with netCDF4.Dataset(pieces[0], "r") as first, netCDF4.Dataset(
+        partial_path(outfile), "w", format=first.data_model
+    ) as dst:
+        dst.setncatts(first.__dict__)
+        for name, dim in first.dimensions.items():
+            dst.createDimension(name, None if dim.isunlimited() else len(dim))
+        for name, var in first.variables.items():
+            filters = var.filters() or {}
+            chunking = var.chunking()
+            out = dst.createVariable(
+                name,
+                var.datatype,
+                var.dimensions,
+                compression=next(
+                    (x for x in COMPRESSION_FILTERS if filters.get(x)), None
+                ),
+                complevel=filters.get("complevel", 4),
+                shuffle=filters.get("shuffle", False),
+                fletcher32=filters.get("fletcher32", False),
+                chunksizes=None if chunking in [None, "contiguous"] else chunking,
+                fill_value=var.__dict__.get("_FillValue", None),
+            )
+            out.setncatts({x: y for x, y in var.__dict__.items() if x != "_FillValue"})
+            out.set_auto_maskandscale(False)
+            if "time" not in var.dimensions:
+                var.set_auto_maskandscale(False)
+                out[...] = var[...]
+
+        offset = 0
+        for path in pieces:
+            with netCDF4.Dataset(path, "r") as src:
+                ntimes = len(src.dimensions["time"])
+                for name, var in src.variables.items():
+                    if "time" not in var.dimensions:
+                        continue
+                    var.set_auto_maskandscale(False)
+                    index = [slice(None)] * len(var.dimensions)
+                    index[var.dimensions.index("time")] = slice(offset, offset + ntimes)
+                    dst[name][tuple(index)] = var[...]
+            offset = offset + ntimes
+    commit_partial(outfile)
+
+
+def finalize_work_plan(plan_file, KEEP_SPLIT=False):
+    """Checks that every unit of a work plan is complete and assembles the output
+
+    The pieces of each split variable are stitched into its file, see
+    `stitch_pieces`.  With KEEP_SPLIT set they are left as they are
+    instead, and their variables are not entered in the manifest.  Links
+    are made once every other file is complete, and the manifest of each
+    output root is updated.  Only then are the stitched pieces and, unless
+    KEEP_SPLIT is set, the status files of the shards removed.  Files an
+    earlier finalize entered in the manifest are not stitched again, so an
+    interrupted finalize can simply be run again.
+
+    Parameters
+    ----------
+    plan_file : str, path-like
+        Path of the JSON work plan
+    KEEP_SPLIT : bool, optional
+        Leave split variables in their pieces, by default False
+
+    Returns
+    -------
+    list of str
+        Paths of the output files, and of the pieces left split
+
+    Raises
+    ------
+    ValueError
+        If a unit of the plan was not completed by its shard
+    """
+    plan = read_work_plan(plan_file)
+    done = {}
+    for shard in range(plan["shards"]):
+        done.update(_read_status(plan_file, shard))
+
+    # tasks already entered in the manifest by an earlier finalize, which
+    # may have removed their pieces and the status of their shards
+    manifests = {}
+    finalized = set()
+    for index, entry in enumerate(plan["tasks"]):
+        spec, outfile, kwargs = _task(entry)
+        root = output_root(outfile)
+        if root not in manifests:
+            manifests[root] = read_manifest(root)
+        if "LINK_TO" in kwargs or entry["up_to_date"]:
+            continue
+        if is_up_to_date(manifests[root], spec, outfile, kwargs):
+            finalized.add(index)
+
+    missing = []
+    for unit in plan["units"]:
+        if unit["task"] in finalized:
+            continue
+        complete = str(unit["id"]) in done and os.path.exists(unit["path"])
+        if complete and unit["tstart"] is not None:
+            with netCDF4.Dataset(unit["path"], "r") as ncfile:
+                ntimes = len(ncfile.dimensions["time"])
+            complete = ntimes == unit["tstop"] - unit["tstart"]
+        if not complete:
+            missing.append(unit)
+    if len(missing) > 0:
+        shards = sorted(set(x["shard"] for x in missing))
+        raise ValueError(
+            f"{len(missing)} of {len(plan['units'])} units are incomplete, "
+            + f"e.g. {missing[0]['path']}; rerun shards {shards}"
+        )
+
+    units = {}
+    for unit in plan["units"]:
+        units.setdefault(unit["task"], []).append(unit)
+
+    outputs = []
+    written = set()
+    links = []
+    stitched = []
+
+    def record(spec, outfile, kwargs, checksum):
+        root = output_root(outfile)
+        manifests[root][os.path.relpath(outfile, root)] = {
+            **task_record(spec, kwargs),
+            "checksum": checksum,
+        }
+
+    for index, entry in enumerate(plan["tasks"]):
+        spec, outfile, kwargs = _task(entry)
+        if "LINK_TO" in kwargs:
+            links.append((entry, spec, outfile, kwargs))
+            continue
+        if entry["up_to_date"] or index in finalized:
+            outputs.append(outfile)
+            continue
+        pieces = units[index]
+        if pieces[0]["tstart"] is None:
+            checksum = done[str(pieces[0]["id"])]
+        elif KEEP_SPLIT:
+            outputs.extend(x["path"] for x in pieces)
+            continue
+        else:
+            print(f"Stitching {len(pieces)} pieces of {outfile}")
+            stitch_pieces([x["path"] for x in pieces], outfile)
+            stitched.extend(x["path"] for x in pieces)
+            checksum = file_checksum(outfile)
+        record(spec, outfile, kwargs, checksum)
+        written.add(outfile)
+        outputs.append(outfile)
+
+    # links follow their source when it is regenerated
+    for entry, spec, outfile, kwargs in links:
+        if not entry["up_to_date"] or kwargs["LINK_TO"] in written:
+            _, checksum = run_task(spec, outfile, kwargs)
+            record(spec, outfile, kwargs, checksum)
+        outputs.append(outfile)
+
+    for root, files in manifests.items():
+        write_manifest(root, files)
+
+    # pieces and shard status are removed only once the manifests record
+    # the stitched files, so an interrupted finalize can be run again
+    for path in stitched:
+        os.remove(path)
+    if not KEEP_SPLIT:
+        for shard in range(plan["shards"]):
+            if os.path.exists(_status_path(plan_file, shard)):
+                os.remove(_status_path(plan_file, shard))
+    return outputs
@@ -0,0 +1,103 @@
+""" In-memory generation of a whole synthetic suite """
+
+__all__ = ["generate_suite"]
+
+from .conventions import CONVENTIONS
+from .conventions import config_file
+from .conventions import convention_grid
+from .conventions import resolve_conventions
+from .synthetic_data import round_trip_dataset
+from .synthetic_setup import build_variable
+from .synthetic_setup import quantize_storage
+from .variable_spec import compile_config
+
+
+def generate_suite(
+    convention,
+    frequencies=None,
+    variables=None,
+    DLAT=20.0,
+    DLON=20.0,
+    STARTYEAR=1,
+    NYEARS=1,
+    COMPRESS=False,
+    STORAGE=None,
+    MEMBER=1,
+):
+    """Generates the variables of a convention as in-memory datasets
+
+    Nothing is written to disk.  Each dataset is encoded with the same
+    rules as `write_to_netcdf` and decoded again, see
+    `round_trip_dataset`, so its values, fill values, time units and
+    dtypes match those of the file written by `mdtf_synthetic.py` and
+    reopened with `xarray.open_dataset`.
+
+    Parameters
+    ----------
+    convention : str
+        Data convention, "NCAR" (or "CESM"), "GFDL" or "CMIP"
+    frequencies : str or list of str, optional
+        Output frequencies, e.g. ["mon", "day"], by default None (every
+        frequency of the convention)
+    variables : list of str, optional
+        Names of the variables to generate, by default None (every
+        configured variable)
+    DLAT : float, optional
+        Latitude spacing in degrees, by default 20.0
+    DLON : float, optional
+        Longitude spacing in degrees, by default 20.0
+    STARTYEAR : int, optional
+        Start year of the time axis, by default 1
+    NYEARS : int, optional
+        Number of years of data, by default 1
+    COMPRESS : bool, optional
+        Gather tripolar ocean fields on wet points, by default False
+    STORAGE : dict, optional
+        Storage options, see `storage_encoding`; only the packing and
+        quantization options affect the returned data, by default None
+    MEMBER : int, optional
+        Ensemble member, numbered from 1, by default 1
+
+    Returns
+    -------
+    dict
+        Decoded xarray datasets keyed by (variable, frequency)
+    """
+    conventions = resolve_conventions(convention)
+    assert len(conventions) == 1, f"Unknown convention `{convention}`"
+    convention = conventions[0]
+    settings = CONVENTIONS[convention]
+
+    if frequencies is None:
+        frequencies = settings["time_res"]
+    elif isinstance(frequencies, str):
+        frequencies = [frequencies]
+    for frequency in frequencies:
+        assert (
+            frequency in settings["time_res"]
+        ), f"No `{frequency}` configuration for convention `{convention}`"
+
+    suite = {}
+    for frequency in frequencies:
+        dlat, dlon = convention_grid(convention, frequency, DLAT=DLAT, DLON=DLON)
+        for spec in compile_config(config_file(convention, frequency)):
+            if variables is not None and spec.name not in variables:
+                continue
+            dset_out, packing = build_variable(
+                spec,
+                DLAT=dlat,
+                DLON=dlon,
+                STARTYEAR=STARTYEAR,
+                NYEARS=NYEARS,
+                TIME_RES=frequency,
+                DATA_FORMAT=settings["fmt"],
+                COMPRESS=COMPRESS,
+                STORAGE=STORAGE,
+                MEMBER=MEMBER,
+            )
+            storage = {**(STORAGE or {}), **(spec.encoding or {})}
+            suite[(spec.name, frequency)] = round_trip_dataset(
+                dset_out, packing=packing, storage=quantize_storage(spec, storage)
+            )
+
+    return suite
@@ -2,27 +2,44 @@
 """ Module for generating synthetic datasets """
 
 ___all__ = [
+    "apply_encoding",
+    "apply_quantization",
     "dataset_stats",
     "generate_synthetic_dataset",
+    "generate_synthetic_slabs",
     "generate_random_array",
+    "netcdf_engine",
+    "netcdf_in_memory",
+    "combine_datasets",
+    "split_dataset",
+    "data_range",
+    "packing_parameters",
+    "patch_netcdf_attributes",
+    "quantize_digits",
+    "quantize_option",
+    "quantize_values",
+    "round_trip_dataset",
+    "stats_range",
+    "storage_encoding",
+    "write_encoded_netcdf",
+    "write_slabs_to_netcdf",
     "write_to_netcdf",
 ]
 
+import inspect
+
+import netCDF4
 import xarray as xr
 import numpy as np
-from mdtf_test_data.synthetic.horizontal import construct_rect_grid
-from mdtf_test_data.synthetic.horizontal import construct_tripolar_grid
 import mdtf_test_data.generators as generators
 
-from mdtf_test_data.synthetic.time import generate_monthly_time_axis
-from mdtf_test_data.synthetic.time import generate_daily_time_axis
-from mdtf_test_data.synthetic.time import generate_hourly_time_axis
-
-from mdtf_test_data.synthetic.vertical import gfdl_plev19_vertical_coord
-from mdtf_test_data.synthetic.vertical import gfdl_vertical_coord
-from mdtf_test_data.synthetic.vertical import ncar_hybrid_coord
-from mdtf_test_data.synthetic.vertical import mom6_z_coord
-from mdtf_test_data.synthetic.vertical import cmip_vertical_coord
+from mdtf_test_data.synthetic.checkpoint import commit_partial
+from mdtf_test_data.synthetic.checkpoint import discard_partial
+from mdtf_test_data.synthetic.checkpoint import partial_path
+from mdtf_test_data.synthetic.checkpoint import write_checkpoint
+from mdtf_test_data.synthetic.context import SyntheticContext
+from mdtf_test_data.synthetic.targets import is_url
+from mdtf_test_data.synthetic.targets import write_bytes
 
 
 def dataset_stats(filename, var=None, limit=None):
@@ -57,6 +74,29 @@ def dataset_stats(filename, var=None, limit=None):
     return list(zip(means, stds))
 
 
+def _generator_setup(context, generator, generator_kwargs, stats, member=0):
+    """Resolves a generator by name and adds the statistics to its arguments"""
+    if stats is not None:
+        stats = [stats] if not isinstance(stats, list) else stats
+        context.vertical_coord(len(stats))
+
+    generator_kwargs = {} if generator_kwargs is None else generator_kwargs
+    if stats is not None:
+        generator_kwargs["stats"] = stats
+
+    assert generator in generators.GENERATORS, f"Unknown generator method: {generator}"
+    generator = generators.GENERATORS[generator]
+
+    if member != 0:
+        if not generators.supports_members(generator):
+            raise ValueError(
+                f"Generator `{generator.__name__}` does not support ensemble members"
+            )
+        generator_kwargs["member"] = member
+
+    return (generator, generator_kwargs)
+
+
 def generate_synthetic_dataset(
     dlon,
     dlat,
@@ -73,6 +113,9 @@ def generate_synthetic_dataset(
     static=False,
     data=None,
     grid="standard",
+    compress=False,
+    context=None,
+    member=0,
 ):
     """Generates xarray dataset of syntheic data in NCAR format
 
@@ -101,6 +144,15 @@ def generate_synthetic_dataset(
     grid : str
         Type of output grid, either "standard" or "tripolar",
         by default "standard"
+    compress : bool
+        Store tripolar fields on wet points only using CF compression
+        by gathering, by default False
+    context : SyntheticContext, optional
+        Prebuilt coordinates shared across variables. If None, a context
+        is built from the grid and time arguments, by default None
+    member : int, optional
+        Zero-based ensemble member; each member draws its data from its
+        own seed stream, by default 0
 
     Returns
     -------
@@ -110,192 +162,574 @@ def generate_synthetic_dataset(
 
     attrs = {} if attrs is None else attrs
 
-    # some logical control flags
-    do_bounds = True if fmt == "cmip" else False
-
-    # Step 1: set up the horizontal grid
-    if grid == "tripolar":
-        dset = construct_tripolar_grid(attr_fmt=fmt, retain_coords=True, add_attrs=True)
-        xyshape = dset["mask"].shape
-        latvar = "nlat" if "nlat" in list(dset.variables) else "yh"
-        lonvar = "nlon" if "nlon" in list(dset.variables) else "xh"
-        lat = dset[latvar]
-        lon = dset[lonvar]
-    else:
-        dset = construct_rect_grid(
-            dlon, dlat, add_attrs=True, attr_fmt=fmt, bounds=do_bounds
+    # Steps 1-3: set up the horizontal grid, time axis and vertical coordinate
+    if context is None:
+        context = SyntheticContext(
+            fmt=fmt,
+            timeres=timeres,
+            grid=grid,
+            dlon=dlon,
+            dlat=dlat,
+            startyear=startyear,
+            nyears=nyears,
         )
-        lat = dset.lat
-        lon = dset.lon
-        xyshape = (len(dset["lat"]), len(dset["lon"]))
-
-    # Step 2: set up the time axis
-    if static is False:
-        if timeres == "mon":
-            ds_time = generate_monthly_time_axis(startyear, nyears, timefmt=fmt)
-        elif timeres == "day":
-            ds_time = generate_daily_time_axis(startyear, nyears, timefmt=fmt)
-        elif timeres == "3hr":
-            ds_time = generate_hourly_time_axis(startyear, nyears, 3, timefmt=fmt)
-        elif timeres == "1hr":
-            ds_time = generate_hourly_time_axis(startyear, nyears, 1, timefmt=fmt)
-        else:
-            print(timeres)
-            raise ValueError("Unknown time resolution requested")
-
-        dset = ds_time.merge(dset)
-        time = dset["time"]
-        ntimes = len(time)
-    else:
-        ntimes = 1
-
-    # Step 3: generate the vertical coordinate
-    if stats is not None:
-        stats = [stats] if not isinstance(stats, list) else stats
-        if len(stats) > 1:
-            if fmt == "ncar":
-                dset = dset.merge(ncar_hybrid_coord())
-                lev = dset.lev
-            elif fmt == "gfdl":
-                if len(stats) == 19:
-                    dset = dset.merge(gfdl_plev19_vertical_coord())
-                    lev = dset.plev19
-                else:
-                    dset = dset.merge(gfdl_vertical_coord())
-                    lev = dset.pfull
-            elif fmt == "cmip":
-                if grid == "tripolar":
-                    dset = dset.merge(mom6_z_coord())
-                    lev = dset.lev
-                else:
-                    dset = dset.merge(cmip_vertical_coord())
-                    lev = dset.plev
-                assert len(stats) == len(
-                    lev
-                ), f" Length of stats {data.shape[1]} must match number of levels {len(lev)}."
+    ntimes = 1 if static else context.ntimes
 
     # Step 4: define the synthetic data generator kernel
-    generator_kwargs = {} if generator_kwargs is None else generator_kwargs
-    if stats is not None:
-        generator_kwargs["stats"] = stats
-
-    assert generator in list(
-        generators.__dict__.keys()
-    ), f"Unknown generator method: {generator}"
-    generator = generators.__dict__[generator]
+    generator, generator_kwargs = _generator_setup(
+        context, generator, generator_kwargs, stats, member=member
+    )
 
     # Step 5: generate the synthetic data array
     data = (
         generators.generate_random_array(
-            xyshape, ntimes, generator=generator, generator_kwargs=generator_kwargs
+            context.xyshape,
+            ntimes,
+            generator=generator,
+            generator_kwargs=generator_kwargs,
         )
         if data is None
         else data
     )
     data = data.squeeze()
 
-    # Step 6: convert to Xarray DataArray by assigning coords
-    mask = dset["mask"].values if "mask" in dset.variables else 1.0
-    data = np.array(data * mask, dtype=np.float32)
+    # Step 6: attach the data to the prebuilt coordinates
+    return context.dataset(
+        varname, data, attrs=attrs, static=static, coords=coords, compress=compress
+    )
+
 
-    if static is True:
-        if len(data.shape) == 4:
-            assert data.shape[1] == len(
-                lev
-            ), f" Length of stats {data.shape[1]} must match number of levels {len(lev)}."
-            dset[varname] = xr.DataArray(data, coords=(lev, lat, lon), attrs=attrs)
-        else:
-            dset[varname] = xr.DataArray(data, coords=(lat, lon), attrs=attrs)
+def generate_synthetic_slabs(
+    dlon,
+    dlat,
+    startyear,
+    nyears,
+    varname,
+    timeres="mon",
+    attrs=None,
+    fmt="ncar",
+    coords=None,
+    generator="normal",
+    generator_kwargs=None,
+    stats=None,
+    grid="standard",
+    compress=False,
+    context=None,
+    slab_size=1,
+    member=0,
+    start=0,
+    stop=None,
+):
+    """Generates a time-dependent synthetic dataset in slabs of time levels
+
+    Each slab is a complete dataset covering consecutive time levels, so
+    only one slab of data is held in memory at a time.  Generators that
+    support slabs (see `generators.supports_slabs`) produce the same
+    values as `generate_synthetic_dataset`; other generators are run over
+    the full time axis and yield a single slab.
+
+    Parameters
+    ----------
+    slab_size : int, optional
+        Number of time levels per slab, by default 1
+    start : int, optional
+        First time level to generate, e.g. to resume an interrupted file;
+        the slabs are the same as those of a run from 0 as the generators
+        seed each time level separately, by default 0
+    stop : int, optional
+        Time level after the last one to generate, e.g. to generate one
+        time range of a file split between several processes, by default
+        None (the end of the time axis)
+
+    Other parameters are the same as for `generate_synthetic_dataset`.
+
+    Yields
+    ------
+    xarray.Dataset
+        Dataset of synthetic data for one slab of time levels
+    """
+
+    attrs = {} if attrs is None else attrs
+
+    if context is None:
+        context = SyntheticContext(
+            fmt=fmt,
+            timeres=timeres,
+            grid=grid,
+            dlon=dlon,
+            dlat=dlat,
+            startyear=startyear,
+            nyears=nyears,
+        )
+    ntimes = context.ntimes
+
+    generator, generator_kwargs = _generator_setup(
+        context, generator, generator_kwargs, stats, member=member
+    )
+    sliceable = generators.supports_slabs(generator)
+    if sliceable:
+        first, last = start, ntimes if stop is None else min(stop, ntimes)
     else:
-        if len(data.shape) == 4:
-            #print(varname)
-            assert data.shape[1] == len(
-                lev
-            ), f" Length of stats {data.shape[1]} must match number of levels {len(lev)}."
-            dset[varname] = xr.DataArray(
-                data, coords=(time, lev, lat, lon), attrs=attrs
-            )
-        else:
-            dset[varname] = xr.DataArray(data, coords=(time, lat, lon), attrs=attrs)
-        dset.set_coords(("lat", "lon"))
-
-    if coords is not None:
-        dset[coords["name"]] = xr.DataArray(coords["value"], attrs=coords["atts"])
-        dset[varname].attrs = {**dset[varname].attrs, "coordinates": coords["name"]}
-
-    dset.attrs["convention"] = fmt
-
-    if fmt == "cmip":
-        if "bnds" in dset.variables:
-            dset["bnds"].attrs = {"long_name": "vertex number"}
-        cmip_global_atts = [
-            "external_variables",
-            "history",
-            "table_id",
-            "activity_id",
-            "branch_method",
-            "branch_time_in_child",
-            "branch_time_in_parent",
-            "comment",
-            "contact",
-            "Conventions",
-            "creation_date",
-            "data_specs_version",
-            "experiment",
-            "experiment_id",
-            "forcing_index",
-            "frequency",
-            "further_info_url",
-            "grid",
-            "grid_label",
-            "initialization_index",
-            "institution",
-            "institution_id",
-            "license",
-            "mip_era",
-            "nominal_resolution",
-            "parent_activity_id",
-            "parent_experiment_id",
-            "parent_mip_era",
-            "parent_source_id",
-            "parent_time_units",
-            "parent_variant_label",
-            "physics_index",
-            "product",
-            "realization_index",
-            "realm",
-            "source",
-            "source_id",
-            "source_type",
-            "sub_experiment",
-            "sub_experiment_id",
-            "title",
-            "tracking_id",
-            "variable_id",
-            "variant_info",
-            "references",
-            "variant_label",
+        first, last, slab_size = 0, ntimes, ntimes
+
+    for tstart in range(first, last, slab_size):
+        nslab = min(slab_size, last - tstart)
+        kwargs = (
+            {**generator_kwargs, "tstart": tstart} if sliceable else generator_kwargs
+        )
+        data = generators.generate_random_array(
+            context.xyshape, nslab, generator=generator, generator_kwargs=kwargs
+        )
+
+        # drop the level axis of single-level variables but keep time
+        if len(data.shape) == 4 and data.shape[1] == 1:
+            data = data[:, 0]
+
+        yield context.dataset(
+            varname,
+            data,
+            attrs=attrs,
+            coords=coords,
+            compress=compress,
+            tslice=slice(tstart, tstart + nslab),
+        )
+
+
+def combine_datasets(datasets):
+    """Combines single-variable datasets into one shared-coordinate dataset
+
+    Variables and coordinates are added by name without comparing or
+    aligning them, so the datasets must come from the same grid and time
+    axis, as for variables of one configuration.  Global attributes are
+    taken from the first dataset that defines them.
+
+    Parameters
+    ----------
+    datasets : list of xarray.Dataset
+        Datasets to combine
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset holding every variable of the inputs
+    """
+    combined = datasets[0].copy()
+    for dset in datasets[1:]:
+        for name, variable in dset.variables.items():
+            if name in combined.variables:
+                if combined[name].shape != variable.shape:
+                    raise ValueError(
+                        f"Variable `{name}` has shape {variable.shape} and "
+                        f"{combined[name].shape} in the datasets being combined"
+                    )
+            elif name in dset.coords:
+                combined.coords[name] = variable
+            else:
+                combined[name] = variable
+        for key, value in dset.attrs.items():
+            combined.attrs.setdefault(key, value)
+    return combined
+
+
+def split_dataset(dset, varnames):
+    """Splits a multi-variable dataset into one dataset per variable
+
+    Each dataset holds one of `varnames` plus the auxiliary variables,
+    such as bounds and time averages, that are not in `varnames` and whose
+    dimensions are used by that variable.  Coordinates of dimensions that
+    none of `varnames` use, such as interface levels, are kept in every
+    dataset.
+
+    Parameters
+    ----------
+    dset : xarray.Dataset
+        Dataset with several variables, e.g. from `combine_datasets`
+    varnames : list of str
+        Names of the variables to split into separate datasets
+
+    Returns
+    -------
+    dict
+        Single-variable datasets keyed by variable name
+    """
+    # dimensions that only auxiliary variables use, such as `bnds`
+    used = set(dim for var in varnames for dim in dset[var].dims)
+    auxiliary = [x for x in dset.data_vars if x not in varnames]
+    unused = [x for x in dset.coords if len(set(dset[x].dims) & used) == 0]
+
+    result = {}
+    for var in varnames:
+        dims = set(dset[var].dims)
+        keep = [
+            x
+            for x in auxiliary
+            if set(dset[x].dims) & used and set(dset[x].dims) & used <= dims
         ]
+        result[var] = dset[keep + [var] + unused]
+    return result
 
-        cmip_global_atts = {x: "" for x in cmip_global_atts}
-        dset.attrs = {**dset.attrs, **cmip_global_atts}
 
-    # remove unused fields
-    if grid == "tripolar":
-        dset = dset.drop_vars(["mask", "wet", "depth"])
+# compression codecs accepted in storage options
+COMPRESSION_CODECS = ["zlib", "zstd", "bzip2"]
 
-    return dset
+# xarray engines and file formats accepted in storage options
+NETCDF_ENGINES = ["netcdf4", "h5netcdf", "scipy"]
+NETCDF_FORMATS = ["NETCDF4", "NETCDF4_CLASSIC", "NETCDF3_64BIT", "NETCDF3_CLASSIC"]
 
 
-def write_to_netcdf(dset_out, outfile, time_dtype="float"):
-    """Writes xarray dataset to NetCDF with proper encodings
+def netcdf_engine(storage=None):
+    """Returns the xarray engine and file format selected by storage options
+
+    Parameters
+    ----------
+    storage : dict, optional
+        Storage options, see `storage_encoding`, by default None
+
+    Returns
+    -------
+    tuple
+        Engine and format, each None for the xarray default; the scipy
+        engine defaults to NETCDF3_64BIT
+    """
+    storage = {} if storage is None else storage
+    engine = storage.get("engine", None)
+    fmt = storage.get("format", None)
+    assert engine in [None] + NETCDF_ENGINES, f"Unknown NetCDF engine `{engine}`"
+    assert fmt in [None] + NETCDF_FORMATS, f"Unknown NetCDF format `{fmt}`"
+    if engine == "scipy":
+        fmt = "NETCDF3_64BIT" if fmt is None else fmt
+        assert fmt.startswith("NETCDF3"), "The scipy engine only writes NetCDF3 files"
+    elif engine == "h5netcdf":
+        assert fmt in [None, "NETCDF4"], "The h5netcdf engine only writes NETCDF4 files"
+        assert storage.get("chunk_cache", None) is None or _h5py_file_options(), (
+            "This version of xarray can not set the chunk cache of the h5netcdf "
+            + "engine; upgrade xarray and h5netcdf, or use the netcdf4 engine"
+        )
+    return (engine, fmt)
+
+
+def _h5py_file_options():
+    """Checks whether xarray passes h5py file options on to h5netcdf"""
+    return "driver_kwds" in inspect.signature(xr.backends.H5NetCDFStore.open).parameters
+
+
+def storage_encoding(variable, storage=None):
+    """Returns the NetCDF compression and chunking encoding of a variable
+
+    Parameters
+    ----------
+    variable : xarray.Variable or xarray.DataArray
+        Variable to be written
+    storage : dict, optional
+        Storage options, by default None (uncompressed, library default
+        layout). Recognized keys are:
+
+        compression : str
+            Compression codec, one of "zlib", "zstd" or "bzip2", or None
+        complevel : int
+            Compression level
+        shuffle : bool
+            Apply the byte shuffle filter before compressing, by default True
+        chunks : dict
+            Chunk size for each dimension name; dimensions that are not
+            listed are stored in a single chunk
+        engine : str
+            xarray engine, one of "netcdf4", "h5netcdf" or "scipy"
+        format : str
+            File format, e.g. "NETCDF4" or "NETCDF3_64BIT"
+        chunk_cache : int
+            HDF5 chunk cache size in bytes used while writing
+        least_significant_digit : int or dict
+            Round data variables to this many decimal digits, either for
+            every variable or keyed by variable name, see `quantize_values`
+        keepbits : int or dict
+            Round data variables to this many mantissa bits, either for
+            every variable or keyed by variable name
+
+    Returns
+    -------
+    dict
+        Encoding keys understood by the xarray netCDF4 backend
+    """
+    storage = {} if storage is None else storage
+    encoding = {}
+
+    # scalar variables cannot be compressed or chunked
+    if len(variable.dims) == 0:
+        return encoding
+
+    engine, fmt = netcdf_engine(storage)
+    compression = storage.get("compression", None)
+    compression = None if compression in ["none", "None"] else compression
+    chunks = storage.get("chunks", None)
+    if fmt is not None and fmt.startswith("NETCDF3"):
+        assert (
+            compression is None and chunks is None
+        ), "NetCDF3 files can not be compressed or chunked"
+    if compression is not None:
+        assert (
+            compression in COMPRESSION_CODECS
+        ), f"Unknown compression codec `{compression}`"
+        assert (
+            engine != "h5netcdf" or compression == "zlib"
+        ), f"Compression codec `{compression}` is not supported by h5netcdf"
+        if compression == "zlib":
+            encoding["zlib"] = True
+        else:
+            encoding["compression"] = compression
+        if storage.get("complevel", None) is not None:
+            encoding["complevel"] = int(storage["complevel"])
+        encoding["shuffle"] = bool(storage.get("shuffle", True))
+
+    if chunks is not None and any(x in chunks for x in variable.dims):
+        encoding["chunksizes"] = tuple(
+            max(1, min(int(chunks.get(dim, size)), size))
+            for dim, size in zip(variable.dims, variable.shape)
+        )
+
+    return encoding
+
+
+PACKED_DTYPE = "int16"
+PACKED_FILL_VALUE = -32768
+PACKED_MAX = 32767
+PACK_NSIGMA = 6.0
+
+
+def packing_parameters(vmin, vmax):
+    """Returns the int16 packing encoding for values in a range
+
+    The range is mapped onto [-32767, 32767]; -32768 is reserved as the
+    fill value.
+
+    Parameters
+    ----------
+    vmin : float
+        Smallest value to represent
+    vmax : float
+        Largest value to represent
+
+    Returns
+    -------
+    dict
+        `dtype`, `scale_factor`, `add_offset` and `_FillValue` encoding
+    """
+    vmin = float(vmin)
+    vmax = float(vmax)
+    assert np.isfinite(vmin) and np.isfinite(vmax), "Packing range is not finite"
+    scale_factor = (vmax - vmin) / (2 * PACKED_MAX) if vmax > vmin else 1.0
+    return {
+        "dtype": PACKED_DTYPE,
+        "scale_factor": scale_factor,
+        "add_offset": (vmax + vmin) / 2.0,
+        "_FillValue": PACKED_FILL_VALUE,
+    }
+
+
+def stats_range(stats, nsigma=PACK_NSIGMA):
+    """Returns the range spanned by mean +/- nsigma * stddev over all levels
+
+    Parameters
+    ----------
+    stats : list of tuples
+        (mean, stddev) pairs, one per level
+    nsigma : float, optional
+        Number of standard deviations on each side of the mean,
+        by default PACK_NSIGMA
+
+    Returns
+    -------
+    tuple
+        (vmin, vmax)
+    """
+    stats = np.atleast_2d(np.array(stats, dtype=np.float64))
+    lower = stats[:, 0] - nsigma * np.abs(stats[:, 1])
+    upper = stats[:, 0] + nsigma * np.abs(stats[:, 1])
+    return (float(lower.min()), float(upper.max()))
+
+
+def data_range(datasets, var):
+    """Returns the range of a variable over a sequence of datasets
+
+    The datasets, e.g. time slabs from `generate_synthetic_slabs`, are
+    visited one at a time so only one is held in memory.
+
+    Parameters
+    ----------
+    datasets : iterable of xarray.Dataset
+        Datasets containing the variable
+    var : str
+        Variable name
+
+    Returns
+    -------
+    tuple
+        (vmin, vmax), ignoring missing values
+    """
+    vmin = np.inf
+    vmax = -np.inf
+    for dset in datasets:
+        values = dset[var].values
+        if np.isfinite(values).any():
+            vmin = min(vmin, float(np.nanmin(values)))
+            vmax = max(vmax, float(np.nanmax(values)))
+    return (vmin, vmax)
+
+
+QUANTIZE_FRACTION = 0.01
+
+
+def quantize_digits(stats, fraction=QUANTIZE_FRACTION):
+    """Returns the decimal digits that resolve a fraction of the stddev
+
+    Parameters
+    ----------
+    stats : list of tuples
+        (mean, stddev) pairs, one per level
+    fraction : float, optional
+        Precision kept as a fraction of the smallest nonzero stddev,
+        by default QUANTIZE_FRACTION
+
+    Returns
+    -------
+    int or None
+        Least significant decimal digit, negative for tens, hundreds, ...;
+        None if no level has a nonzero stddev
+    """
+    stddev = np.abs(np.atleast_2d(np.array(stats, dtype=np.float64))[:, 1])
+    stddev = stddev[stddev > 0.0]
+    if len(stddev) == 0:
+        return None
+    return int(np.ceil(-np.log10(fraction * stddev.min())))
+
+
+def quantize_values(values, least_significant_digit=None, keepbits=None):
+    """Rounds floating point values so their trailing mantissa bits are zero
+
+    Zeroed bits make otherwise incompressible noise shrink with zlib or
+    zstd.  Missing and non-finite values are kept as they are.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Floating point values
+    least_significant_digit : int, optional
+        Keep a precision of 10**-least_significant_digit, rounded to a
+        power of two as the netCDF4 library does, by default None
+    keepbits : int, optional
+        Round to nearest, ties to even, keeping this many mantissa bits,
+        by default None
+
+    Returns
+    -------
+    numpy.ndarray
+        Rounded values of the same dtype
+    """
+    values = np.asarray(values)
+    result = values
+    if least_significant_digit is not None:
+        bits = np.ceil(np.log2(10.0 ** int(least_significant_digit)))
+        scale = 2.0**bits
+        result = (np.around(scale * result) / scale).astype(values.dtype)
+    if keepbits is not None:
+        assert int(keepbits) >= 0, "Error: keepbits must be at least 0"
+        nbits = np.finfo(values.dtype).nmant
+        if int(keepbits) < nbits:
+            utype = np.dtype(f"u{values.dtype.itemsize}").type
+            drop = utype(nbits - int(keepbits))
+            bits = np.ascontiguousarray(result).view(utype)
+            half = (utype(1) << (drop - utype(1))) - utype(1)
+            bits = bits + half + ((bits >> drop) & utype(1))
+            bits = bits & ~((utype(1) << drop) - utype(1))
+            result = bits.view(values.dtype)
+    return np.where(np.isfinite(values), result, values)
+
+
+def quantize_option(storage, key, var):
+    """Returns a quantization setting for one variable, or None
+
+    Parameters
+    ----------
+    storage : dict
+        Storage options, see `storage_encoding`
+    key : str
+        "least_significant_digit" or "keepbits"
+    var : str
+        Variable name
+
+    Returns
+    -------
+    int or None
+        The setting, given for every variable or by variable name
+    """
+    value = storage.get(key, None)
+    if isinstance(value, dict):
+        value = value.get(var, None)
+    return value
+
+
+def apply_quantization(dset_out, storage=None):
+    """Rounds the floating point data variables selected by storage options
+
+    Coordinates, bounds and time variables are never rounded.
+    """
+    storage = {} if storage is None else storage
+    if all(x not in storage for x in ["least_significant_digit", "keepbits"]):
+        return
+    bounds = [dset_out[x].attrs.get("bounds", None) for x in dset_out.variables]
+    for var in list(dset_out.data_vars):
+        if (
+            var in bounds
+            or var in ["time_bnds", "average_T1", "average_T2"]
+            or "float" not in str(dset_out[var].dtype)
+        ):
+            continue
+        digits = quantize_option(storage, "least_significant_digit", var)
+        keepbits = quantize_option(storage, "keepbits", var)
+        assert (
+            digits is None or keepbits is None
+        ), f"Choose one of least_significant_digit or keepbits for `{var}`"
+        if digits is not None or keepbits is not None:
+            dset_out[var].values = quantize_values(
+                dset_out[var].values, digits, keepbits
+            )
+
+
+def _apply_packing(dset_out, packing):
+    """Sets the packed encoding of variables and clips them to its range"""
+    for var, encoding in packing.items():
+        if var not in dset_out.variables:
+            continue
+        scale_factor = encoding["scale_factor"]
+        add_offset = encoding["add_offset"]
+        # values beyond the packed range would wrap around when cast
+        dset_out[var].values = np.clip(
+            dset_out[var].values,
+            add_offset - PACKED_MAX * scale_factor,
+            add_offset + PACKED_MAX * scale_factor,
+        )
+        dset_out[var].encoding.update(encoding)
+        if "missing_value" in dset_out[var].attrs:
+            del dset_out[var].attrs["missing_value"]
+            dset_out[var].encoding["missing_value"] = encoding["_FillValue"]
+
+
+def apply_encoding(dset_out, time_dtype="float", storage=None, packing=None):
+    """Sets the NetCDF encoding of every variable in a dataset
 
     Parameters
     ----------
     dset_out : xarray.Dataset
-        xarray dataset to write to NetCDF
-    outfile : str, path-like
-        Path to output file
+        Dataset whose variable encodings are updated in place
+    time_dtype : str, optional
+        Storage type of the time variables, "float" or "int",
+        by default "float"
+    storage : dict, optional
+        Compression and chunking options applied to every variable, see
+        `storage_encoding`, by default None
+    packing : dict, optional
+        Packed int16 encoding of variables, see `packing_parameters`,
+        keyed by variable name, by default None
     """
 
     base_time_unit = (
@@ -304,7 +738,6 @@ def write_to_netcdf(dset_out, outfile, time_dtype="float"):
         else "days since 0001-01-01"
     )
 
-    encoding = {}
     for var in list(dset_out.variables):
         if var in ["time", "time_bnds", "average_T1", "average_T2"]:
             dset_out[var].encoding["units"] = base_time_unit
@@ -315,6 +748,9 @@ def write_to_netcdf(dset_out, outfile, time_dtype="float"):
                 dset_out[var].encoding["dtype"] = "i4"
         elif var == "date":
             dset_out[var].encoding["dtype"] = "i4"
+        elif "compress" in dset_out[var].attrs:
+            # list variables for compression by gathering are never missing
+            dset_out[var].encoding["_FillValue"] = None
         elif "float" in str(dset_out[var].dtype):
             dset_out[var].encoding["_FillValue"] = 1.0e20
         elif "int" in str(dset_out[var].dtype):
@@ -322,5 +758,304 @@ def write_to_netcdf(dset_out, outfile, time_dtype="float"):
         else:
             dset_out[var].encoding["_FillValue"] = None
 
-    # encoding = {"lat_bnds": {"units": "degrees_north"}}
-    dset_out.to_netcdf(outfile, encoding=encoding)
+        if storage is not None:
+            dset_out[var].encoding.update(storage_encoding(dset_out[var], storage))
+
+    apply_quantization(dset_out, storage)
+    if packing is not None:
+        _apply_packing(dset_out, packing)
+
+
+def write_to_netcdf(
+    dset_out,
+    outfile,
+    time_dtype="float",
+    unlimited_dims=None,
+    storage=None,
+    packing=None,
+):
+    """Writes xarray dataset to NetCDF with proper encodings
+
+    Local files are written to `partial_path(outfile)` and renamed once
+    complete, so `outfile` is never left half-written.
+
+    Parameters
+    ----------
+    dset_out : xarray.Dataset
+        xarray dataset to write to NetCDF
+    outfile : str, path-like
+        Path to output file
+    unlimited_dims : list of str, optional
+        Dimensions to create as unlimited, by default None
+    storage : dict, optional
+        Compression and chunking options applied to every variable, see
+        `storage_encoding`, by default None
+    packing : dict, optional
+        Store these variables as int16 with `scale_factor` and
+        `add_offset`; encodings from `packing_parameters` keyed by variable
+        name, by default None
+    """
+
+    apply_encoding(dset_out, time_dtype=time_dtype, storage=storage, packing=packing)
+
+    if is_url(outfile):
+        # assembled in memory and sent to the target in a single request
+        fmt = netcdf_engine(storage)[1]
+        ncfile = netcdf_in_memory(dset_out, unlimited_dims=unlimited_dims, fmt=fmt)
+        write_bytes(outfile, ncfile.close())
+        return
+
+    write_encoded_netcdf(
+        dset_out, partial_path(outfile), unlimited_dims=unlimited_dims, storage=storage
+    )
+    commit_partial(outfile)
+
+
+def write_encoded_netcdf(dset_out, outfile, unlimited_dims=None, storage=None):
+    """Writes an encoded dataset to a local file with the selected engine
+
+    The HDF5 chunk cache size of the storage options is applied while the
+    file is written: through the h5py file driver for h5netcdf and the
+    library-wide netCDF4 cache otherwise.  Unlike `write_to_netcdf`, the
+    variable encodings are used as they are and the file is written
+    directly to `outfile`.
+
+    Parameters
+    ----------
+    dset_out : xarray.Dataset
+        Dataset whose variable encodings are already set, e.g. by
+        `apply_encoding`
+    outfile : str, path-like
+        Path to output file
+    unlimited_dims : list of str, optional
+        Dimensions to create as unlimited, by default None
+    storage : dict, optional
+        Storage options selecting the engine, format and chunk cache, see
+        `storage_encoding`, by default None
+    """
+    engine, fmt = netcdf_engine(storage)
+    cache = (storage or {}).get("chunk_cache", None)
+    if cache is not None and engine == "h5netcdf":
+        store = xr.backends.H5NetCDFStore.open(
+            outfile, mode="w", driver_kwds={"rdcc_nbytes": int(cache)}
+        )
+        try:
+            dset_out.dump_to_store(store, unlimited_dims=unlimited_dims)
+        finally:
+            store.close()
+    elif cache is not None and engine in [None, "netcdf4"]:
+        previous = netCDF4.get_chunk_cache()
+        netCDF4.set_chunk_cache(int(cache))
+        try:
+            dset_out.to_netcdf(
+                outfile, unlimited_dims=unlimited_dims, engine=engine, format=fmt
+            )
+        finally:
+            netCDF4.set_chunk_cache(*previous)
+    else:
+        # encoding = {"lat_bnds": {"units": "degrees_north"}}
+        dset_out.to_netcdf(
+            outfile, unlimited_dims=unlimited_dims, engine=engine, format=fmt
+        )
+
+
+def netcdf_in_memory(dset_out, unlimited_dims=None, fmt=None):
+    """Writes an encoded dataset to an in-memory NetCDF file
+
+    The file is always written by netCDF4, in the given format.  Returns
+    the open `netCDF4.Dataset`; closing it returns the contents of the
+    file.
+    """
+    fmt = "NETCDF4" if fmt is None else fmt
+    ncfile = netCDF4.Dataset("<in-memory>", mode="w", memory=0, format=fmt)
+    store = xr.backends.NetCDF4DataStore(ncfile)
+    dset_out.dump_to_store(store, unlimited_dims=unlimited_dims)
+    return ncfile
+
+
+def patch_netcdf_attributes(outfile, changes):
+    """Edits variable attributes of an existing NetCDF file in place
+
+    Only the attribute headers are rewritten; the data are not read.
+    Attributes are stored with the same types as `write_to_netcdf` uses.
+
+    Parameters
+    ----------
+    outfile : str, path-like
+        Path to NetCDF file
+    changes : dict
+        Attributes to set (dict) and names of attributes to delete (list),
+        as a tuple keyed by variable name
+    """
+    with netCDF4.Dataset(outfile, "a") as ncfile:
+        for var, (updates, deletions) in changes.items():
+            variable = ncfile.variables[var]
+            for name in deletions:
+                if name in variable.ncattrs():
+                    variable.delncattr(name)
+            for name, value in updates.items():
+                if isinstance(value, list) and all(isinstance(x, str) for x in value):
+                    variable.setncattr_string(name, value)
+                else:
+                    variable.setncattr(name, value)
+
+
+def round_trip_dataset(dset_out, time_dtype="float", packing=None, storage=None):
+    """Returns a dataset as it would be read back from `write_to_netcdf`
+
+    The same encodings are applied as when writing the file, and the
+    variables are then CF-encoded and decoded in memory, so fill values,
+    time units, packing and dtypes match a file written and reopened with
+    `xarray.open_dataset`, without any disk access.
+
+    Parameters
+    ----------
+    dset_out : xarray.Dataset
+        Dataset to encode; its variable encodings are updated in place
+    time_dtype : str, optional
+        Storage type of the time variables, "float" or "int",
+        by default "float"
+    packing : dict, optional
+        Packed int16 encodings keyed by variable name, see
+        `write_to_netcdf`, by default None
+    storage : dict, optional
+        Storage options, see `storage_encoding`; only the quantization
+        options affect the values, by default None
+
+    Returns
+    -------
+    xarray.Dataset
+        Decoded dataset
+    """
+
+    apply_encoding(dset_out, time_dtype=time_dtype, storage=storage, packing=packing)
+    variables, attrs = xr.conventions.encode_dataset_coordinates(dset_out)
+    variables, attrs = xr.conventions.cf_encoder(variables, attrs)
+    return xr.decode_cf(xr.Dataset(variables, attrs=attrs))
+
+
+def write_slabs_to_netcdf(
+    slabs,
+    outfile,
+    time_dtype="float",
+    storage=None,
+    packing=None,
+    checkpoint=None,
+    resume_from=0,
+):
+    """Writes consecutive time slabs of a dataset to a single NetCDF file
+
+    The file is created from the first slab with an unlimited `time`
+    dimension.  The time-dependent variables of each later slab are
+    encoded with the same rules as `write_to_netcdf` and appended in place
+    using netCDF4, so the full dataset is never held in memory.
+
+    Local files are written to `partial_path(outfile)` and renamed once
+    the last slab is written.  With a checkpoint key, the partial file is
+    flushed after every slab and the number of complete time levels is
+    recorded, see `write_checkpoint`, so an interrupted file can later be
+    continued with `resume_from`.
+
+    Parameters
+    ----------
+    slabs : iterable of xarray.Dataset
+        Datasets covering consecutive time levels, for example from
+        `generate_synthetic_slabs`
+    outfile : str, path-like
+        Path to output file
+    time_dtype : str, optional
+        Storage type of the time variables, "float" or "int",
+        by default "float"
+    storage : dict, optional
+        Compression and chunking options applied to every variable, see
+        `storage_encoding`, by default None
+    packing : dict, optional
+        Packed int16 encodings keyed by variable name, see
+        `write_to_netcdf`, by default None
+    checkpoint : str, optional
+        Key identifying the inputs of the file, recorded with the progress
+        of a local file, by default None (no checkpoints)
+    resume_from : int, optional
+        Number of time levels already in the partial file; `slabs` then
+        start at that time level, by default 0 (a new file)
+    """
+
+    slabs = iter(slabs)
+
+    if not is_url(outfile):
+        partial = partial_path(outfile)
+
+        def flush(ncfile, ntimes):
+            ncfile.sync()
+            write_checkpoint(outfile, checkpoint, ntimes)
+
+        on_slab = None if checkpoint is None else flush
+        if resume_from == 0:
+            discard_partial(outfile)
+            dset_out = next(slabs)
+            resume_from = len(dset_out["time"])
+            apply_encoding(
+                dset_out, time_dtype=time_dtype, storage=storage, packing=packing
+            )
+            write_encoded_netcdf(
+                dset_out, partial, unlimited_dims=["time"], storage=storage
+            )
+        with netCDF4.Dataset(partial, "a") as ncfile:
+            if on_slab is not None:
+                on_slab(ncfile, resume_from)
+            _append_slabs(
+                ncfile, slabs, resume_from, time_dtype, packing, storage, on_slab
+            )
+        commit_partial(outfile)
+        return
+
+    dset_out = next(slabs)
+    ntimes = len(dset_out["time"])
+
+    # the whole file is assembled in memory and sent in a single request
+    apply_encoding(dset_out, time_dtype=time_dtype, storage=storage, packing=packing)
+    ncfile = netcdf_in_memory(
+        dset_out, unlimited_dims=["time"], fmt=netcdf_engine(storage)[1]
+    )
+    try:
+        _append_slabs(ncfile, slabs, ntimes, time_dtype, packing, storage)
+    finally:
+        contents = ncfile.close()
+    write_bytes(outfile, contents)
+
+
+def _append_slabs(
+    ncfile,
+    slabs,
+    ntimes,
+    time_dtype="float",
+    packing=None,
+    storage=None,
+    on_slab=None,
+):
+    """Appends time slabs to an open NetCDF file holding `ntimes` levels
+
+    `on_slab(ncfile, ntimes)` is called after each slab is appended.
+    """
+    # values are written already encoded, as xarray does
+    ncfile.set_auto_maskandscale(False)
+    for dset_out in slabs:
+        apply_encoding(
+            dset_out, time_dtype=time_dtype, storage=storage, packing=packing
+        )
+        nslab = len(dset_out["time"])
+        for var in list(dset_out.variables):
+            dims = dset_out[var].dims
+            if "time" not in dims:
+                continue
+            encoded = xr.conventions.encode_cf_variable(
+                dset_out[var].variable, name=var
+            )
+            index = tuple(
+                slice(ntimes, ntimes + nslab) if x == "time" else slice(None)
+                for x in dims
+            )
+            ncfile.variables[var][index] = encoded.values
+        ntimes = ntimes + nslab
+        if on_slab is not None:
+            on_slab(ncfile, ntimes)
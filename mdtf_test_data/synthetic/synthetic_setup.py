@@ -2,13 +2,60 @@
 
 import warnings
 import xarray as xr
-import pkg_resources as pkgr
 
-__all__ = ["create_output_dirs", "synthetic_main"]
+__all__ = [
+    "build_variable",
+    "create_output_dirs",
+    "generate_task",
+    "generate_variable",
+    "generate_variables",
+    "group_variables",
+    "link_static_duplicates",
+    "output_path",
+    "packing_mode",
+    "quantize_storage",
+    "run_task",
+    "run_tasks",
+    "synthetic_main",
+    "synthetic_tasks",
+]
 """ Script to generate synthetic GFDL CM4 output """
+import functools
+import json
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from .synthetic_data import combine_datasets
+from .synthetic_data import data_range
 from .synthetic_data import generate_synthetic_dataset
+from .synthetic_data import generate_synthetic_slabs
+from .synthetic_data import packing_parameters
+from .synthetic_data import quantize_digits
+from .synthetic_data import quantize_option
+from .synthetic_data import patch_netcdf_attributes
+from .synthetic_data import stats_range
+from .synthetic_data import write_slabs_to_netcdf
 from .synthetic_data import write_to_netcdf
+from .context import get_context
+from mdtf_test_data.util.resources import resource_filename
+from .variable_spec import compile_variables
+from .checkpoint import read_checkpoint
+from .manifest import attribute_changes
+from .manifest import exists
+from .manifest import file_checksum
+from .manifest import is_up_to_date
+from .manifest import output_root
+from .manifest import read_manifest
+from .manifest import stable_hash
+from .manifest import task_record
+from .manifest import write_manifest
+from .pipeline import WritePipeline
+from .targets import copy_target
+from .targets import is_process_local
+from .targets import is_url
+from .targets import remove_target
+from .targets import resolve_output_url
 
 
 def generate_date_string(STARTYEAR=1, NYEARS=1, TIME_RES=""):
@@ -26,137 +73,1064 @@ def generate_date_string(STARTYEAR=1, NYEARS=1, TIME_RES=""):
     return date_string
 
 
-def create_output_dirs(CASENAME="", STARTYEAR=1, NYEARS=10, TIME_RES="day"):
-    """Create output data directories"""
+def member_casename(CASENAME="", MEMBER=1):
+    """Returns the case name of an ensemble member
+
+    The first member keeps the case name; later members of non-CMIP
+    conventions get an `.r<MEMBER>` suffix.  CMIP members are told apart
+    by the `r<MEMBER>` variant label instead.
+    """
+    if MEMBER == 1 or "cmip" in str.lower(CASENAME):
+        return CASENAME
+    return f"{CASENAME}.r{MEMBER}"
+
+
+def create_output_dirs(
+    CASENAME="", STARTYEAR=1, NYEARS=10, TIME_RES="day", MEMBER=1, OUTPUT_ROOT=""
+):
+    """Create output data directories, under OUTPUT_ROOT if given"""
     if "cmip" in str.lower(CASENAME):
         # formulate the date string in the file name
         date_string = generate_date_string(
             STARTYEAR=STARTYEAR, NYEARS=NYEARS, TIME_RES="day"
         )
         # output root directory and file name base must match
-        out_dir_root = f"{CASENAME.replace('.', '_')}_r1i1p1f1_gr1_{date_string}"
+        out_dir_root = f"{CASENAME.replace('.', '_')}_r{MEMBER}i1p1f1_gr1_{date_string}"
     else:
-        out_dir_root = CASENAME
+        out_dir_root = member_casename(CASENAME, MEMBER)
 
     print("Creating output data directories")
 
+    ncar = "ncar" in str.lower(out_dir_root)
+    out_dir_root = os.path.join(OUTPUT_ROOT, out_dir_root)
     if not os.path.exists(f"{out_dir_root}/day"):
         os.makedirs(f"{out_dir_root}/day")
     if not os.path.exists(f"{out_dir_root}/mon"):
         os.makedirs(f"{out_dir_root}/mon")
-    if "ncar" in str.lower(out_dir_root):
+    if ncar:
         if not os.path.exists(f"{out_dir_root}/3hr"):
             os.makedirs(f"{out_dir_root}/3hr")
         if not os.path.exists(f"{out_dir_root}/1hr"):
             os.makedirs(f"{out_dir_root}/1hr")
 
 
-def synthetic_main(
-    yaml_dict={},
+def output_path(
+    CASENAME="",
+    VARNAME="",
+    STARTYEAR=1,
+    NYEARS=10,
+    TIME_RES="",
+    DATA_FORMAT="",
+    OUTPUT_FORMAT="netcdf",
+    MEMBER=1,
+):
+    """Returns the output file path for a variable"""
+    extension = "zarr" if OUTPUT_FORMAT == "zarr" else "nc"
+    if DATA_FORMAT == "cmip":
+        # formulate the date string in the file name
+        date_string = generate_date_string(
+            STARTYEAR=STARTYEAR, NYEARS=NYEARS, TIME_RES="day"
+        )
+
+        outname = f"{CASENAME.replace('.','_')}_r{MEMBER}i1p1f1_gr1_{date_string}.{VARNAME}.{TIME_RES}.{extension}"
+        # output root directory and file name base must match
+        out_dir_root = f"{CASENAME.replace('.','_')}_r{MEMBER}i1p1f1_gr1_{date_string}"
+    else:
+        CASENAME = member_casename(CASENAME, MEMBER)
+        outname = f"{CASENAME}.{VARNAME}.{TIME_RES}.{extension}"
+        out_dir_root = CASENAME
+
+    return f"{out_dir_root}/{TIME_RES}/{outname}"
+
+
+@functools.lru_cache(maxsize=None)
+def _read_static_field(filename, variable):
+    """Reads a static field once per process"""
+    with xr.open_dataset(filename) as _ds:
+        return _ds[variable].values
+
+
+def _load_default_static():
+    """Function to read packaged static file"""
+    _ds = resource_filename("resources/ocean_static_5deg.nc")
+    return _read_static_field(_ds, "areacello").copy()
+
+
+def load_static_data(spec):
+    """Loads the ocean static field for a tripolar static variable
+
+    Static files are read once per process and cached.
+
+    Parameters
+    ----------
+    spec : VariableSpec
+        Variable description
+
+    Returns
+    -------
+    np.ndarray or None
+        Static data, or None if the variable is generated synthetically
+    """
+    if not (spec.static and spec.grid == "tripolar"):
+        return None
+
+    if spec.source is not None:
+        staticfilepath = spec.source["filename"]
+        if os.path.exists(staticfilepath):
+            return _read_static_field(staticfilepath, spec.source["variable"]).copy()
+        else:
+            raise ValueError(
+                f"Specified ocean static file does not exist: {staticfilepath}"
+            )
+    else:
+        warnings.warn("Using default 5-degree ocean static file for grid")
+        return _load_default_static()
+
+
+def packing_mode(spec, storage=None):
+    """Returns how a variable is packed: None, "stats" or "minmax"
+
+    Packed int16 output is scaled from the configured stats, or from the
+    data range for variables without normally distributed stats.
+    """
+    pack = (storage or {}).get("packing", None)
+    pack = None if pack in ["none", "None"] else pack
+    assert pack in [
+        None,
+        "stats",
+        "minmax",
+    ], f"Unknown packing mode `{pack}` for variable `{spec.name}`"
+    if pack == "stats" and (spec.stats is None or spec.generator != "normal"):
+        pack = "minmax"
+    return pack
+
+
+def quantize_storage(spec, storage=None):
+    """Resolves the "stats" quantization mode for one variable
+
+    With `quantize: stats`, a variable with normally distributed stats and
+    no explicit `least_significant_digit` or `keepbits` is rounded to the
+    digits returned by `quantize_digits`.  Returns the storage options with
+    that variable added to `least_significant_digit`.
+    """
+    mode = (storage or {}).get("quantize", None)
+    mode = None if mode in ["none", "None"] else mode
+    assert mode in [
+        None,
+        "stats",
+    ], f"Unknown quantization mode `{mode}` for variable `{spec.name}`"
+    if mode is None or spec.stats is None or spec.generator != "normal":
+        return storage
+    options = ["least_significant_digit", "keepbits"]
+    if any(quantize_option(storage, x, spec.name) is not None for x in options):
+        return storage
+    digits = quantize_digits(spec.stats_list)
+    if digits is None:
+        return storage
+    current = storage.get("least_significant_digit", None) or {}
+    return {**storage, "least_significant_digit": {**current, spec.name: digits}}
+
+
+def _write(writer, data, outfile, pipeline=None, **kwargs):
+    """Writes data here, or queues it on a write pipeline when one is given"""
+    if pipeline is None:
+        writer(data, outfile, **kwargs)
+    else:
+        pipeline.submit(writer, data, outfile, **kwargs)
+
+
+def build_variable(
+    spec,
     DLAT=20.0,
     DLON=20.0,
     STARTYEAR=1,
     NYEARS=10,
-    CASENAME="",
     TIME_RES="",
     DATA_FORMAT="",
+    COMPRESS=False,
+    STORAGE=None,
+    MEMBER=1,
 ):
-    """Main script to generate synthetic data using GFDL naming conventions"""
-    create_output_dirs(CASENAME, STARTYEAR=STARTYEAR, NYEARS=NYEARS)
-    # parse the yaml dictionary
-    var_names = yaml_dict["variables.name"]
-    # -- Create Data
-    print("Generating data")
-    for v in var_names:
-        static = (
-            yaml_dict[v + ".static"]
-            if str(v + ".static") in list(yaml_dict.keys())
-            else False
+    """Generates a whole variable in memory
+
+    Parameters
+    ----------
+    spec : VariableSpec
+        Variable description
+
+    The other parameters are the same as for `generate_variable`.
+
+    Returns
+    -------
+    tuple
+        The dataset, and its packed int16 encodings keyed by variable name
+        or None, see `write_to_netcdf`
+    """
+    context = get_context(
+        fmt=DATA_FORMAT,
+        timeres=TIME_RES,
+        grid=spec.grid,
+        dlon=DLON,
+        dlat=DLAT,
+        startyear=STARTYEAR,
+        nyears=NYEARS,
+    )
+    dset_out = generate_synthetic_dataset(
+        DLON,
+        DLAT,
+        STARTYEAR,
+        NYEARS,
+        spec.name,
+        timeres=TIME_RES,
+        attrs=dict(spec.attrs),
+        fmt=DATA_FORMAT,
+        generator=spec.generator,
+        stats=spec.stats_list,
+        static=spec.static,
+        coords=spec.coords,
+        data=load_static_data(spec),
+        generator_kwargs=dict(spec.generator_kwargs),
+        grid=spec.grid,
+        compress=COMPRESS,
+        context=context,
+        member=0 if spec.static else MEMBER - 1,
+    )
+
+    pack = packing_mode(spec, {**(STORAGE or {}), **(spec.encoding or {})})
+    packing = None
+    if pack == "stats":
+        packing = {spec.name: packing_parameters(*stats_range(spec.stats_list))}
+    elif pack == "minmax":
+        packing = {spec.name: packing_parameters(*data_range([dset_out], spec.name))}
+    return dset_out, packing
+
+
+def generate_variable(
+    spec,
+    outfile,
+    DLAT=20.0,
+    DLON=20.0,
+    STARTYEAR=1,
+    NYEARS=10,
+    TIME_RES="",
+    DATA_FORMAT="",
+    COMPRESS=False,
+    SLAB_SIZE=None,
+    STORAGE=None,
+    OUTPUT_FORMAT="netcdf",
+    THREADS=1,
+    MEMBER=1,
+    PIPELINE=None,
+    CHECKPOINT=None,
+    RESUME=False,
+    TIME_RANGE=None,
+):
+    """Generates a single variable and writes it to its own file
+
+    This is the unit of work for both the serial and the process pool
+    execution modes of `synthetic_main`.
+
+    Parameters
+    ----------
+    spec : VariableSpec
+        Variable description
+    outfile : str, path-like
+        Path to output file
+    SLAB_SIZE : int, optional
+        Generate and write time-dependent variables this many time levels
+        at a time, by default None (the whole variable in memory)
+    STORAGE : dict, optional
+        Compression and chunking options for the file, see
+        `storage_encoding`; the variable's own `encoding` options take
+        precedence, by default None
+    OUTPUT_FORMAT : str, optional
+        Output format, "netcdf" or "zarr", by default "netcdf"
+    THREADS : int, optional
+        Number of threads writing chunks of a Zarr store concurrently,
+        by default 1
+    MEMBER : int, optional
+        Ensemble member, numbered from 1; static variables are the same
+        for every member, by default 1
+    PIPELINE : WritePipeline, optional
+        Hand the data to this pipeline's writer process instead of writing
+        it here, by default None
+    CHECKPOINT : str, optional
+        Key identifying the inputs of the file; a local NetCDF file written
+        in slabs then records its progress, see `write_slabs_to_netcdf`,
+        by default None
+    RESUME : bool, optional
+        Continue the partial file of an interrupted run from its last
+        checkpoint with the same key, by default False
+    TIME_RANGE : tuple of int, optional
+        First and last + 1 time levels to write to a NetCDF file, one
+        piece of a variable split between shards, see `shards`; the
+        variable must be time-dependent, by default None (every time level)
+
+    Returns
+    -------
+    str
+        Path to output file
+    """
+    context = get_context(
+        fmt=DATA_FORMAT,
+        timeres=TIME_RES,
+        grid=spec.grid,
+        dlon=DLON,
+        dlat=DLAT,
+        startyear=STARTYEAR,
+        nyears=NYEARS,
+    )
+
+    storage = None
+    if STORAGE is not None or spec.encoding is not None:
+        storage = {**(STORAGE or {}), **(spec.encoding or {})}
+    storage = quantize_storage(spec, storage)
+
+    if OUTPUT_FORMAT == "zarr":
+        from .zarr_output import write_slabs_to_zarr
+
+        # Zarr stores are always written in slabs, one chunk per slab
+        if SLAB_SIZE is None:
+            chunks = (storage or {}).get("chunks", None) or {}
+            SLAB_SIZE = chunks.get("time", context.ntimes)
+
+    pack = packing_mode(spec, storage)
+    packing = None
+    if pack == "stats":
+        packing = {spec.name: packing_parameters(*stats_range(spec.stats_list))}
+    write_options = {"storage": storage}
+    if OUTPUT_FORMAT == "zarr":
+        write_options["threads"] = THREADS
+
+    if TIME_RANGE is not None:
+        assert not spec.static, f"Static variable `{spec.name}` has no time levels"
+        assert OUTPUT_FORMAT == "netcdf", "Time ranges are only written to NetCDF"
+        SLAB_SIZE = SLAB_SIZE or TIME_RANGE[1] - TIME_RANGE[0]
+
+    if SLAB_SIZE is not None and not spec.static:
+        make_slabs = functools.partial(
+            generate_synthetic_slabs,
+            DLON,
+            DLAT,
+            STARTYEAR,
+            NYEARS,
+            spec.name,
+            timeres=TIME_RES,
+            attrs=dict(spec.attrs),
+            fmt=DATA_FORMAT,
+            generator=spec.generator,
+            stats=spec.stats_list,
+            coords=spec.coords,
+            generator_kwargs=dict(spec.generator_kwargs),
+            grid=spec.grid,
+            compress=COMPRESS,
+            context=context,
+            slab_size=SLAB_SIZE,
+            member=MEMBER - 1,
         )
-        stats = (
-            yaml_dict[v + ".stats"]
-            if str(v + ".stats") in list(yaml_dict.keys())
-            else None
+        if pack == "minmax":
+            # an extra pass over the slabs; the generators are reproducible
+            vrange = data_range(make_slabs(), spec.name)
+            packing = {spec.name: packing_parameters(*vrange)}
+        start, stop = (0, None) if TIME_RANGE is None else TIME_RANGE
+        if OUTPUT_FORMAT == "zarr":
+            write_options["ntimes"] = context.ntimes
+            writer = write_slabs_to_zarr
+        else:
+            writer = write_slabs_to_netcdf
+            if CHECKPOINT is not None and TIME_RANGE is None and not is_url(outfile):
+                start = read_checkpoint(outfile, CHECKPOINT) if RESUME else 0
+                write_options["checkpoint"] = CHECKPOINT
+                write_options["resume_from"] = start
+                if start > 0:
+                    print(f"Resuming {outfile} at time level {start}")
+        _write(
+            writer,
+            make_slabs(start=start, stop=stop),
+            outfile,
+            PIPELINE,
+            packing=packing,
+            **write_options,
         )
-        generator = (
-            yaml_dict[v + ".generator.name"]
-            if str(v + ".generator.name") in list(yaml_dict.keys())
-            else "normal"
+        return outfile
+
+    dset_out, packing = build_variable(
+        spec,
+        DLAT=DLAT,
+        DLON=DLON,
+        STARTYEAR=STARTYEAR,
+        NYEARS=NYEARS,
+        TIME_RES=TIME_RES,
+        DATA_FORMAT=DATA_FORMAT,
+        COMPRESS=COMPRESS,
+        STORAGE=STORAGE,
+        MEMBER=MEMBER,
+    )
+
+    if OUTPUT_FORMAT == "zarr":
+        _write(
+            write_slabs_to_zarr,
+            [dset_out],
+            outfile,
+            PIPELINE,
+            packing=packing,
+            **write_options,
         )
-        generator_kwargs = (
-            yaml_dict[v + ".generator.args"]
-            if str(v + ".generator.args") in list(yaml_dict.keys())
-            else {}
+    else:
+        _write(
+            write_to_netcdf,
+            dset_out,
+            outfile,
+            PIPELINE,
+            packing=packing,
+            **write_options,
         )
-        grid = (
-            yaml_dict[v + ".grid"]
-            if str(v + ".grid") in list(yaml_dict.keys())
-            else "standard"
+
+    return outfile
+
+
+def generate_variables(
+    specs,
+    outfile,
+    DLAT=20.0,
+    DLON=20.0,
+    STARTYEAR=1,
+    NYEARS=10,
+    TIME_RES="",
+    DATA_FORMAT="",
+    COMPRESS=False,
+    STORAGE=None,
+    OUTPUT_FORMAT="netcdf",
+    THREADS=1,
+    MEMBER=1,
+    PIPELINE=None,
+):
+    """Generates several variables and writes them to one shared file
+
+    The variables share their coordinates, bounds and time axis, as in
+    CESM history files, and the file is written with a single call.  The
+    variables' `encoding` blocks only select their packing mode; the
+    compression, chunking and quantization options in STORAGE apply to
+    every variable.
+
+    Parameters
+    ----------
+    specs : list of VariableSpec
+        Variable descriptions, e.g. a group from `group_variables`
+    outfile : str, path-like
+        Path to output file
+
+    The other parameters are the same as for `generate_variable`.
+
+    Returns
+    -------
+    str
+        Path to output file
+    """
+    datasets = []
+    packing = {}
+    storage = STORAGE
+    for spec in specs:
+        dset_out, spec_packing = build_variable(
+            spec,
+            DLAT=DLAT,
+            DLON=DLON,
+            STARTYEAR=STARTYEAR,
+            NYEARS=NYEARS,
+            TIME_RES=TIME_RES,
+            DATA_FORMAT=DATA_FORMAT,
+            COMPRESS=COMPRESS,
+            STORAGE=STORAGE,
+            MEMBER=MEMBER,
         )
+        datasets.append(dset_out)
+        packing.update(spec_packing or {})
+        storage = quantize_storage(spec, storage)
+
+    dset_out = combine_datasets(datasets)
+    packing = packing if len(packing) > 0 else None
 
-        assert grid in [
-            "tripolar",
-            "standard",
-        ], f"Unknown grid `{grid}` specified for variable `{v}`"
+    if OUTPUT_FORMAT == "zarr":
+        from .zarr_output import write_slabs_to_zarr
 
-        coords = (
-            yaml_dict[v]["coordinates"]
-            if "coordinates" in yaml_dict[v].keys()
-            else None
+        _write(
+            write_slabs_to_zarr,
+            [dset_out],
+            outfile,
+            PIPELINE,
+            storage=storage,
+            threads=THREADS,
+            packing=packing,
+        )
+    else:
+        _write(
+            write_to_netcdf,
+            dset_out,
+            outfile,
+            PIPELINE,
+            storage=storage,
+            packing=packing,
         )
 
-        def _load_default_static():
-            """Function to read packaged static file"""
-            _ds = pkgr.resource_filename(
-                "mdtf_test_data", f"resources/ocean_static_5deg.nc"
-            )
-            return xr.open_dataset(_ds)["areacello"].values
-
-        # Load the ocean static file
-        if static and grid is "tripolar":
-            if str(v + ".source") in list(yaml_dict.keys()):
-                staticfilepath = yaml_dict[v + ".source.filename"]
-                if os.path.exists(staticfilepath):
-                    _ds = xr.open_dataset(staticfilepath)
-                    data = _ds[yaml_dict[v + ".source.variable"]].values
-                else:
-                    raise ValueError(
-                        f"Specified ocean static file does not exist: {staticfilepath}"
-                    )
-            else:
-                warnings.warn("Using default 5-degree ocean static file for grid")
-                data = _load_default_static()
+    return outfile
+
+
+def group_variables(specs):
+    """Groups variables that can share the coordinates of one file
+
+    Variables on the same grid, with the same number of levels and the
+    same scalar coordinate are grouped together, in configuration order.
+
+    Parameters
+    ----------
+    specs : list of VariableSpec
+        Variable descriptions
+
+    Returns
+    -------
+    list of tuples
+        Groups of variable specs
+    """
+    groups = {}
+    for spec in specs:
+        key = (spec.grid, spec.nlev, json.dumps(spec.coords, sort_keys=True))
+        groups.setdefault(key, []).append(spec)
+    return [tuple(x) for x in groups.values()]
+
+
+def link_output(source, outfile):
+    """Hard-links an output file, or copies it where links are not supported
+
+    Files at fsspec URLs are always copied.
+
+    Parameters
+    ----------
+    source : str, path-like
+        Existing output file or Zarr store
+    outfile : str, path-like
+        Path of the link, replaced if it exists
+    """
+    if is_url(outfile):
+        # object stores have no links
+        remove_target(outfile)
+        return copy_target(source, outfile)
+
+    if os.path.isdir(outfile):
+        shutil.rmtree(outfile)
+    elif os.path.lexists(outfile):
+        os.remove(outfile)
+    try:
+        if os.path.isdir(source):
+            shutil.copytree(source, outfile, copy_function=os.link)
         else:
-            data = None
+            os.link(source, outfile)
+    except OSError:
+        # e.g. a different file system, or one without hard links
+        if os.path.isdir(source):
+            shutil.rmtree(outfile, ignore_errors=True)
+            shutil.copytree(source, outfile)
+        else:
+            shutil.copy2(source, outfile)
 
-        dset_out = generate_synthetic_dataset(
-            DLON,
-            DLAT,
-            STARTYEAR,
-            NYEARS,
-            v,
-            timeres=TIME_RES,
-            attrs=yaml_dict[v + ".atts"],
-            fmt=DATA_FORMAT,
-            generator=generator,
-            stats=stats,
-            static=static,
-            coords=coords,
-            data=data,
-            generator_kwargs=generator_kwargs,
-            grid=grid,
+
+def generate_task(spec, outfile, RESUME=False, **kwargs):
+    """Writes the output of one task, see `synthetic_tasks`
+
+    The task holds one variable, a group of variables sharing a file, or
+    a link to the file of an identical static field.
+
+    Parameters
+    ----------
+    spec : VariableSpec or tuple of VariableSpec
+        Variable description, or the group of variables in a shared file
+    outfile : str, path-like
+        Path to output file
+    RESUME : bool, optional
+        Resume from the slab checkpoint of an interrupted run with the
+        same inputs, by default False
+    kwargs
+        Run parameters of the task, passed to `generate_variable`
+    """
+    source = kwargs.pop("LINK_TO", None)
+    if source is not None and exists(source):
+        return link_output(source, outfile)
+    if isinstance(spec, tuple):
+        kwargs.pop("SLAB_SIZE", None)
+        return generate_variables(spec, outfile, **kwargs)
+    pipeline = kwargs.pop("PIPELINE", None)
+    # slab checkpoints are only resumed by a task with the same inputs
+    checkpoint = stable_hash(task_record(spec, kwargs))
+    return generate_variable(
+        spec,
+        outfile,
+        PIPELINE=pipeline,
+        CHECKPOINT=checkpoint,
+        RESUME=RESUME,
+        **kwargs,
+    )
+
+
+def synthetic_tasks(
+    yaml_dict={},
+    DLAT=20.0,
+    DLON=20.0,
+    STARTYEAR=1,
+    NYEARS=10,
+    CASENAME="",
+    TIME_RES="",
+    DATA_FORMAT="",
+    COMPRESS=False,
+    SLAB_SIZE=None,
+    STORAGE=None,
+    OUTPUT_FORMAT="netcdf",
+    THREADS=1,
+    MULTI_VARIABLE=False,
+    MEMBER=1,
+    OUTPUT_URL=None,
+    CREATE_DIRS=True,
+):
+    """Creates the output directories and lists the work for one config
+
+    Parameters are the same as for `synthetic_main`, with MEMBER the
+    ensemble member, numbered from 1, to list.  Static variables of later
+    members are hard-linked to those of the first member.  Set CREATE_DIRS
+    to False to list the work without touching the file system.
+    Output paths are relative to the working directory, or to OUTPUT_URL,
+    see `synthetic_main`.
+    The configuration may be a parsed YAML mapping or a list of
+    `VariableSpec` objects from `compile_config`.
+
+    Returns
+    -------
+    list of tuples
+        (spec, outfile, kwargs) arguments to `generate_variable`, one per
+        variable; with MULTI_VARIABLE set, (specs, outfile, kwargs)
+        arguments to `generate_variables`, one per group of variables
+    """
+    root = "" if OUTPUT_URL is None else resolve_output_url(OUTPUT_URL)
+    if CREATE_DIRS and not is_url(root):
+        create_output_dirs(
+            CASENAME,
+            STARTYEAR=STARTYEAR,
+            NYEARS=NYEARS,
+            MEMBER=MEMBER,
+            OUTPUT_ROOT=root,
         )
+    # compile the yaml dictionary
+    if isinstance(yaml_dict, list):
+        specs = yaml_dict
+    else:
+        specs = compile_variables(yaml_dict)
 
-        if DATA_FORMAT == "cmip":
-            # formulate the date string in the file name
-            date_string = generate_date_string(
-                STARTYEAR=STARTYEAR, NYEARS=NYEARS, TIME_RES="day"
-            )
+    kwargs = dict(
+        DLAT=DLAT,
+        DLON=DLON,
+        STARTYEAR=STARTYEAR,
+        NYEARS=NYEARS,
+        TIME_RES=TIME_RES,
+        DATA_FORMAT=DATA_FORMAT,
+        COMPRESS=COMPRESS,
+    )
+    if SLAB_SIZE is not None:
+        kwargs["SLAB_SIZE"] = SLAB_SIZE
+    if STORAGE is not None:
+        kwargs["STORAGE"] = STORAGE
+    if OUTPUT_FORMAT != "netcdf":
+        kwargs["OUTPUT_FORMAT"] = OUTPUT_FORMAT
+        kwargs["THREADS"] = THREADS
+    if MEMBER != 1:
+        kwargs["MEMBER"] = MEMBER
+
+    # one file per group of variables, named by stream like CESM history files
+    if MULTI_VARIABLE:
+        groups = group_variables(specs)
+        names = [f"h{x}" for x in range(len(groups))]
+    else:
+        groups = specs
+        names = [spec.name for spec in specs]
+
+    def paths(name, MEMBER=1):
+        path = output_path(
+            CASENAME,
+            name,
+            STARTYEAR=STARTYEAR,
+            NYEARS=NYEARS,
+            TIME_RES=TIME_RES,
+            DATA_FORMAT=DATA_FORMAT,
+            OUTPUT_FORMAT=OUTPUT_FORMAT,
+            MEMBER=MEMBER,
+        )
+        return path if root == "" else f"{root}/{path}"
+
+    tasks = []
+    for spec, name in zip(groups, names):
+        outfile = paths(name, MEMBER=MEMBER)
+        if MEMBER != 1 and not isinstance(spec, tuple) and spec.static:
+            # static fields do not vary between members
+            tasks.append((spec, outfile, dict(kwargs, LINK_TO=paths(name))))
+        else:
+            tasks.append((spec, outfile, kwargs))
+
+    return tasks
+
+
+# run parameters that do not change the contents of a static variable's file
+STATIC_INVARIANT_PARAMS = [
+    "TIME_RES",
+    "STARTYEAR",
+    "NYEARS",
+    "MEMBER",
+    "SLAB_SIZE",
+    "THREADS",
+    "LINK_TO",
+]
+
+
+def _static_key(spec, kwargs):
+    """Returns a key identifying the contents of a static variable's file"""
+    if isinstance(spec, tuple) or not spec.static:
+        return None
+    params = {x: y for x, y in kwargs.items() if x not in STATIC_INVARIANT_PARAMS}
+    return json.dumps([spec.to_dict(), params], sort_keys=True, default=str)
+
+
+def link_static_duplicates(tasks):
+    """Links repeated static variables to their first occurrence
 
-            outname = f"{CASENAME.replace('.','_')}_r1i1p1f1_gr1_{date_string}.{v}.{TIME_RES}.nc"
-            # output root directory and file name base must match
-            out_dir_root = f"{CASENAME.replace('.','_')}_r1i1p1f1_gr1_{date_string}"
+    A static variable does not depend on the frequency, time axis or
+    ensemble member, so a variable with the same configuration and grid
+    that is listed for several frequencies or conventions produces the
+    same file each time.  Every repeat after the first becomes a link
+    task (LINK_TO), see `run_tasks`, instead of being generated again.
+
+    Parameters
+    ----------
+    tasks : list of tuples
+        Tasks from `synthetic_tasks`, for any number of configs
+
+    Returns
+    -------
+    list of tuples
+        The same tasks, with the repeated static variables linked
+    """
+    sources = {}
+    result = []
+    for spec, outfile, kwargs in tasks:
+        key = _static_key(spec, kwargs)
+        if key is not None and key not in sources:
+            sources[key] = kwargs.get("LINK_TO", outfile)
+        if key is not None and sources[key] != outfile:
+            kwargs = dict(kwargs, LINK_TO=sources[key])
+        result.append((spec, outfile, kwargs))
+    return result
+
+
+def run_task(spec, outfile, kwargs, resume=False):
+    """Writes the output of one task and returns its path and checksum
+
+    Parameters are those of `generate_task`, with the run parameters as
+    a dictionary so the task can be submitted to a process pool.
+
+    Returns
+    -------
+    tuple of str
+        Output file and its checksum, see `file_checksum`
+    """
+    generate_task(spec, outfile, RESUME=resume, **kwargs)
+    return (outfile, file_checksum(outfile))
+
+
+def _run_pipelined(tasks, depth, resume=False):
+    """Generates a list of tasks, writing them through one write pipeline
+
+    Returns a dictionary of checksums keyed by output file.
+    """
+    with WritePipeline(depth) as pipeline:
+        for spec, outfile, kwargs in tasks:
+            generate_task(spec, outfile, PIPELINE=pipeline, RESUME=resume, **kwargs)
+    return pipeline.checksums
+
+
+def run_tasks(
+    tasks,
+    JOBS=1,
+    FORCE=False,
+    PIPELINE_DEPTH=None,
+    RESUME=False,
+    EXECUTOR=None,
+    PLAN=None,
+    PRUNE=True,
+):
+    """Generates and writes the variables described by a list of tasks
+
+    With JOBS > 1, all tasks are sent to a single pool of worker processes,
+    regardless of which convention or frequency they belong to.  Each
+    worker keeps its own grid and time caches across tasks.
+
+    With PIPELINE_DEPTH set, each worker hands its datasets, or time slabs
+    when writing in slabs, to a dedicated writer process through a queue
+    of that depth, so the next variable or slab is generated while the
+    previous one is written.  The tasks are then divided between the
+    workers up front.
+
+    Tasks with a LINK_TO entry, the static fields of ensemble members
+    after the first, are hard links to the file of the first member.
+    They are made once every other task has finished, and again whenever
+    their source is regenerated.
+
+    Output paths may be fsspec URLs, see `synthetic_main`.  Files in the
+    memory:// filesystem only exist in the process that writes them, so
+    they are always written serially by the calling process.
+
+    A manifest in each output root records the inputs and checksum of
+    every file.  Files whose variable configuration, run parameters,
+    generator code and contents are unchanged are not regenerated, and
+    unless PRUNE is False, files of variables removed from a config are
+    deleted.  When only the
+    attributes of a NetCDF file's variables have changed, and none that
+    affect the encoding of the data, the file is patched in place, see
+    `attribute_changes`, instead of being regenerated.
+
+    Files are written under a temporary name and renamed once complete,
+    and the manifest is updated as each file is finished, so a run that
+    is interrupted keeps every complete file.  NetCDF files written in
+    slabs also checkpoint their last complete slab; with RESUME set, such
+    a partial file is continued from its checkpoint instead of being
+    started over, with the same values as an uninterrupted run.
+
+    Parameters
+    ----------
+    tasks : list of tuples
+        Tasks from `synthetic_tasks`
+    JOBS : int, optional
+        Number of worker processes, by default 1
+    FORCE : bool, optional
+        Regenerate every file regardless of the manifest, by default False
+    PIPELINE_DEPTH : int, optional
+        Maximum number of datasets or slabs waiting to be written by each
+        worker's writer process, by default None (no write pipeline)
+    RESUME : bool, optional
+        Continue partial files of an interrupted run from their last
+        checkpoint, by default False
+    EXECUTOR : concurrent.futures.Executor, optional
+        Pool of worker processes to generate the files with instead of
+        starting one for this call, e.g. to keep the workers' caches warm
+        across calls; JOBS is then ignored, by default None
+    PLAN : list of dict, optional
+        Plan of the same tasks from `planner.plan_tasks`, made with the
+        same FORCE; the files it found up to date or only in need of new
+        attributes are not checksummed again, by default None
+    PRUNE : bool, optional
+        Delete the files of variables missing from the tasks, i.e. removed
+        from their config; set it to False when the tasks cover only some
+        of the variables, by default True
+
+    Returns
+    -------
+    list of str
+        Paths to output files, in task order
+    """
+    roots = sorted(set(output_root(outfile) for _, outfile, _ in tasks))
+    manifests = {root: read_manifest(root) for root in roots}
+
+    if PLAN is not None:
+        planned = {x["outfile"]: x for x in PLAN}
+        pending = [x for x in tasks if not planned[x[1]]["up_to_date"]]
+    else:
+        pending = [
+            (spec, outfile, kwargs)
+            for spec, outfile, kwargs in tasks
+            if FORCE
+            or not is_up_to_date(manifests[output_root(outfile)], spec, outfile, kwargs)
+        ]
+
+    # remove outputs of variables that are no longer in the configs
+    current = set(outfile for _, outfile, _ in tasks)
+    time_res = set(
+        (output_root(outfile), kwargs["TIME_RES"]) for _, outfile, kwargs in tasks
+    )
+    for root, files in manifests.items() if PRUNE else []:
+        for relpath in list(files.keys()):
+            outfile = os.path.join(root, relpath)
+            if (
+                root,
+                files[relpath]["time_res"],
+            ) in time_res and outfile not in current:
+                print(f"Removing {outfile}")
+                if is_url(outfile):
+                    remove_target(outfile)
+                elif os.path.isdir(outfile):
+                    shutil.rmtree(outfile)
+                elif os.path.exists(outfile):
+                    os.remove(outfile)
+                del files[relpath]
+
+    # files in a process-local filesystem must be written by this process
+    parallel = JOBS > 1 or PIPELINE_DEPTH is not None or EXECUTOR is not None
+    if parallel and any(is_process_local(outfile) for _, outfile, _ in pending):
+        warnings.warn("Writing serially: memory:// output is local to this process")
+        JOBS, PIPELINE_DEPTH, EXECUTOR = 1, None, None
+
+    # files whose variables only changed in their attributes are patched
+    patched = {}
+    for spec, outfile, kwargs in [] if FORCE else pending:
+        if "LINK_TO" in kwargs:
+            continue
+        root = output_root(outfile)
+        if PLAN is not None:
+            changes = planned[outfile]["attribute_changes"]
         else:
-            outname = f"{CASENAME}.{v}.{TIME_RES}.nc"
-            out_dir_root = CASENAME
-        write_to_netcdf(dset_out, f"{out_dir_root}/{TIME_RES}/{outname}")
+            changes = attribute_changes(manifests[root], spec, outfile, kwargs)
+        if changes is not None:
+            print(f"Updating attributes of {outfile}")
+            patch_netcdf_attributes(outfile, changes)
+            patched[outfile] = file_checksum(outfile)
+            manifests[root][os.path.relpath(outfile, root)] = {
+                **task_record(spec, kwargs),
+                "checksum": patched[outfile],
+            }
+    regenerated = set(outfile for _, outfile, _ in pending)
+    pending = [x for x in pending if x[1] not in patched]
+
+    # links follow their source when it is regenerated
+    pending = pending + [
+        (spec, outfile, kwargs)
+        for spec, outfile, kwargs in tasks
+        if kwargs.get("LINK_TO", None) in regenerated and outfile not in regenerated
+    ]
+    links = [x for x in pending if "LINK_TO" in x[2]]
+    generated = [x for x in pending if "LINK_TO" not in x[2]]
+
+    print(f"Generating data ({len(pending)} of {len(tasks)} files out of date)")
+    records = {outfile: (spec, kwargs) for spec, outfile, kwargs in pending}
+
+    def record(checksums):
+        """Adds finished files to their manifests, which are saved at once"""
+        for outfile, checksum in checksums.items():
+            spec, kwargs = records[outfile]
+            root = output_root(outfile)
+            manifests[root][os.path.relpath(outfile, root)] = {
+                **task_record(spec, kwargs),
+                "checksum": checksum,
+            }
+        for root in set(output_root(x) for x in checksums.keys()):
+            write_manifest(root, manifests[root])
+
+    if PIPELINE_DEPTH is not None and len(generated) > 0:
+        jobs = min(JOBS, len(generated))
+        groups = [generated[x::jobs] for x in range(jobs)]
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [
+                    executor.submit(_run_pipelined, group, PIPELINE_DEPTH, RESUME)
+                    for group in groups
+                ]
+                for future in as_completed(futures):
+                    record(future.result())
+        else:
+            record(_run_pipelined(generated, PIPELINE_DEPTH, RESUME))
+    elif EXECUTOR is not None or (JOBS > 1 and len(generated) > 1):
+        executor = EXECUTOR or ProcessPoolExecutor(max_workers=JOBS)
+        try:
+            futures = [
+                executor.submit(run_task, spec, outfile, kwargs, RESUME)
+                for spec, outfile, kwargs in generated
+            ]
+            for future in as_completed(futures):
+                record(dict([future.result()]))
+        finally:
+            if EXECUTOR is None:
+                executor.shutdown()
+    else:
+        for spec, outfile, kwargs in generated:
+            record(dict([run_task(spec, outfile, kwargs, RESUME)]))
+
+    # static fields of later ensemble members, once their sources exist
+    for spec, outfile, kwargs in links:
+        record(dict([run_task(spec, outfile, kwargs)]))
+
+    for root, files in manifests.items():
+        write_manifest(root, files)
+
+    return [outfile for _, outfile, _ in tasks]
+
+
+def synthetic_main(
+    yaml_dict={},
+    DLAT=20.0,
+    DLON=20.0,
+    STARTYEAR=1,
+    NYEARS=10,
+    CASENAME="",
+    TIME_RES="",
+    DATA_FORMAT="",
+    COMPRESS=False,
+    JOBS=1,
+    FORCE=False,
+    SLAB_SIZE=None,
+    STORAGE=None,
+    OUTPUT_FORMAT="netcdf",
+    THREADS=1,
+    PIPELINE_DEPTH=None,
+    MULTI_VARIABLE=False,
+    ENSEMBLE=1,
+    OUTPUT_URL=None,
+    RESUME=False,
+):
+    """Main script to generate synthetic data using GFDL naming conventions
+
+    With JOBS > 1, variables are generated by a pool of worker processes.
+    Each worker receives only the compact variable description and writes
+    its own file; the output does not depend on the number of workers.
+    Files that the output manifest shows to be up to date are skipped
+    unless FORCE is set.  With SLAB_SIZE set, time-dependent variables are
+    generated and appended to their files SLAB_SIZE time levels at a time.
+    STORAGE sets the compression and chunk layout of every file, see
+    `storage_encoding`.  With OUTPUT_FORMAT set to "zarr", each variable is
+    written to a Zarr store whose chunks are written by THREADS threads.
+    With PIPELINE_DEPTH set, data are generated while a separate writer
+    process writes the previous variable or slab, see `run_tasks`.
+    With MULTI_VARIABLE set, the variables are written to a few shared
+    files, one per group from `group_variables`; SLAB_SIZE is ignored.
+    With ENSEMBLE > 1, ENSEMBLE members with distinct random seeds are
+    generated; their static fields are hard links to those of the first
+    member, see `member_casename` for their names.  Static variables
+    repeated across configs are linked likewise, see
+    `link_static_duplicates`.
+    Output is written under the working directory, or under OUTPUT_URL,
+    a local directory or any fsspec URL such as "memory://data" or
+    "s3://bucket/data".  NetCDF files bound for a URL are assembled in
+    memory and sent in a single request; Zarr stores are written through
+    fsspec directly.
+    With RESUME set, NetCDF files that an interrupted run was writing in
+    slabs are continued from their last checkpoint, see `run_tasks`.
+    """
+    assert ENSEMBLE >= 1, "Ensemble size must be at least 1"
+    tasks = []
+    for member in range(1, ENSEMBLE + 1):
+        tasks = tasks + synthetic_tasks(
+            yaml_dict,
+            DLAT=DLAT,
+            DLON=DLON,
+            STARTYEAR=STARTYEAR,
+            NYEARS=NYEARS,
+            CASENAME=CASENAME,
+            TIME_RES=TIME_RES,
+            DATA_FORMAT=DATA_FORMAT,
+            COMPRESS=COMPRESS,
+            SLAB_SIZE=SLAB_SIZE,
+            STORAGE=STORAGE,
+            OUTPUT_FORMAT=OUTPUT_FORMAT,
+            THREADS=THREADS,
+            MULTI_VARIABLE=MULTI_VARIABLE,
+            MEMBER=member,
+            OUTPUT_URL=OUTPUT_URL,
+        )
+    tasks = link_static_duplicates(tasks)
+    return run_tasks(
+        tasks,
+        JOBS=JOBS,
+        FORCE=FORCE,
+        PIPELINE_DEPTH=PIPELINE_DEPTH,
+        RESUME=RESUME,
+    )
@@ -0,0 +1,108 @@
+""" fsspec output targets for files written outside the local file system """
+
+__all__ = [
+    "copy_target",
+    "filesystem",
+    "is_process_local",
+    "is_url",
+    "remove_target",
+    "resolve_output_url",
+    "write_bytes",
+]
+
+import os
+
+# fsspec is only needed for output URLs; local paths never go through it
+try:
+    import fsspec
+except ImportError:
+    fsspec = None
+
+# filesystems whose contents are only visible to the process writing them
+PROCESS_LOCAL_PROTOCOLS = ["memory"]
+
+
+def is_url(path):
+    """Checks whether an output path is an fsspec URL such as memory://..."""
+    return "://" in str(path)
+
+
+def filesystem(url):
+    """Returns the fsspec filesystem and the path within it of a URL
+
+    Parameters
+    ----------
+    url : str
+        fsspec URL, e.g. "memory://ci/data" or "s3://bucket/data"
+
+    Returns
+    -------
+    tuple
+        The `fsspec.AbstractFileSystem` and the path of `url` in it
+    """
+    if fsspec is None:
+        raise ImportError(f"Please install `fsspec` to write output to {url}")
+    return fsspec.core.url_to_fs(str(url))
+
+
+def resolve_output_url(url):
+    """Returns the output root to use for an output URL or directory
+
+    Local URLs (file://...) and plain directories are returned as local
+    paths, so they are written directly; other URLs are returned without
+    a trailing slash.
+
+    Parameters
+    ----------
+    url : str
+        fsspec URL or local directory
+
+    Returns
+    -------
+    str
+        Local directory or fsspec URL
+    """
+    url = str(url)
+    if not is_url(url):
+        return url
+    fs, path = filesystem(url)
+    if "file" in fs.protocol or "local" in fs.protocol:
+        return path
+    return url.rstrip("/")
+
+
+def is_process_local(url):
+    """Checks whether files written to a URL are lost to other processes"""
+    if not is_url(url):
+        return False
+    protocol = str(url).split("://")[0]
+    return protocol in PROCESS_LOCAL_PROTOCOLS
+
+
+def write_bytes(url, data):
+    """Writes the whole contents of a file to a URL in a single request
+
+    Parameters
+    ----------
+    url : str
+        Destination fsspec URL
+    data : bytes or memoryview
+        File contents
+    """
+    fs, path = filesystem(url)
+    fs.makedirs(os.path.dirname(path), exist_ok=True)
+    fs.pipe_file(path, bytes(data))
+
+
+def copy_target(source, url):
+    """Copies a file or directory, such as a Zarr store, between URLs"""
+    fs, path = filesystem(url)
+    fs.makedirs(os.path.dirname(path), exist_ok=True)
+    fs.copy(filesystem(source)[1], path, recursive=True)
+
+
+def remove_target(url):
+    """Removes a file or directory at a URL if it exists"""
+    fs, path = filesystem(url)
+    if fs.exists(path):
+        fs.rm(path, recursive=True)
@@ -0,0 +1,355 @@
+""" Compiled, typed representation of the variable configuration files """
+
+__all__ = ["VariableSpec", "compile_config", "compile_variables", "load_yaml"]
+
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import yaml
+
+from mdtf_test_data.generators import GENERATORS
+
+try:
+    _YAML_LOADER = yaml.CSafeLoader
+except AttributeError:
+    _YAML_LOADER = yaml.SafeLoader
+
+# bump when the layout of VariableSpec changes to invalidate cached configs
+CACHE_VERSION = 3
+
+# environment variable references, in the syntax of EnvYAML
+_ENV_PATTERN = re.compile(
+    r"\$(?:(?P<escaped>\$|\d+)"
+    r"|\{(?P<braced>[^}|]*)(?:\|(?P<braced_default>[^}]*))?\}"
+    r"|(?P<named>[\w\-\.]+)(?:\|(?P<named_default>.*))?)"
+)
+_COMMENT_PATTERN = re.compile(r"^#.*\n", re.MULTILINE)
+
+# as for EnvYAML, unset variables are only an error without this variable
+ENV_STRICT_DISABLE = "ENVYAML_STRICT_DISABLE"
+
+
+class VariableSpec(object):
+    """Description of a single synthetic variable
+
+    Parameters
+    ----------
+    name : str
+        Variable name in output dataset
+    attrs : dict, optional
+        Variable attributes, by default None
+    stats : array-like, optional
+        Array statistics with shape (nlev, 2) of (mean, stddev) pairs,
+        by default None
+    generator : str, optional
+        Name of the synthetic data generator, by default "normal"
+    generator_kwargs : dict, optional
+        Extra arguments for the generator, by default None
+    grid : str, optional
+        Type of output grid, either "standard" or "tripolar",
+        by default "standard"
+    static : bool, optional
+        Flag denoting if variable is static, by default False
+    source : dict, optional
+        Static file `filename` and `variable` to read data from,
+        by default None
+    coords : dict, optional
+        Scalar coordinate with `name`, `value` and `atts` keys,
+        by default None
+    encoding : dict, optional
+        Storage options (compression, complevel, shuffle and chunks) that
+        override the run-wide options for this variable, by default None
+    """
+
+    __slots__ = (
+        "name",
+        "attrs",
+        "stats",
+        "generator",
+        "generator_kwargs",
+        "grid",
+        "static",
+        "source",
+        "coords",
+        "encoding",
+    )
+
+    def __init__(
+        self,
+        name,
+        attrs=None,
+        stats=None,
+        generator="normal",
+        generator_kwargs=None,
+        grid="standard",
+        static=False,
+        source=None,
+        coords=None,
+        encoding=None,
+    ):
+        assert grid in [
+            "tripolar",
+            "standard",
+        ], f"Unknown grid `{grid}` specified for variable `{name}`"
+        assert (
+            generator in GENERATORS
+        ), f"Unknown generator `{generator}` specified for variable `{name}`"
+
+        self.name = name
+        self.attrs = {} if attrs is None else dict(attrs)
+        self.stats = (
+            None if stats is None else np.atleast_2d(np.array(stats, dtype=np.float64))
+        )
+        self.generator = generator
+        self.generator_kwargs = (
+            {} if generator_kwargs is None else dict(generator_kwargs)
+        )
+        self.grid = grid
+        self.static = bool(static)
+        self.source = source
+        self.coords = coords
+        self.encoding = None if encoding is None else dict(encoding)
+
+    @classmethod
+    def from_config(cls, name, block):
+        """Builds a spec from a variable's block of a configuration file
+
+        Parameters
+        ----------
+        name : str
+            Variable name
+        block : dict
+            Parsed YAML block of the variable
+
+        Returns
+        -------
+        VariableSpec
+            Variable description
+        """
+        generator = block.get("generator", {}) or {}
+        source = block.get("source", None)
+        return cls(
+            name,
+            attrs=block["atts"],
+            stats=block.get("stats", None),
+            generator=generator.get("name", "normal"),
+            generator_kwargs=generator.get("args", {}),
+            grid=block.get("grid", "standard"),
+            static=block.get("static", False),
+            source=(
+                None
+                if source is None
+                else {"filename": source["filename"], "variable": source["variable"]}
+            ),
+            coords=block.get("coordinates", None),
+            encoding=block.get("encoding", None),
+        )
+
+    @property
+    def nlev(self):
+        """Number of vertical levels described by the statistics"""
+        return 1 if self.stats is None else self.stats.shape[0]
+
+    @property
+    def stats_list(self):
+        """Statistics as a list of (mean, stddev) tuples, or None"""
+        return None if self.stats is None else [tuple(x) for x in self.stats.tolist()]
+
+    def to_dict(self):
+        """Returns the spec as a plain, JSON-serializable dictionary"""
+        result = {x: getattr(self, x) for x in self.__slots__}
+        result["stats"] = None if self.stats is None else self.stats.tolist()
+        return result
+
+    def __eq__(self, other):
+        return isinstance(other, VariableSpec) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"VariableSpec(name={self.name!r}, grid={self.grid!r}, nlev={self.nlev})"
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            object.__setattr__(self, key, value)
+        if self.stats is not None:
+            self.stats = np.array(self.stats, dtype=np.float64)
+
+
+def compile_variables(config):
+    """Compiles a parsed configuration into a list of variable specs
+
+    Parameters
+    ----------
+    config : dict-like
+        Nested configuration mapping, e.g. from `load_yaml` or EnvYAML
+
+    Returns
+    -------
+    list of VariableSpec
+        One spec per variable, in configuration order
+    """
+    return [VariableSpec.from_config(v, config[v]) for v in config["variables"]["name"]]
+
+
+def _expand_env(text):
+    """Expands environment variable references as EnvYAML does
+
+    `$VAR` and `${VAR}` are replaced by the value of VAR, `${VAR|default}`
+    and `$VAR|default` fall back to the default when VAR is unset, and
+    `$$` is a literal `$`; `$` followed by digits is kept. Whole-line
+    comments are dropped first, so they may mention unset variables.
+    """
+
+    missing = []
+
+    def replace(match):
+        if match.group("escaped") is not None:
+            # `$$` is a literal `$`, `$1` and the like are kept as they are
+            return "$" if match.group("escaped") == "$" else match.group(0)
+        name = match.group("braced") or match.group("named")
+        default = match.group("braced_default")
+        default = match.group("named_default") if default is None else default
+        if name in os.environ:
+            return os.environ[name]
+        if default is not None:
+            return default
+        missing.append(name)
+        return match.group(0)
+
+    text = _ENV_PATTERN.sub(replace, _COMMENT_PATTERN.sub("", text))
+    if len(missing) > 0 and ENV_STRICT_DISABLE not in os.environ:
+        raise ValueError(
+            "Strict mode enabled, variables "
+            + ", ".join(f"${x}" for x in sorted(set(missing)))
+            + " are not defined!"
+        )
+    return text
+
+
+def load_yaml(file_name):
+    """Parses a YAML file with the C loader when available
+
+    Environment variables are expanded as by EnvYAML, which the
+    configurations were read with before: `$VAR`, `${VAR}`,
+    `${VAR|default}` and `$$` for a literal `$`. An unset variable
+    without a default is an error unless ENVYAML_STRICT_DISABLE is set in
+    the environment. Unlike EnvYAML, `.env` files are not read.
+
+    Parameters
+    ----------
+    file_name : str, path-like
+        Path to YAML file
+
+    Returns
+    -------
+    dict
+        Parsed configuration
+
+    Raises
+    ------
+    ValueError
+        If the file references an unset environment variable
+    """
+    with open(file_name, "r") as fhandle:
+        text = fhandle.read()
+    return yaml.load(_expand_env(text), Loader=_YAML_LOADER)
+
+
+def _cache_path(file_name):
+    """Returns the path of the compiled cache for a configuration file
+
+    Caches live in the user cache directory, named after the file and a
+    hash of its absolute path.
+    """
+    file_name = os.path.abspath(file_name)
+    cache_dir = os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+        "mdtf_test_data",
+    )
+    key = hashlib.sha256(file_name.encode("utf-8")).hexdigest()[0:16]
+    return os.path.join(cache_dir, f"{os.path.basename(file_name)}.{key}.json")
+
+
+def _read_cache(cache_file, file_name):
+    """Reads a compiled configuration cache, or returns {} if it is unusable"""
+    try:
+        with open(cache_file, "r") as fhandle:
+            cached = json.load(fhandle)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cached, dict) or cached.get("version") != CACHE_VERSION:
+        return {}
+    if cached.get("path") != os.path.abspath(file_name):
+        return {}
+    return cached
+
+
+def compile_config(file_name, use_cache=True):
+    """Reads and compiles a configuration file, using a cached compiled form
+
+    The cache is a JSON file in the user cache directory, keyed by the
+    path, modification time and size of the YAML file, falling back to a
+    hash of its contents when the modification time changed. It holds
+    plain data only, so a tampered cache can not run code. Files that
+    reference environment variables are not cached.
+
+    Parameters
+    ----------
+    file_name : str, path-like
+        Path to YAML configuration file
+    use_cache : bool, optional
+        Read and write the compiled cache, by default True
+
+    Returns
+    -------
+    list of VariableSpec
+        One spec per variable, in configuration order
+    """
+    with open(file_name, "rb") as fhandle:
+        raw = fhandle.read()
+    stat = os.stat(file_name)
+    use_cache = use_cache and b"$" not in raw
+
+    if use_cache:
+        cache_file = _cache_path(file_name)
+        digest = None
+        cached = _read_cache(cache_file, file_name)
+        if len(cached) > 0:
+            specs = [VariableSpec(**x) for x in cached["specs"]]
+            if (cached["mtime"], cached["size"]) == (stat.st_mtime_ns, len(raw)):
+                return specs
+            digest = hashlib.sha256(raw).hexdigest()
+            if cached["sha256"] == digest:
+                _write_cache(cache_file, file_name, specs, stat, raw, digest)
+                return specs
+
+    specs = compile_variables(load_yaml(file_name))
+    if use_cache:
+        _write_cache(cache_file, file_name, specs, stat, raw, digest)
+    return specs
+
+
+def _write_cache(cache_file, file_name, specs, stat, raw, digest=None):
+    """Writes a compiled configuration cache, skipping it if it can not be written"""
+    digest = hashlib.sha256(raw).hexdigest() if digest is None else digest
+    cached = {
+        "version": CACHE_VERSION,
+        "path": os.path.abspath(file_name),
+        "mtime": stat.st_mtime_ns,
+        "size": len(raw),
+        "sha256": digest,
+        "specs": [x.to_dict() for x in specs],
+    }
+    try:
+        os.makedirs(os.path.dirname(cache_file), mode=0o700, exist_ok=True)
+        with open(f"{cache_file}.tmp", "w") as fhandle:
+            json.dump(cached, fhandle)
+        os.replace(f"{cache_file}.tmp", cache_file)
+    except (OSError, TypeError, ValueError):
+        # unwritable cache directory, or values that JSON can not hold
+        pass
@@ -0,0 +1,267 @@
+""" Zarr output backend with concurrent chunk writes """
+
+__all__ = ["write_slabs_to_zarr", "write_to_zarr"]
+
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import xarray as xr
+
+from mdtf_test_data.synthetic.checkpoint import commit_partial
+from mdtf_test_data.synthetic.checkpoint import partial_path
+from mdtf_test_data.synthetic.synthetic_data import apply_encoding
+from mdtf_test_data.synthetic.synthetic_data import apply_quantization
+from mdtf_test_data.synthetic.targets import is_url
+
+try:
+    import zarr
+except ImportError:
+    warnings.warn("Unable to load `zarr`. Zarr output will not work.")
+
+
+def _zarr_major_version():
+    return int(zarr.__version__.split(".")[0])
+
+
+def _compressor(storage):
+    """Returns the Zarr compressor for a set of storage options, or None"""
+    compression = storage.get("compression", None)
+    if compression in [None, "none", "None"]:
+        return None
+    assert compression in [
+        "zlib",
+        "zstd",
+    ], f"Compression codec `{compression}` is not supported for Zarr output"
+
+    clevel = storage.get("complevel", None)
+    clevel = 5 if clevel is None else int(clevel)
+    shuffle = bool(storage.get("shuffle", True))
+
+    if _zarr_major_version() >= 3:
+        return zarr.codecs.BloscCodec(
+            cname=compression,
+            clevel=clevel,
+            shuffle="shuffle" if shuffle else "noshuffle",
+        )
+
+    import numcodecs
+
+    return numcodecs.Blosc(
+        cname=compression,
+        clevel=clevel,
+        shuffle=numcodecs.Blosc.SHUFFLE if shuffle else numcodecs.Blosc.NOSHUFFLE,
+    )
+
+
+def _apply_zarr_storage(dset_out, storage=None, tchunk=None):
+    """Sets the Zarr chunk and compressor encoding of every variable
+
+    Parameters
+    ----------
+    dset_out : xarray.Dataset
+        Dataset whose variable encodings are updated in place
+    storage : dict, optional
+        Storage options, see `storage_encoding`, by default None
+    tchunk : int, optional
+        Chunk size along `time`, by default None (a single chunk)
+    """
+    storage = {} if storage is None else storage
+    chunks = dict(storage.get("chunks", None) or {})
+    if tchunk is not None:
+        chunks["time"] = tchunk
+    compressor = _compressor(storage)
+
+    for var in list(dset_out.variables):
+        variable = dset_out[var].variable
+        if len(variable.dims) == 0:
+            continue
+        variable.encoding["chunks"] = tuple(
+            max(1, int(chunks.get(dim, size))) if dim != "time" else chunks["time"]
+            for dim, size in zip(variable.dims, variable.shape)
+        )
+        if compressor is not None:
+            if _zarr_major_version() >= 3:
+                variable.encoding["compressors"] = (compressor,)
+            else:
+                variable.encoding["compressor"] = compressor
+
+
+def _time_variables(dset_out):
+    """Names of the variables that have a time dimension"""
+    return [x for x in dset_out.variables if "time" in dset_out[x].dims]
+
+
+def _resize_time(store, dset_out, ntimes):
+    """Extends the time dimension of every time-dependent array in a store"""
+    group = zarr.open_group(store, mode="r+")
+    for var in _time_variables(dset_out):
+        array = group[var]
+        axis = dset_out[var].dims.index("time")
+        shape = list(array.shape)
+        shape[axis] = ntimes
+        array.resize(tuple(shape))
+    zarr.consolidate_metadata(store)
+
+
+def _write_region(dset_out, store, start, time_dtype, packing=None, storage=None):
+    """Writes the time-dependent variables of a slab into an existing store"""
+    apply_quantization(dset_out, storage)
+    apply_encoding(dset_out, time_dtype=time_dtype, packing=packing)
+    tvars = _time_variables(dset_out)
+    region = dset_out[tvars]
+    region = region.drop_vars([x for x in region.variables if x not in tvars])
+    nslab = len(dset_out["time"])
+    region.to_zarr(store, mode="r+", region={"time": slice(start, start + nslab)})
+
+    # index coordinates are skipped by region writes, so write time directly
+    encoded = xr.conventions.encode_cf_variable(dset_out["time"].variable, name="time")
+    zarr.open_array(store, path="time", mode="r+")[
+        start : start + nslab
+    ] = encoded.values
+
+
+def write_slabs_to_zarr(
+    slabs,
+    store,
+    ntimes=None,
+    time_dtype="float",
+    storage=None,
+    threads=1,
+    packing=None,
+):
+    """Writes consecutive time slabs of a dataset to a Zarr store
+
+    The store is created from the first slab, with one Zarr chunk along
+    `time` per slab, and the time-dependent arrays are then resized to the
+    full length.  The remaining slabs cover separate chunks, so they are
+    written concurrently by a pool of threads while the next slabs are
+    being generated.  CF attributes and time encoding follow the same
+    rules as `write_to_netcdf`.  Local stores are written to
+    `partial_path(store)` and renamed once complete.
+
+    Parameters
+    ----------
+    slabs : iterable of xarray.Dataset
+        Datasets covering consecutive time levels; all but the last must
+        have the same length along `time`
+    store : str, path-like
+        Path to output Zarr store
+    ntimes : int, optional
+        Total number of time levels, by default None (the first slab holds
+        the whole dataset)
+    time_dtype : str, optional
+        Storage type of the time variables, "float" or "int",
+        by default "float"
+    storage : dict, optional
+        Compression and chunking options, see `storage_encoding`,
+        by default None
+    threads : int, optional
+        Number of concurrent chunk writers, by default 1
+    packing : dict, optional
+        Packed int16 encodings keyed by variable name, see
+        `write_to_netcdf`, by default None
+    """
+
+    target = store if is_url(store) else partial_path(store)
+    with warnings.catch_warnings():
+        # consolidated metadata is what lets xarray open a store with a single
+        # read; zarr-python 3 warns on every write that it is not yet part of
+        # the v3 spec
+        warnings.filterwarnings(
+            "ignore", message="Consolidated metadata", category=UserWarning
+        )
+        _write_slabs(slabs, target, ntimes, time_dtype, storage, threads, packing)
+    if not is_url(store):
+        commit_partial(store)
+
+
+def _write_slabs(slabs, store, ntimes, time_dtype, storage, threads, packing):
+    """Writes the slabs of `write_slabs_to_zarr` to a store in place"""
+    slabs = iter(slabs)
+    dset_out = next(slabs)
+    tchunk = len(dset_out["time"]) if "time" in dset_out.dims else None
+
+    apply_quantization(dset_out, storage)
+    apply_encoding(dset_out, time_dtype=time_dtype, packing=packing)
+    _apply_zarr_storage(dset_out, storage, tchunk=tchunk)
+    dset_out.to_zarr(store, mode="w")
+
+    if tchunk is None or ntimes is None or ntimes == tchunk:
+        return
+    _resize_time(store, dset_out, ntimes)
+
+    # at most `threads` slabs are held in memory while waiting to be written
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = []
+        start = tchunk
+        for dset_out in slabs:
+            if len(pending) >= threads:
+                pending.pop(0).result()
+            pending.append(
+                executor.submit(
+                    _write_region,
+                    dset_out,
+                    store,
+                    start,
+                    time_dtype,
+                    packing,
+                    storage,
+                )
+            )
+            start = start + len(dset_out["time"])
+        for future in pending:
+            future.result()
+
+    assert start == ntimes, f"Wrote {start} of {ntimes} time levels to {store}"
+
+
+def write_to_zarr(
+    dset_out,
+    store,
+    time_dtype="float",
+    storage=None,
+    threads=1,
+    slab_size=None,
+    packing=None,
+):
+    """Writes an xarray dataset to a Zarr store with proper encodings
+
+    Parameters
+    ----------
+    dset_out : xarray.Dataset
+        xarray dataset to write
+    store : str, path-like
+        Path to output Zarr store
+    time_dtype : str, optional
+        Storage type of the time variables, "float" or "int",
+        by default "float"
+    storage : dict, optional
+        Compression and chunking options, see `storage_encoding`,
+        by default None
+    threads : int, optional
+        Number of concurrent chunk writers, by default 1
+    slab_size : int, optional
+        Chunk size along `time`, by default None (the `time` entry of the
+        storage chunks, or a single chunk)
+    packing : dict, optional
+        Packed int16 encodings keyed by variable name, see
+        `write_to_netcdf`, by default None
+    """
+    if "time" not in dset_out.dims:
+        return write_slabs_to_zarr([dset_out], store, storage=storage, packing=packing)
+
+    ntimes = len(dset_out["time"])
+    chunks = (storage or {}).get("chunks", None) or {}
+    slab_size = chunks.get("time", ntimes) if slab_size is None else slab_size
+    slabs = (
+        dset_out.isel(time=slice(x, x + slab_size)) for x in range(0, ntimes, slab_size)
+    )
+    write_slabs_to_zarr(
+        slabs,
+        store,
+        ntimes=ntimes,
+        time_dtype=time_dtype,
+        storage=storage,
+        threads=threads,
+        packing=packing,
+    )
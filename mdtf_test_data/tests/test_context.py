@@ -0,0 +1,67 @@
+import pytest
+
+import xarray as xr
+
+from mdtf_test_data.synthetic import SyntheticContext
+from mdtf_test_data.synthetic import generate_synthetic_dataset
+from mdtf_test_data.synthetic import get_context
+from mdtf_test_data.synthetic.context import CACHE_SIZE
+from mdtf_test_data.synthetic.context import clear_caches
+from mdtf_test_data.synthetic.context import horizontal_grid
+
+
+@pytest.mark.parametrize(
+    "fmt,grid,nlev",
+    [("ncar", "standard", 1), ("gfdl", "standard", 19), ("cmip", "tripolar", 35)],
+)
+def test_synthetic_context_matches_standalone(fmt, grid, nlev):
+    stats = [(10.0, 1.0) for x in range(0, nlev)]
+    kwargs = dict(timeres="mon", attrs={"units": "K"}, fmt=fmt, grid=grid)
+    context = SyntheticContext(
+        fmt=fmt, timeres="mon", grid=grid, dlon=60, dlat=30, startyear=1, nyears=1
+    )
+    standalone = generate_synthetic_dataset(
+        60, 30, 1, 1, "dummy", stats=stats, **kwargs
+    )
+    shared = generate_synthetic_dataset(
+        60, 30, 1, 1, "dummy", stats=stats, context=context, **kwargs
+    )
+    assert shared.identical(standalone)
+
+    # a second variable must not modify the cached template
+    generate_synthetic_dataset(
+        60, 30, 1, 1, "other", stats=stats, context=context, **kwargs
+    )
+    assert "other" not in context.template(nlev=nlev).variables
+    assert "dummy" not in context.template(nlev=nlev).variables
+
+
+def test_synthetic_context_static():
+    context = SyntheticContext(fmt="cmip", grid="standard", dlon=20, dlat=20)
+    result = generate_synthetic_dataset(
+        20, 20, 1, 1, "areacella", fmt="cmip", static=True, context=context
+    )
+    assert "time" not in result.dims
+    assert result.areacella.dims == ("lat", "lon")
+    assert isinstance(context.time, xr.DataArray)
+    assert context.ntimes == 12
+
+
+def test_get_context_cache():
+    clear_caches()
+    context = get_context(dlon=60.0, dlat=30.0)
+    assert get_context(dlon=60.0, dlat=30.0) is context
+
+    # the caches are bounded
+    for startyear in range(1, CACHE_SIZE + 2):
+        get_context(dlon=60.0, dlat=30.0, startyear=startyear)
+    assert get_context.cache_info().currsize == CACHE_SIZE
+    assert get_context(dlon=60.0, dlat=30.0) is not context
+
+    grid = horizontal_grid("standard", "ncar", 60.0, 30.0)
+    assert horizontal_grid("standard", "ncar", 60.0, 30.0) is grid
+    assert grid.sizes["lat"] == 6
+
+    clear_caches()
+    assert get_context.cache_info().currsize == 0
+    assert horizontal_grid.cache_info().currsize == 0
@@ -0,0 +1,95 @@
+import netCDF4
+import pytest
+
+import xarray as xr
+
+from mdtf_test_data.synthetic import generate_synthetic_dataset
+from mdtf_test_data.synthetic import synthetic_data
+from mdtf_test_data.synthetic import write_to_netcdf
+from mdtf_test_data.synthetic.synthetic_data import generate_synthetic_slabs
+from mdtf_test_data.synthetic.synthetic_data import netcdf_engine
+from mdtf_test_data.synthetic.synthetic_data import storage_encoding
+from mdtf_test_data.synthetic.synthetic_data import write_slabs_to_netcdf
+from mdtf_test_data.util.cli import storage_options
+
+ARGS = (20.0, 20.0, 1, 2, "tas")
+KWARGS = dict(attrs={"units": "K", "missing_value": 1.0e20}, stats=[(280.0, 10.0)])
+
+
+def test_netcdf_engine():
+    assert netcdf_engine() == (None, None)
+    assert netcdf_engine({"engine": "scipy"}) == ("scipy", "NETCDF3_64BIT")
+    assert netcdf_engine({"format": "NETCDF3_CLASSIC"}) == (None, "NETCDF3_CLASSIC")
+    with pytest.raises(AssertionError):
+        netcdf_engine({"engine": "scipy", "format": "NETCDF4"})
+    with pytest.raises(AssertionError):
+        netcdf_engine({"engine": "h5netcdf", "format": "NETCDF4_CLASSIC"})
+
+    dset = generate_synthetic_dataset(*ARGS, **KWARGS)
+    with pytest.raises(AssertionError):
+        storage_encoding(dset["tas"], {"engine": "scipy", "compression": "zlib"})
+    with pytest.raises(AssertionError):
+        storage_encoding(dset["tas"], {"engine": "h5netcdf", "compression": "zstd"})
+
+    assert storage_options(engine="h5netcdf", chunk_cache=1024) == {
+        "engine": "h5netcdf",
+        "chunk_cache": 1024,
+    }
+    assert storage_options(nc_format="NETCDF3_CLASSIC") == {"format": "NETCDF3_CLASSIC"}
+
+
+def test_netcdf_engine_chunk_cache(monkeypatch):
+    storage = {"engine": "h5netcdf", "chunk_cache": 1024}
+    monkeypatch.setattr(synthetic_data, "_h5py_file_options", lambda: False)
+    with pytest.raises(AssertionError, match="upgrade xarray"):
+        netcdf_engine(storage)
+    # the netCDF4 library cache does not depend on xarray
+    assert netcdf_engine({"chunk_cache": 1024}) == (None, None)
+
+
+@pytest.mark.parametrize(
+    "storage,data_model",
+    [
+        ({"chunk_cache": 2**20}, "NETCDF4"),
+        ({"engine": "h5netcdf"}, "NETCDF4"),
+        (
+            {"engine": "h5netcdf", "compression": "zlib", "chunk_cache": 2**20},
+            "NETCDF4",
+        ),
+        ({"engine": "scipy"}, "NETCDF3_64BIT_OFFSET"),
+        ({"format": "NETCDF3_CLASSIC"}, "NETCDF3_CLASSIC"),
+    ],
+)
+def test_write_to_netcdf_engines(tmp_path, storage, data_model):
+    engine = storage.get("engine", None)
+    if engine is not None:
+        pytest.importorskip(engine)
+    cache = netCDF4.get_chunk_cache()
+
+    dset = generate_synthetic_dataset(*ARGS, **KWARGS)
+    write_to_netcdf(dset.copy(deep=True), tmp_path / "default.nc")
+    write_to_netcdf(dset.copy(deep=True), tmp_path / "engine.nc", storage=storage)
+
+    assert netCDF4.get_chunk_cache() == cache
+    with netCDF4.Dataset(tmp_path / "engine.nc") as ncfile:
+        assert ncfile.data_model == data_model
+    default = xr.open_dataset(tmp_path / "default.nc", decode_times=False)
+    written = xr.open_dataset(tmp_path / "engine.nc", decode_times=False)
+    assert default.identical(written)
+    default.close()
+    written.close()
+
+
+def test_write_slabs_scipy(tmp_path):
+    pytest.importorskip("scipy")
+    storage = {"engine": "scipy"}
+    dset = generate_synthetic_dataset(*ARGS, **KWARGS)
+    write_to_netcdf(dset, tmp_path / "full.nc", storage=storage)
+    slabs = generate_synthetic_slabs(*ARGS, slab_size=5, **KWARGS)
+    write_slabs_to_netcdf(slabs, tmp_path / "slabs.nc", storage=storage)
+
+    full = xr.open_dataset(tmp_path / "full.nc", decode_times=False)
+    slabs = xr.open_dataset(tmp_path / "slabs.nc", decode_times=False)
+    assert full.identical(slabs)
+    full.close()
+    slabs.close()
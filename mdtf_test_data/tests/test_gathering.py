@@ -0,0 +1,47 @@
+import os
+import pytest
+
+import numpy as np
+import xarray as xr
+
+from mdtf_test_data.synthetic import generate_synthetic_dataset
+from mdtf_test_data.synthetic import write_to_netcdf
+from mdtf_test_data.synthetic import gather_wet_points
+from mdtf_test_data.synthetic import scatter_wet_points
+from mdtf_test_data.synthetic.horizontal import construct_tripolar_grid
+
+
+def test_gather_wet_points():
+    grid = construct_tripolar_grid(retain_coords=True)
+    dset = xr.Dataset()
+    data = np.random.normal(0.0, 1.0, (3,) + grid.wet.shape)
+    dset["dummy"] = xr.DataArray(data, dims=("time", "yh", "xh")) * grid.mask
+    result = gather_wet_points(dset, grid.wet)
+    assert result.dummy.dims == ("time", "landpoint")
+    assert result.landpoint.attrs["compress"] == "yh xh"
+    assert len(result.landpoint) == 1640
+    assert not np.isnan(result.dummy.values).any()
+    restored = scatter_wet_points(result)
+    assert restored.dummy.dims == ("time", "yh", "xh")
+    assert np.allclose(restored.dummy.to_masked_array(), dset.dummy.to_masked_array())
+
+
+@pytest.mark.parametrize("fmt", ["ncar", "cmip"])
+def test_generate_synthetic_dataset_gathered(fmt):
+    kwargs = dict(
+        timeres="mon", attrs={"units": "m"}, fmt=fmt, grid="tripolar", stats=(1.0, 1.0)
+    )
+    full = generate_synthetic_dataset(None, None, 1, 1, "zos", **kwargs)
+    result = generate_synthetic_dataset(
+        None, None, 1, 1, "zos", compress=True, **kwargs
+    )
+    assert result.zos.dims == ("time", "landpoint")
+
+    outfile = ".pytest.gathered.out.nc"
+    if os.path.exists(outfile):
+        os.remove(outfile)
+    write_to_netcdf(result, outfile)
+    restored = scatter_wet_points(xr.open_dataset(outfile, use_cftime=True))
+    assert np.allclose(restored.zos.to_masked_array(), full.zos.to_masked_array())
+    restored.close()
+    os.remove(outfile)
@@ -1,11 +1,13 @@
 import numpy as np
 import pytest
 import mdtf_test_data.generators as generators
+from mdtf_test_data.synthetic import VariableSpec
+from mdtf_test_data.synthetic import generate_synthetic_dataset
 
 
 def test_generate_random_array_normal():
     stats = [(5.0, 10.0), (50.0, 100.0)]
-    generator = generators.__dict__["normal"]
+    generator = generators.GENERATORS["normal"]
     generator_kwargs = {"stats": stats}
     result = generators.generate_random_array(
         (20, 20), 5, generator=generator, generator_kwargs=generator_kwargs
@@ -30,7 +32,7 @@ def test_generate_random_array_normal():
     ],
 )
 def test_generate_random_array_convective(varname, expected):
-    generator = generators.__dict__["convective"]
+    generator = generators.GENERATORS["convective"]
     generator_kwargs = {"varname": varname}
     result = generators.generate_random_array(
         (20, 20), 5, generator=generator, generator_kwargs=generator_kwargs
@@ -38,3 +40,26 @@ def test_generate_random_array_convective(varname, expected):
     print(varname, result.sum())
     assert result.shape == (5, 20, 20)
     assert np.allclose(result.sum(), expected)
+
+
+def test_generate_random_array_normal_slabs():
+    generator = generators.GENERATORS["normal"]
+    assert generators.supports_slabs(generator)
+    assert not generators.supports_slabs(generators.GENERATORS["convective"])
+    stats = {"stats": [(5.0, 10.0)]}
+    full = generators.generate_random_array(
+        (20, 20), 5, generator=generator, generator_kwargs=stats
+    )
+    slab = generators.generate_random_array(
+        (20, 20), 2, generator=generator, generator_kwargs={**stats, "tstart": 3}
+    )
+    assert np.array_equal(full[3:5], slab)
+
+
+@pytest.mark.parametrize("name", ["inspect", "supports_slabs", "np"])
+def test_unknown_generator(name):
+    assert sorted(generators.GENERATORS) == ["convective", "normal"]
+    with pytest.raises(AssertionError, match="Unknown generator"):
+        VariableSpec("dummy", generator=name)
+    with pytest.raises(AssertionError, match="Unknown generator"):
+        generate_synthetic_dataset(20.0, 20.0, 1, 1, "dummy", generator=name)
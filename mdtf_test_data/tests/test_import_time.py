@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import mdtf_test_data
+
+PACKAGE_ROOT = os.path.dirname(mdtf_test_data.__path__[0])
+SCRIPT = os.path.join(PACKAGE_ROOT, "scripts", "mdtf_synthetic.py")
+
+# modules that are slow to import and are not needed until data is generated
+HEAVY_MODULES = ["xarray", "numpy", "cftime", "netCDF4", "pkg_resources", "xesmf"]
+
+
+def import_times(args):
+    """Runs python with `-X importtime` and returns the modules it imported
+
+    Returns a dictionary of cumulative import times in microseconds keyed by
+    top-level module name.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [PACKAGE_ROOT] + [x for x in [env.get("PYTHONPATH")] if x]
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env=env,
+        universal_newlines=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip().split(".")[0]
+        times[name] = max(times.get(name, 0), int(cumulative))
+    return times
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "import mdtf_test_data",
+        "import mdtf_test_data.synthetic",
+        "import mdtf_test_data.util",
+    ],
+)
+def test_package_import_is_lazy(statement):
+    times = import_times(["-c", statement])
+    assert "mdtf_test_data" in times
+    assert [x for x in HEAVY_MODULES if x in times] == []
+
+
+@pytest.mark.skipif(not os.path.exists(SCRIPT), reason="driver script not found")
+def test_cli_help_import_time():
+    times = import_times([SCRIPT, "--help"])
+    assert [x for x in HEAVY_MODULES if x in times] == []
+
+
+def test_lazy_attributes():
+    import mdtf_test_data.synthetic as synthetic
+
+    assert callable(synthetic.generate_synthetic_dataset)
+    assert synthetic.time.generate_monthly_time_axis is not None
+    assert "compile_config" in dir(synthetic)
+    with pytest.raises(AttributeError):
+        synthetic.not_a_function
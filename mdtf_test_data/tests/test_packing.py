@@ -0,0 +1,71 @@
+import netCDF4
+import numpy as np
+import pytest
+
+import xarray as xr
+
+from mdtf_test_data.synthetic import generate_synthetic_dataset
+from mdtf_test_data.synthetic import write_to_netcdf
+from mdtf_test_data.synthetic.synthetic_data import data_range
+from mdtf_test_data.synthetic.synthetic_data import generate_synthetic_slabs
+from mdtf_test_data.synthetic.synthetic_data import packing_parameters
+from mdtf_test_data.synthetic.synthetic_data import stats_range
+from mdtf_test_data.synthetic.synthetic_data import write_slabs_to_netcdf
+from mdtf_test_data.util.cli import storage_options
+
+ARGS = (20.0, 20.0, 1, 2, "tas")
+KWARGS = dict(attrs={"units": "K", "missing_value": 1.0e20}, stats=[(280.0, 10.0)])
+
+
+def test_packing_parameters():
+    assert stats_range([(280.0, 10.0), (250.0, 5.0)], nsigma=2.0) == (240.0, 300.0)
+    packing = packing_parameters(240.0, 300.0)
+    assert packing["dtype"] == "int16"
+    assert packing["add_offset"] == 270.0
+    assert packing["scale_factor"] == pytest.approx(60.0 / 65534.0)
+    assert packing["_FillValue"] == -32768
+    assert packing_parameters(1.0, 1.0)["scale_factor"] == 1.0
+    assert storage_options(packing="minmax") == {"packing": "minmax"}
+    assert storage_options(packing="none") is None
+
+
+def test_write_to_netcdf_packing(tmp_path):
+    dset = generate_synthetic_dataset(*ARGS, **KWARGS)
+    write_to_netcdf(dset.copy(deep=True), tmp_path / "plain.nc")
+
+    vmin, vmax = data_range([dset], "tas")
+    packing = {"tas": packing_parameters(vmin, vmax)}
+    write_to_netcdf(dset.copy(deep=True), tmp_path / "packed.nc", packing=packing)
+
+    with netCDF4.Dataset(tmp_path / "packed.nc") as ncfile:
+        assert ncfile["tas"].dtype == np.int16
+        assert ncfile["tas"].getncattr("_FillValue") == -32768
+        assert ncfile["tas"].getncattr("missing_value") == -32768
+        assert "scale_factor" in ncfile["tas"].ncattrs()
+        assert ncfile["lat"].dtype != np.int16
+
+    plain = xr.open_dataset(tmp_path / "plain.nc", decode_times=False)
+    packed = xr.open_dataset(tmp_path / "packed.nc", decode_times=False)
+    tolerance = 0.51 * packing["tas"]["scale_factor"]
+    assert np.abs(plain["tas"].values - packed["tas"].values).max() <= tolerance
+    assert float(packed["tas"].min()) == pytest.approx(vmin, abs=tolerance)
+    assert plain["time"].identical(packed["time"])
+    plain.close()
+    packed.close()
+
+
+def test_write_slabs_packing(tmp_path):
+    # a narrow range saturates instead of wrapping around
+    packing = {"tas": packing_parameters(*stats_range([(280.0, 10.0)], nsigma=1))}
+    dset = generate_synthetic_dataset(*ARGS, **KWARGS)
+    write_to_netcdf(dset, tmp_path / "full.nc", packing=packing)
+    slabs = generate_synthetic_slabs(*ARGS, slab_size=5, **KWARGS)
+    write_slabs_to_netcdf(slabs, tmp_path / "slabs.nc", packing=packing)
+
+    full = xr.open_dataset(tmp_path / "full.nc", decode_times=False)
+    slabs = xr.open_dataset(tmp_path / "slabs.nc", decode_times=False)
+    assert full["tas"].identical(slabs["tas"])
+    assert float(full["tas"].min()) == pytest.approx(270.0, abs=1.0e-3)
+    assert float(full["tas"].max()) == pytest.approx(290.0, abs=1.0e-3)
+    full.close()
+    slabs.close()
@@ -0,0 +1,58 @@
+import pytest
+
+import xarray as xr
+
+from mdtf_test_data.synthetic import generate_synthetic_dataset
+from mdtf_test_data.synthetic import write_to_netcdf
+from mdtf_test_data.synthetic.manifest import file_checksum
+from mdtf_test_data.synthetic.pipeline import WritePipeline
+from mdtf_test_data.synthetic.synthetic_data import generate_synthetic_slabs
+from mdtf_test_data.synthetic.synthetic_data import write_slabs_to_netcdf
+
+ARGS = (60.0, 30.0, 1, 1, "dummy")
+KWARGS = dict(fmt="ncar", timeres="mon", attrs={"units": "K"})
+
+
+def test_write_pipeline(tmp_path):
+    full = generate_synthetic_dataset(*ARGS, **KWARGS)
+    write_to_netcdf(full, tmp_path / "direct.nc")
+    write_slabs_to_netcdf(
+        generate_synthetic_slabs(*ARGS, slab_size=5, **KWARGS),
+        tmp_path / "direct_slabs.nc",
+    )
+
+    with WritePipeline(depth=1) as pipeline:
+        pipeline.submit(write_to_netcdf, full, str(tmp_path / "full.nc"))
+        pipeline.submit(
+            write_slabs_to_netcdf,
+            generate_synthetic_slabs(*ARGS, slab_size=5, **KWARGS),
+            str(tmp_path / "slabs.nc"),
+        )
+
+    assert pipeline.checksums == {
+        str(tmp_path / "full.nc"): file_checksum(tmp_path / "full.nc"),
+        str(tmp_path / "slabs.nc"): file_checksum(tmp_path / "slabs.nc"),
+    }
+    for direct, piped in [("direct.nc", "full.nc"), ("direct_slabs.nc", "slabs.nc")]:
+        ds_direct = xr.open_dataset(tmp_path / direct, decode_times=False)
+        ds_piped = xr.open_dataset(tmp_path / piped, decode_times=False)
+        assert ds_direct.identical(ds_piped)
+        ds_direct.close()
+        ds_piped.close()
+
+
+def _failing_writer(data, outfile):
+    raise ValueError("disk full")
+
+
+def test_write_pipeline_errors(tmp_path):
+    full = generate_synthetic_dataset(*ARGS, **KWARGS)
+    with pytest.raises(RuntimeError, match="disk full"):
+        with WritePipeline(depth=1) as pipeline:
+            pipeline.submit(
+                _failing_writer,
+                generate_synthetic_slabs(*ARGS, slab_size=2, **KWARGS),
+                str(tmp_path / "bad.nc"),
+            )
+            pipeline.submit(write_to_netcdf, full, str(tmp_path / "good.nc"))
+    assert str(tmp_path / "good.nc") in pipeline.checksums
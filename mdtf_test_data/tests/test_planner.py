@@ -0,0 +1,109 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import mdtf_test_data
+from mdtf_test_data.synthetic import manifest
+from mdtf_test_data.synthetic.conventions import config_file
+from mdtf_test_data.synthetic.planner import check_budget
+from mdtf_test_data.synthetic.planner import parse_size
+from mdtf_test_data.synthetic.planner import plan_tasks
+from mdtf_test_data.synthetic.synthetic_setup import run_tasks
+from mdtf_test_data.synthetic.synthetic_setup import synthetic_tasks
+from mdtf_test_data.synthetic.variable_spec import compile_config
+from mdtf_test_data.synthetic.variable_spec import load_yaml
+from mdtf_test_data.util.resources import resource_filename
+
+PACKAGE_ROOT = os.path.dirname(mdtf_test_data.__path__[0])
+SCRIPT = os.path.join(PACKAGE_ROOT, "scripts", "mdtf_synthetic.py")
+
+
+@pytest.mark.parametrize(
+    "size,expected",
+    [("512", 512), ("4K", 4096), ("1.5G", 1610612736), ("2mb", 2097152)],
+)
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+@pytest.fixture
+def cmip_mon_tasks(tmp_path):
+    config = load_yaml(resource_filename("config/cmip_mon.yml"))
+    return synthetic_tasks(
+        config,
+        DLAT=20.0,
+        DLON=20.0,
+        STARTYEAR=1,
+        NYEARS=2,
+        CASENAME=str(tmp_path / "CMIP.Synthetic"),
+        TIME_RES="mon",
+        DATA_FORMAT="cmip",
+        CREATE_DIRS=False,
+    )
+
+
+def test_plan_tasks(cmip_mon_tasks):
+    plan = plan_tasks(cmip_mon_tasks)
+    shapes = {x["outfile"].split(".")[-3]: x["shape"] for x in plan}
+    assert shapes["areacella"] == (9, 18)
+    assert shapes["areacello"] == (36, 72)
+    assert shapes["tas"] == (24, 9, 18)
+    assert shapes["ta"] == (24, 32, 9, 18)
+    assert shapes["thetao"] == (24, 35, 36, 72)
+    assert not any(x["up_to_date"] for x in plan)
+
+
+def test_check_budget(cmip_mon_tasks):
+    plan = plan_tasks(cmip_mon_tasks)
+    largest = max(x["peak_memory"] for x in plan)
+    assert check_budget(plan, JOBS=4) == 4
+    assert check_budget(plan, max_memory=largest, JOBS=4) == 1
+    with pytest.raises(ValueError):
+        check_budget(plan, max_memory=largest - 1)
+    with pytest.raises(ValueError):
+        check_budget(plan, max_disk=1024)
+
+
+def test_run_tasks_plan(tmp_path, monkeypatch):
+    specs = compile_config(config_file("CMIP", "mon"))
+    tasks = synthetic_tasks(
+        [x for x in specs if x.name in ["tas", "pr"]],
+        NYEARS=1,
+        CASENAME="CMIP.Synthetic",
+        TIME_RES="mon",
+        DATA_FORMAT="cmip",
+        OUTPUT_URL=str(tmp_path),
+    )
+    outfiles = run_tasks(tasks)
+    plan = plan_tasks(tasks)
+    assert all(x["up_to_date"] for x in plan)
+
+    # the plan's checks are reused, so the files are not read again
+    def checksum(path):
+        raise AssertionError(f"{path} was checksummed again")
+
+    monkeypatch.setattr(manifest, "file_checksum", checksum)
+    assert run_tasks(tasks, PLAN=plan) == outfiles
+
+
+@pytest.mark.skipif(not os.path.exists(SCRIPT), reason="driver script not found")
+def test_cli_plan_budget(tmp_path):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [PACKAGE_ROOT] + [x for x in [env.get("PYTHONPATH")] if x]
+    )
+    proc = subprocess.run(
+        [sys.executable, SCRIPT, "-c", "NCAR", "--nyears", "1", "--plan"]
+        + ["--max-memory", "1K"],
+        stdout=subprocess.PIPE,
+        cwd=tmp_path,
+        env=env,
+        universal_newlines=True,
+    )
+    # the plan is printed, then rejected for the files over the budget
+    assert proc.returncode == 1
+    assert "files to generate" in proc.stdout
+    assert "exceeds the memory budget of 1.0K" in proc.stdout
+    assert os.listdir(tmp_path) == []
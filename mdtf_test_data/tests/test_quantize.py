@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import xarray as xr
+
+from mdtf_test_data.synthetic import generate_synthetic_dataset
+from mdtf_test_data.synthetic import write_to_netcdf
+from mdtf_test_data.synthetic.synthetic_data import generate_synthetic_slabs
+from mdtf_test_data.synthetic.synthetic_data import quantize_digits
+from mdtf_test_data.synthetic.synthetic_data import quantize_values
+from mdtf_test_data.synthetic.synthetic_data import write_slabs_to_netcdf
+from mdtf_test_data.synthetic.synthetic_setup import quantize_storage
+from mdtf_test_data.synthetic.variable_spec import VariableSpec
+from mdtf_test_data.util.cli import storage_options
+
+ARGS = (20.0, 20.0, 1, 2, "tas")
+KWARGS = dict(attrs={"units": "K", "missing_value": 1.0e20}, stats=[(280.0, 10.0)])
+
+
+def test_quantize_values():
+    values = np.array([1.0, 3.14159265, -2.5e-3, np.nan, 280.123456], dtype="f4")
+
+    result = quantize_values(values, least_significant_digit=2)
+    assert result.dtype == np.float32
+    assert np.isnan(result[3])
+    np.testing.assert_array_equal(result[[0, 1, 4]], [1.0, 3.140625, 280.125])
+
+    result = quantize_values(values, keepbits=7)
+    assert result.dtype == np.float32
+    np.testing.assert_array_equal(result[[0, 1, 4]], [1.0, 3.140625, 280.0])
+    bits = result[np.isfinite(result)].view(np.uint32)
+    assert np.all(bits & np.uint32(2**16 - 1) == 0)
+
+    assert np.array_equal(quantize_values(values, keepbits=23), values, equal_nan=True)
+    assert quantize_values(values.astype("f8"), keepbits=10).dtype == np.float64
+
+
+def test_quantize_digits():
+    assert quantize_digits([(280.0, 10.0)]) == 1
+    assert quantize_digits([(0.0, 1.0e-3), (1.0, 0.0)]) == 5
+    assert quantize_digits([(1.0, 0.0)]) is None
+
+    spec = VariableSpec("tas", stats=[(280.0, 10.0)])
+    assert quantize_storage(spec, None) is None
+    assert quantize_storage(spec, {"quantize": "stats"}) == {
+        "quantize": "stats",
+        "least_significant_digit": {"tas": 1},
+    }
+    storage = {"quantize": "stats", "keepbits": 4}
+    assert quantize_storage(spec, storage) is storage
+
+    assert storage_options(quantize="stats", keepbits=7) == {
+        "quantize": "stats",
+        "keepbits": 7,
+    }
+    assert storage_options(quantize="none") is None
+
+
+def test_write_to_netcdf_quantize(tmp_path):
+    dset = generate_synthetic_dataset(*ARGS, **KWARGS)
+    storage = {"compression": "zlib", "least_significant_digit": {"tas": 1}}
+    write_to_netcdf(dset.copy(deep=True), tmp_path / "plain.nc")
+    write_to_netcdf(dset.copy(deep=True), tmp_path / "rounded.nc", storage=storage)
+
+    plain = xr.open_dataset(tmp_path / "plain.nc", decode_times=False)
+    rounded = xr.open_dataset(tmp_path / "rounded.nc", decode_times=False)
+    assert rounded["tas"].dtype == np.float32
+    assert float(np.abs(plain["tas"] - rounded["tas"]).max()) <= 1.0 / 32.0
+    assert plain.drop_vars("tas").identical(rounded.drop_vars("tas"))
+    plain.close()
+    rounded.close()
+
+    # time slabs are rounded in the same way as the whole dataset
+    slabs = generate_synthetic_slabs(*ARGS, slab_size=5, **KWARGS)
+    write_slabs_to_netcdf(slabs, tmp_path / "slabs.nc", storage={"keepbits": 7})
+    write_to_netcdf(dset, tmp_path / "full.nc", storage={"keepbits": 7})
+    full = xr.open_dataset(tmp_path / "full.nc", decode_times=False)
+    slabs = xr.open_dataset(tmp_path / "slabs.nc", decode_times=False)
+    assert full.identical(slabs)
+    full.close()
+    slabs.close()
+
+    with pytest.raises(AssertionError):
+        write_to_netcdf(
+            generate_synthetic_dataset(*ARGS, **KWARGS),
+            tmp_path / "both.nc",
+            storage={"least_significant_digit": 1, "keepbits": 7},
+        )
@@ -0,0 +1,128 @@
+import json
+import os
+
+import pytest
+
+import xarray as xr
+
+pytest.importorskip("h5py")
+pytest.importorskip("zarr")
+pytest.importorskip("fsspec")
+
+from mdtf_test_data.synthetic.conventions import config_file
+from mdtf_test_data.synthetic.references import file_references
+from mdtf_test_data.synthetic.references import open_references
+from mdtf_test_data.synthetic.references import write_output_references
+from mdtf_test_data.synthetic.shards import finalize_work_plan
+from mdtf_test_data.synthetic.shards import run_shard
+from mdtf_test_data.synthetic.shards import write_work_plan
+from mdtf_test_data.synthetic.synthetic_setup import link_static_duplicates
+from mdtf_test_data.synthetic.synthetic_setup import run_tasks
+from mdtf_test_data.synthetic.synthetic_setup import synthetic_tasks
+from mdtf_test_data.synthetic.variable_spec import compile_config
+
+
+def tasks(root, names=("FLUT", "PRECT", "U200"), storage=None):
+    specs = compile_config(config_file("NCAR", "day"))
+    specs = [x for x in specs if x.name in names]
+    return link_static_duplicates(
+        synthetic_tasks(
+            specs,
+            NYEARS=1,
+            CASENAME="NCAR.Synthetic",
+            TIME_RES="day",
+            DATA_FORMAT="ncar",
+            STORAGE=storage,
+            OUTPUT_URL=str(root),
+        )
+    )
+
+
+@pytest.mark.parametrize("storage", [None, {"compression": "zlib", "complevel": 1}])
+def test_variable_references(tmp_path, storage):
+    outputs = run_tasks(tasks(tmp_path, storage=storage))
+    written = write_output_references(outputs, MODE="variable")
+    assert written == [x[: -len(".nc")] + ".json" for x in sorted(outputs)]
+
+    for outfile, reffile in zip(sorted(outputs), written):
+        with xr.open_dataset(outfile, decode_times=False) as dset:
+            with open_references(reffile, decode_times=False) as result:
+                assert result.load().identical(dset.load())
+
+    # coordinates are inlined, the data are referenced in the NetCDF file
+    refs = file_references(sorted(outputs)[0])["refs"]
+    assert refs["lat/0"].startswith("base64:")
+    name = os.path.basename(sorted(outputs)[0]).split(".")[-3]
+    assert refs[f"{name}/0.0.0"][0] == os.path.abspath(sorted(outputs)[0])
+
+
+def test_tree_references(tmp_path):
+    outputs = run_tasks(tasks(tmp_path))
+    written = write_output_references(outputs, MODE="tree")
+    assert written == [
+        os.path.join(tmp_path, "NCAR.Synthetic", "day", "NCAR.Synthetic.day.json")
+    ]
+    with open(written[0], "r") as fhandle:
+        assert json.load(fhandle)["version"] == 1
+
+    dsets = [xr.open_dataset(x, decode_times=False) for x in outputs]
+    with open_references(written[0], decode_times=False) as result:
+        assert {"FLUT", "PRECT", "U200"} <= set(result.data_vars)
+        for dset in dsets:
+            for name in dset.variables:
+                assert result[name].load().identical(dset[name].load())
+    for dset in dsets:
+        dset.close()
+
+
+def test_tree_references_grids(tmp_path, recwarn):
+    # the ocean variables are on the tripolar grid, the others on a regular one
+    specs = compile_config(config_file("CMIP", "mon"))
+    specs = [x for x in specs if x.name in ["areacella", "areacello", "tas", "zos"]]
+    outputs = run_tasks(
+        synthetic_tasks(
+            specs,
+            NYEARS=1,
+            CASENAME="CMIP.Synthetic",
+            TIME_RES="mon",
+            DATA_FORMAT="cmip",
+            OUTPUT_URL=str(tmp_path),
+        )
+    )
+    written = write_output_references(outputs, MODE="tree")
+    assert not any("No reference file" in str(x.message) for x in recwarn)
+    directory = os.path.dirname(outputs[0])
+    case = os.path.basename(os.path.dirname(directory))
+    assert written == [
+        os.path.join(directory, f"{case}.mon.lat9-lon18.json"),
+        os.path.join(directory, f"{case}.mon.nlat36-nlon72.json"),
+    ]
+
+    groups = [["areacella", "tas"], ["areacello", "zos"]]
+    for reffile, names in zip(written, groups):
+        with open_references(reffile, decode_times=False) as result:
+            assert set(names) <= set(result.data_vars)
+            for name in names:
+                outfile = [x for x in outputs if f".{name}.mon." in x][0]
+                with xr.open_dataset(outfile, decode_times=False) as dset:
+                    assert result[name].load().identical(dset[name].load())
+                    assert result["lat"].load().identical(dset["lat"].load())
+
+
+def test_split_references(tmp_path):
+    expected = run_tasks(tasks(tmp_path / "single", names=["PRECT"]))
+
+    plan_file = str(tmp_path / "plan.json")
+    write_work_plan(
+        tasks(tmp_path / "sharded", names=["PRECT"]), plan_file, SHARDS=2, PIECE_SIZE=73
+    )
+    for shard in range(2):
+        run_shard(plan_file, shard)
+    outputs = finalize_work_plan(plan_file, KEEP_SPLIT=True)
+    assert len(outputs) == 5
+
+    written = write_output_references(outputs, MODE="variable")
+    assert [os.path.basename(x) for x in written] == ["NCAR.Synthetic.PRECT.day.json"]
+    with xr.open_dataset(expected[0], decode_times=False) as dset:
+        with open_references(written[0], decode_times=False) as result:
+            assert result.load().identical(dset.load())
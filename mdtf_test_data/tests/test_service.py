@@ -0,0 +1,150 @@
+import http.client
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import netCDF4
+import numpy as np
+import pytest
+
+from mdtf_test_data.synthetic import generate_suite
+from mdtf_test_data.synthetic.service import SyntheticService
+from mdtf_test_data.synthetic.service import make_server
+
+REQUEST = {"convention": "NCAR", "frequencies": "mon", "variables": ["PS"]}
+
+
+@pytest.fixture
+def server():
+    server = make_server("127.0.0.1:0", SyntheticService())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    server.service.close()
+
+
+def post(url, request):
+    data = json.dumps(request).encode()
+    with urllib.request.urlopen(urllib.request.Request(url, data=data)) as response:
+        return response.headers["Content-Type"], response.read()
+
+
+def test_service_netcdf(server):
+    content_type, body = post(f"{server}/netcdf", REQUEST)
+    assert content_type == "application/x-netcdf"
+
+    expected = generate_suite("NCAR", "mon", ["PS"])[("PS", "mon")]
+    with netCDF4.Dataset("<in-memory>", memory=body) as ncfile:
+        np.testing.assert_array_equal(ncfile["PS"][:], expected["PS"].values)
+
+    with urllib.request.urlopen(f"{server}/status") as response:
+        status = json.loads(response.read())
+    assert status["requests"] == 1
+    assert "NCAR/mon" in status["configs"]
+
+
+def test_service_generate(server, tmp_path):
+    request = dict(REQUEST, output=str(tmp_path), nyears=2)
+    _, body = post(f"{server}/generate", request)
+    files = json.loads(body)["files"]
+    assert len(files) == 1
+    assert files[0].endswith("NCAR.Synthetic.PS.mon.nc")
+    with netCDF4.Dataset(files[0]) as ncfile:
+        assert len(ncfile.dimensions["time"]) == 24
+
+    # requests run concurrently; files up to date are not written again
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(post(f"{server}/generate", request))
+        )
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [json.loads(body)["files"] for _, body in results] == [files] * 3
+
+
+def test_service_generate_keeps_other_variables(server, tmp_path):
+    _, body = post(f"{server}/generate", dict(REQUEST, output=str(tmp_path)))
+    first = json.loads(body)["files"]
+    request = dict(REQUEST, output=str(tmp_path), variables=["Z3"])
+    _, body = post(f"{server}/generate", request)
+    second = json.loads(body)["files"]
+    assert second[0].endswith("NCAR.Synthetic.Z3.mon.nc")
+    for outfile in first + second:
+        with netCDF4.Dataset(outfile) as ncfile:
+            assert len(ncfile.dimensions["time"]) == 12
+
+
+def test_service_errors(server):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post(f"{server}/netcdf", {"convention": "NCAR", "variables": ["nope"]})
+    assert error.value.code == 400
+    assert "nope" in json.loads(error.value.read())["error"]
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post(f"{server}/generate", REQUEST)
+    assert error.value.code == 400
+
+    for request in [{"dlat": 0.1}, {"dlon": 90}, {"nyears": 0}, {"nyears": 1000}]:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post(f"{server}/netcdf", dict(REQUEST, **request))
+        assert error.value.code == 400
+        assert list(request)[0] in json.loads(error.value.read())["error"]
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post(f"{server}/unknown", REQUEST)
+    assert error.value.code == 404
+
+
+class UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def test_service_unix_socket(tmp_path):
+    path = str(tmp_path / "service.sock")
+    server = make_server(f"unix:{path}", SyntheticService())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = UnixConnection(path)
+        connection.request("GET", "/status")
+        response = connection.getresponse()
+        assert response.status == 200
+        assert json.loads(response.read())["jobs"] == 1
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_service_unix_socket_in_use(tmp_path):
+    # other files are never removed
+    path = tmp_path / "service.sock"
+    path.write_text("data")
+    with pytest.raises(ValueError, match="not a socket"):
+        make_server(f"unix:{path}", SyntheticService())
+    assert path.read_text() == "data"
+    path.unlink()
+
+    # a running service keeps its socket, a stale one is replaced
+    server = make_server(f"unix:{path}", SyntheticService())
+    with pytest.raises(ValueError, match="already listening"):
+        make_server(f"unix:{path}", SyntheticService())
+    server.server_close()
+    assert path.exists()
+    server = make_server(f"unix:{path}", SyntheticService())
+    server.server_close()
@@ -0,0 +1,148 @@
+import json
+import os
+
+import netCDF4
+import numpy as np
+import pytest
+
+import xarray as xr
+
+import mdtf_test_data.synthetic.shards as shards
+from mdtf_test_data.synthetic import generate_synthetic_dataset
+from mdtf_test_data.synthetic.conventions import config_file
+from mdtf_test_data.synthetic.manifest import read_manifest
+from mdtf_test_data.synthetic.shards import finalize_work_plan
+from mdtf_test_data.synthetic.shards import run_shard
+from mdtf_test_data.synthetic.shards import write_work_plan
+from mdtf_test_data.synthetic.synthetic_data import generate_synthetic_slabs
+from mdtf_test_data.synthetic.synthetic_setup import link_static_duplicates
+from mdtf_test_data.synthetic.synthetic_setup import run_tasks
+from mdtf_test_data.synthetic.synthetic_setup import synthetic_tasks
+from mdtf_test_data.synthetic.variable_spec import compile_config
+
+STORAGE = {"compression": "zlib", "complevel": 1, "packing": "stats"}
+
+
+def test_generate_synthetic_slabs_stop():
+    kwargs = dict(attrs={"units": "K"}, stats=[(280.0, 10.0)])
+    dset = generate_synthetic_dataset(20.0, 20.0, 1, 1, "tas", **kwargs)
+    slabs = list(
+        generate_synthetic_slabs(
+            20.0, 20.0, 1, 1, "tas", slab_size=2, start=3, stop=8, **kwargs
+        )
+    )
+    assert [len(x["time"]) for x in slabs] == [2, 2, 1]
+    assert xr.concat(slabs, "time").identical(dset.isel(time=slice(3, 8)))
+
+
+def tasks(root):
+    specs = compile_config(config_file("CMIP", "mon"))
+    specs = [x for x in specs if x.name in ["areacella", "tas", "pr", "ta"]]
+    return link_static_duplicates(
+        synthetic_tasks(
+            specs,
+            NYEARS=1,
+            CASENAME="CMIP.Synthetic",
+            TIME_RES="mon",
+            DATA_FORMAT="cmip",
+            STORAGE=STORAGE,
+            OUTPUT_URL=str(root),
+        )
+    )
+
+
+def test_work_plan(tmp_path):
+    expected = run_tasks(tasks(tmp_path / "single"))
+
+    plan_file = str(tmp_path / "plan.json")
+    sharded = tasks(tmp_path / "sharded")
+    plan = write_work_plan(sharded, plan_file, SHARDS=3, PIECE_SIZE=5)
+    with open(plan_file, "r") as fhandle:
+        text = fhandle.read()
+    write_work_plan(sharded, plan_file, SHARDS=3, PIECE_SIZE=5)
+    with open(plan_file, "r") as fhandle:
+        assert fhandle.read() == text
+
+    # the static field is one unit, the other variables three pieces each
+    assert len(plan["units"]) == 10
+    assert set(x["shard"] for x in plan["units"]) == {0, 1, 2}
+    ranges = [(x["tstart"], x["tstop"]) for x in plan["units"] if x["task"] == 1]
+    assert ranges == [(0, 5), (5, 10), (10, 12)]
+
+    run_shard(plan_file, 0)
+    with pytest.raises(ValueError, match="rerun shards"):
+        finalize_work_plan(plan_file)
+    run_shard(plan_file, 1, JOBS=2)
+    run_shard(plan_file, 2)
+    outputs = finalize_work_plan(plan_file)
+
+    assert len(outputs) == len(expected)
+    for single, stitched in zip(expected, outputs):
+        with xr.open_dataset(single, decode_times=False) as dset:
+            with xr.open_dataset(stitched, decode_times=False) as result:
+                assert result.identical(dset)
+    assert not any(".t0000" in x for x in os.listdir(os.path.dirname(outputs[0])))
+    tas = [x for x in outputs if ".tas.mon." in x][0]
+    with netCDF4.Dataset(tas) as ncfile:
+        assert ncfile["tas"].filters()["zlib"]
+        assert ncfile["tas"].dtype == np.int16
+        assert ncfile.dimensions["time"].isunlimited()
+
+    # the manifest holds the stitched files, so a single run skips them
+    root = os.path.dirname(os.path.dirname(outputs[0]))
+    assert len(read_manifest(root)) == len(outputs)
+    assert run_tasks(sharded) == outputs
+
+
+def test_finalize_interrupted(tmp_path, monkeypatch):
+    plan_file = str(tmp_path / "plan.json")
+    sharded = tasks(tmp_path)
+    plan = write_work_plan(sharded, plan_file, SHARDS=2, PIECE_SIZE=5)
+    for shard in range(2):
+        run_shard(plan_file, shard)
+
+    def interrupt(root, files):
+        raise KeyboardInterrupt
+
+    # nothing is removed before the manifests are written
+    with monkeypatch.context() as patch:
+        patch.setattr(shards, "write_manifest", interrupt)
+        with pytest.raises(KeyboardInterrupt):
+            finalize_work_plan(plan_file)
+    assert all(os.path.exists(x["path"]) for x in plan["units"])
+    assert os.path.exists(f"{plan_file}.shard0001.json")
+
+    outputs = finalize_work_plan(plan_file)
+    pieces = [x["path"] for x in plan["units"] if x["tstart"] is not None]
+    assert len(pieces) > 0 and not any(os.path.exists(x) for x in pieces)
+    assert not os.path.exists(f"{plan_file}.shard0000.json")
+    assert not os.path.exists(f"{plan_file}.shard0001.json")
+
+    # a finalize that completed is not undone by running it again
+    assert finalize_work_plan(plan_file) == outputs
+    assert run_tasks(sharded) == outputs
+
+
+def test_work_plan_keep_split(tmp_path):
+    plan_file = str(tmp_path / "plan.json")
+    plan = write_work_plan(tasks(tmp_path), plan_file, SHARDS=2, PIECE_SIZE=5)
+    for shard in range(2):
+        run_shard(plan_file, shard)
+    outputs = finalize_work_plan(plan_file, KEEP_SPLIT=True)
+
+    assert len(outputs) == len(plan["units"])
+    pieces = sorted(x for x in outputs if ".tas.mon." in x)
+    assert [os.path.basename(x).split(".")[-2] for x in pieces] == [
+        "t000000-000004",
+        "t000005-000009",
+        "t000010-000011",
+    ]
+    dsets = [xr.open_dataset(x, decode_times=False) for x in pieces]
+    dset = xr.concat(dsets, "time", data_vars="minimal")
+    assert len(dset["time"]) == 12
+    assert np.all(np.diff(dset["time"].values) > 0)
+    for x in dsets:
+        x.close()
+
+    with open(plan_file, "r") as fhandle:
+        assert json.load(fhandle)["shards"] == 2
@@ -0,0 +1,89 @@
+import os
+
+import netCDF4
+import pytest
+
+import xarray as xr
+
+from mdtf_test_data.synthetic import generate_synthetic_dataset
+from mdtf_test_data.synthetic import write_to_netcdf
+from mdtf_test_data.synthetic.checkpoint import partial_path
+from mdtf_test_data.synthetic.checkpoint import read_checkpoint
+from mdtf_test_data.synthetic.synthetic_data import generate_synthetic_slabs
+from mdtf_test_data.synthetic.synthetic_data import write_slabs_to_netcdf
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        dict(fmt="ncar", timeres="day", stats=[(280.0, 10.0)]),
+        dict(fmt="gfdl", timeres="mon", stats=[(280.0, 10.0)] * 19),
+        dict(fmt="cmip", timeres="mon", grid="tripolar", compress=True),
+        dict(
+            fmt="ncar",
+            timeres="3hr",
+            generator="convective",
+            generator_kwargs={"varname": "pr"},
+        ),
+    ],
+)
+def test_write_slabs_to_netcdf(tmp_path, kwargs):
+    args = (60.0, 30.0, 1, 1, "dummy")
+    attrs = {"units": "K"}
+    full = generate_synthetic_dataset(*args, attrs=attrs, **kwargs)
+    write_to_netcdf(full, tmp_path / "full.nc")
+
+    slabs = generate_synthetic_slabs(*args, attrs=attrs, slab_size=5, **kwargs)
+    write_slabs_to_netcdf(slabs, tmp_path / "slabs.nc")
+
+    with netCDF4.Dataset(tmp_path / "slabs.nc") as ncfile:
+        assert ncfile.dimensions["time"].isunlimited()
+
+    ds_full = xr.open_dataset(tmp_path / "full.nc", decode_times=False)
+    ds_slabs = xr.open_dataset(tmp_path / "slabs.nc", decode_times=False)
+    assert ds_full.identical(ds_slabs)
+    ds_full.close()
+    ds_slabs.close()
+
+
+def test_generate_synthetic_slabs_sizes():
+    slabs = generate_synthetic_slabs(
+        60.0, 30.0, 1, 1, "dummy", timeres="mon", slab_size=5
+    )
+    assert [len(x["time"]) for x in slabs] == [5, 5, 2]
+
+
+def test_write_slabs_resume(tmp_path):
+    args = (60.0, 30.0, 1, 1, "dummy")
+    kwargs = dict(fmt="ncar", timeres="day", stats=[(280.0, 10.0)], attrs={})
+    outfile = tmp_path / "slabs.nc"
+    write_slabs_to_netcdf(
+        generate_synthetic_slabs(*args, slab_size=50, **kwargs), tmp_path / "full.nc"
+    )
+
+    def interrupted(slabs, count):
+        for slab in list(slabs)[:count]:
+            yield slab
+        raise KeyboardInterrupt()
+
+    # the process dies while the fourth slab is generated
+    with pytest.raises(KeyboardInterrupt):
+        write_slabs_to_netcdf(
+            interrupted(generate_synthetic_slabs(*args, slab_size=50, **kwargs), 3),
+            outfile,
+            checkpoint="key",
+        )
+    assert not outfile.exists()
+    assert partial_path(outfile).endswith(".part")
+    assert read_checkpoint(outfile, "key") == 150
+    assert read_checkpoint(outfile, "other") == 0
+
+    slabs = generate_synthetic_slabs(*args, slab_size=50, start=150, **kwargs)
+    write_slabs_to_netcdf(slabs, outfile, checkpoint="key", resume_from=150)
+    assert sorted(os.listdir(tmp_path)) == ["full.nc", "slabs.nc"]
+
+    ds_full = xr.open_dataset(tmp_path / "full.nc", decode_times=False)
+    ds_slabs = xr.open_dataset(outfile, decode_times=False)
+    assert ds_full.identical(ds_slabs)
+    ds_full.close()
+    ds_slabs.close()
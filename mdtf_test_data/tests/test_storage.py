@@ -0,0 +1,64 @@
+import netCDF4
+import numpy as np
+import pytest
+
+import xarray as xr
+
+from mdtf_test_data.synthetic import generate_synthetic_dataset
+from mdtf_test_data.synthetic import write_to_netcdf
+from mdtf_test_data.synthetic.synthetic_data import storage_encoding
+from mdtf_test_data.util.cli import parse_chunks
+from mdtf_test_data.util.cli import storage_options
+
+
+def test_parse_chunks():
+    assert parse_chunks("time=12, lat=90") == {"time": 12, "lat": 90}
+    assert parse_chunks(None) is None
+
+
+def test_storage_options():
+    assert storage_options() is None
+    assert storage_options("none") is None
+    assert storage_options("zlib", 4, False, "time=1") == {
+        "compression": "zlib",
+        "complevel": 4,
+        "shuffle": False,
+        "chunks": {"time": 1},
+    }
+
+
+def test_storage_encoding():
+    variable = xr.Variable(("time", "lat", "lon"), np.zeros((24, 9, 18)))
+    assert storage_encoding(variable) == {}
+    assert storage_encoding(xr.Variable((), 1.0), {"compression": "zlib"}) == {}
+    encoding = storage_encoding(
+        variable, {"compression": "zstd", "complevel": 3, "chunks": {"time": 12}}
+    )
+    assert encoding == {
+        "compression": "zstd",
+        "complevel": 3,
+        "shuffle": True,
+        "chunksizes": (12, 9, 18),
+    }
+    with pytest.raises(AssertionError):
+        storage_encoding(variable, {"compression": "lzma"})
+
+
+def test_write_to_netcdf_storage(tmp_path):
+    dset = generate_synthetic_dataset(
+        20.0, 20.0, 1, 2, "tas", attrs={"units": "K"}, stats=[(280.0, 10.0)]
+    )
+    write_to_netcdf(dset.copy(), tmp_path / "plain.nc")
+    storage = {"compression": "zlib", "complevel": 4, "chunks": {"time": 6}}
+    write_to_netcdf(dset.copy(), tmp_path / "packed.nc", storage=storage)
+
+    with netCDF4.Dataset(tmp_path / "packed.nc") as ncfile:
+        assert ncfile["tas"].filters()["zlib"]
+        assert ncfile["tas"].filters()["shuffle"]
+        assert ncfile["tas"].chunking() == [6, 9, 18]
+
+    plain = xr.open_dataset(tmp_path / "plain.nc", decode_times=False)
+    packed = xr.open_dataset(tmp_path / "packed.nc", decode_times=False)
+    assert plain.identical(packed)
+    plain.close()
+    packed.close()
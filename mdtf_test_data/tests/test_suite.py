@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+import xarray as xr
+
+import mdtf_test_data
+from mdtf_test_data.synthetic.synthetic_setup import synthetic_main
+from mdtf_test_data.synthetic.variable_spec import compile_config
+from mdtf_test_data.synthetic.conventions import config_file
+from mdtf_test_data.synthetic.conventions import resolve_conventions
+
+
+def test_resolve_conventions():
+    assert resolve_conventions(["CESM", "NCAR", "bogus"]) == ["NCAR"]
+    assert resolve_conventions("all") == ["GFDL", "NCAR", "CMIP"]
+
+
+@pytest.mark.parametrize(
+    "convention,frequency,casename,fmt",
+    [
+        ("CESM", "mon", "NCAR.Synthetic", "ncar"),
+        ("CMIP", "mon", "CMIP.Synthetic", "cmip"),
+    ],
+)
+def test_generate_suite(tmp_path, convention, frequency, casename, fmt):
+    suite = mdtf_test_data.generate_suite(
+        convention, frequency, DLAT=30.0, DLON=60.0, NYEARS=1
+    )
+    specs = compile_config(config_file(resolve_conventions(convention)[0], frequency))
+    assert sorted(suite.keys()) == sorted((x.name, frequency) for x in specs)
+
+    # the same datasets as the files written and read back
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        outfiles = synthetic_main(
+            specs,
+            DLAT=30.0,
+            DLON=60.0,
+            STARTYEAR=1,
+            NYEARS=1,
+            CASENAME=casename,
+            TIME_RES=frequency,
+            DATA_FORMAT=fmt,
+        )
+    finally:
+        os.chdir(cwd)
+    for spec, outfile in zip(specs, outfiles):
+        dset = xr.open_dataset(tmp_path / outfile)
+        assert dset.identical(suite[(spec.name, frequency)])
+        for var in dset.variables:
+            assert dset[var].dtype == suite[(spec.name, frequency)][var].dtype
+        dset.close()
+
+
+def test_generate_suite_packing():
+    suite = mdtf_test_data.generate_suite(
+        "NCAR",
+        "mon",
+        variables=["PS"],
+        DLAT=30.0,
+        DLON=60.0,
+        STORAGE={"packing": "stats"},
+    )
+    assert list(suite.keys()) == [("PS", "mon")]
+    assert suite[("PS", "mon")]["PS"].encoding["dtype"] == "int16"
+    assert "scale_factor" in suite[("PS", "mon")]["PS"].encoding
@@ -3,7 +3,7 @@ import pytest
 import numpy as np
 import xarray as xr
 import pickle
-import pkg_resources as pkgr
+from mdtf_test_data.util.resources import resource_filename
 import warnings
 
 from mdtf_test_data.synthetic import dataset_stats
@@ -179,7 +179,7 @@ def test_generate_synthetic_dataset_1():
         )
         pytest.skip()
 
-    ref_file = pkgr.resource_filename("mdtf_test_data", "tests/ref_synth_dset.nc")
+    ref_file = resource_filename("tests/ref_synth_dset.nc")
 
     if os.path.exists(ref_file):
         reference = xr.open_dataset(ref_file)
@@ -0,0 +1,349 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import xarray as xr
+import yaml
+
+import mdtf_test_data
+from mdtf_test_data.synthetic import split_dataset
+from mdtf_test_data.synthetic.manifest import MANIFEST_NAME
+from mdtf_test_data.synthetic.manifest import code_files
+from mdtf_test_data.synthetic.manifest import read_manifest
+from mdtf_test_data.synthetic import synthetic_setup
+from mdtf_test_data.synthetic.conventions import config_file
+from mdtf_test_data.synthetic.synthetic_setup import link_static_duplicates
+from mdtf_test_data.synthetic.synthetic_setup import output_path
+from mdtf_test_data.synthetic.synthetic_setup import run_tasks
+from mdtf_test_data.synthetic.synthetic_setup import synthetic_main
+from mdtf_test_data.synthetic.synthetic_setup import synthetic_tasks
+from mdtf_test_data.synthetic.variable_spec import compile_config
+from mdtf_test_data.synthetic.variable_spec import load_yaml
+from mdtf_test_data.util.resources import resource_filename
+
+
+# small variable configurations shared by the tests below
+VARIABLES = {
+    "PS": {"atts": {"units": "Pa"}, "stats": [[98000.0, 100.0]]},
+    "TS": {"atts": {"units": "K"}, "stats": [[288.0, 10.0]]},
+    "AREA": {"atts": {"units": "m2"}, "static": True, "stats": [[1.0e9, 1.0e8]]},
+}
+
+
+def write_config(path, names, atts=None):
+    """Writes a configuration of some of VARIABLES, with extra attributes"""
+    atts = {} if atts is None else atts
+    config = {"variables": {"name": list(names)}}
+    for name in names:
+        block = VARIABLES[name]
+        config[name] = dict(block, atts={**block["atts"], **atts.get(name, {})})
+    path.write_text(yaml.safe_dump(config, sort_keys=False))
+    return path
+
+
+@pytest.fixture
+def ncar_mon_config():
+    return load_yaml(resource_filename("config/ncar_mon.yml"))
+
+
+def _run(path, config, jobs, TIME_RES="mon", **kwargs):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        return synthetic_main(
+            config,
+            DLAT=30.0,
+            DLON=60.0,
+            STARTYEAR=1,
+            NYEARS=1,
+            CASENAME="NCAR.Synthetic",
+            TIME_RES=TIME_RES,
+            DATA_FORMAT="ncar",
+            JOBS=jobs,
+            **kwargs,
+        )
+    finally:
+        os.chdir(cwd)
+
+
+def test_synthetic_main_jobs(tmp_path, ncar_mon_config):
+    os.makedirs(tmp_path / "serial")
+    os.makedirs(tmp_path / "parallel")
+    serial = _run(tmp_path / "serial", ncar_mon_config, 1)
+    parallel = _run(tmp_path / "parallel", ncar_mon_config, 2)
+    assert serial == parallel
+    assert len(serial) == len(ncar_mon_config["variables"]["name"])
+    for outfile in serial:
+        ds_serial = xr.open_dataset(tmp_path / "serial" / outfile, use_cftime=True)
+        ds_parallel = xr.open_dataset(tmp_path / "parallel" / outfile, use_cftime=True)
+        assert ds_serial.identical(ds_parallel)
+        ds_serial.close()
+        ds_parallel.close()
+
+
+@pytest.mark.parametrize("jobs,slab_size", [(1, None), (2, 5)])
+def test_synthetic_main_pipeline(tmp_path, ncar_mon_config, jobs, slab_size):
+    os.makedirs(tmp_path / "serial")
+    os.makedirs(tmp_path / "pipelined")
+    serial = _run(tmp_path / "serial", ncar_mon_config, 1)
+    pipelined = _run(
+        tmp_path / "pipelined",
+        ncar_mon_config,
+        jobs,
+        PIPELINE_DEPTH=2,
+        SLAB_SIZE=slab_size,
+    )
+    assert serial == pipelined
+    for outfile in serial:
+        ds_serial = xr.open_dataset(tmp_path / "serial" / outfile, use_cftime=True)
+        ds_piped = xr.open_dataset(tmp_path / "pipelined" / outfile, use_cftime=True)
+        assert ds_serial.identical(ds_piped)
+        ds_serial.close()
+        ds_piped.close()
+
+
+def test_synthetic_main_multi_variable(tmp_path):
+    config = load_yaml(resource_filename("config/ncar_day.yml"))
+    os.makedirs(tmp_path / "single")
+    os.makedirs(tmp_path / "multi")
+    single = _run(tmp_path / "single", config, 1, TIME_RES="day")
+    multi = _run(tmp_path / "multi", config, 2, TIME_RES="day", MULTI_VARIABLE=True)
+    assert multi == ["NCAR.Synthetic/day/NCAR.Synthetic.h0.day.nc"]
+
+    # splitting the shared file gives back the single-variable files
+    entry = read_manifest(tmp_path / "multi" / "NCAR.Synthetic")[
+        "day/NCAR.Synthetic.h0.day.nc"
+    ]
+    assert entry["variable"] == config["variables"]["name"]
+    dset = xr.open_dataset(tmp_path / "multi" / multi[0], use_cftime=True)
+    for outfile, (var, ds_split) in zip(
+        single, split_dataset(dset, entry["variable"]).items()
+    ):
+        assert outfile.endswith(f".{var}.day.nc")
+        ds_single = xr.open_dataset(tmp_path / "single" / outfile, use_cftime=True)
+        assert ds_single.identical(ds_split)
+        ds_single.close()
+    dset.close()
+
+
+def test_synthetic_main_manifest(tmp_path):
+    config = write_config(tmp_path / "config.yml", ["PS", "TS"])
+    outdir = tmp_path / "out"
+    os.makedirs(outdir)
+    first = _run(outdir, load_yaml(config), 1)
+    mtimes = [os.path.getmtime(outdir / x) for x in first]
+    assert os.path.exists(outdir / "NCAR.Synthetic" / MANIFEST_NAME)
+
+    # nothing changed, so nothing is rewritten
+    second = _run(outdir, load_yaml(config), 1)
+    assert first == second
+    assert mtimes == [os.path.getmtime(outdir / x) for x in second]
+
+    # dropping a variable removes its output
+    write_config(config, ["PS"])
+    third = _run(outdir, load_yaml(config), 1)
+    assert len(third) == 1
+    assert os.path.exists(outdir / third[0])
+    assert not os.path.exists(outdir / first[1])
+
+
+def test_code_files():
+    names = [os.path.basename(x) for x in code_files()]
+    assert "synthetic_data.py" in names
+    assert "normal.py" in names
+    assert "ocean_static_5deg.nc" in names
+    # the manifest records each variable's configuration instead
+    assert "ncar_mon.yml" not in names
+    # run drivers do not change the outputs, so editing them keeps files
+    for name in ["planner.py", "references.py", "service.py", "shards.py"]:
+        assert name not in names
+
+
+def test_packaged_config_edit(tmp_path):
+    # a copy of the package, so its configurations can be edited
+    root = os.path.dirname(mdtf_test_data.__path__[0])
+    ignore = shutil.ignore_patterns("__pycache__", "tests")
+    shutil.copytree(
+        mdtf_test_data.__path__[0], tmp_path / "pkg" / "mdtf_test_data", ignore=ignore
+    )
+    shutil.copytree(os.path.join(root, "scripts"), tmp_path / "pkg" / "scripts")
+    config = tmp_path / "pkg" / "mdtf_test_data" / "config" / "cmip_mon.yml"
+    os.makedirs(tmp_path / "out")
+
+    def run():
+        env = dict(os.environ, PYTHONPATH=str(tmp_path / "pkg"))
+        script = str(tmp_path / "pkg" / "scripts" / "mdtf_synthetic.py")
+        return subprocess.run(
+            [sys.executable, script, "-c", "CMIP", "--nyears", "1"],
+            stdout=subprocess.PIPE,
+            cwd=tmp_path / "out",
+            env=env,
+            universal_newlines=True,
+            check=True,
+        ).stdout
+
+    assert "(34 of 34 files out of date)" in run()
+
+    # attributes of a packaged variable are patched into its file only
+    config.write_text(
+        config.read_text().replace(
+            '"near_surface_air_temperature"', '"edited air temperature"'
+        )
+    )
+    output = run()
+    assert "(0 of 34 files out of date)" in output
+    updated = [x for x in output.splitlines() if x.startswith("Updating attributes")]
+    assert len(updated) == 1 and updated[0].endswith(".tas.mon.nc")
+
+    # other edits regenerate that variable's file only
+    config.write_text(config.read_text().replace("[278.5208, 2.1739]", "[280.0, 2.0]"))
+    assert "(1 of 34 files out of date)" in run()
+    assert "(0 of 34 files out of date)" in run()
+
+
+def test_synthetic_main_resume(tmp_path, capsys, monkeypatch):
+    config = write_config(tmp_path / "config.yml", ["PS", "TS"])
+    os.makedirs(tmp_path / "resumed")
+    os.makedirs(tmp_path / "fresh")
+    generate = synthetic_setup.generate_synthetic_slabs
+
+    def interrupted(*args, **kwargs):
+        for count, slab in enumerate(generate(*args, **kwargs)):
+            if args[4] == "TS" and count == 3:
+                raise KeyboardInterrupt()
+            yield slab
+
+    # the run dies in the middle of the second file
+    monkeypatch.setattr(synthetic_setup, "generate_synthetic_slabs", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        _run(tmp_path / "resumed", load_yaml(config), 1, "day", SLAB_SIZE=50)
+    monkeypatch.undo()
+    files = read_manifest(tmp_path / "resumed" / "NCAR.Synthetic")
+    assert [x["variable"] for x in files.values()] == ["PS"]
+
+    capsys.readouterr()
+    outfiles = _run(
+        tmp_path / "resumed", load_yaml(config), 1, "day", SLAB_SIZE=50, RESUME=True
+    )
+    output = capsys.readouterr().out
+    assert "(1 of 2 files out of date)" in output
+    assert "at time level 150" in output
+    _run(tmp_path / "fresh", load_yaml(config), 1, "day", SLAB_SIZE=50)
+
+    for outfile in outfiles:
+        resumed = xr.open_dataset(tmp_path / "resumed" / outfile)
+        fresh = xr.open_dataset(tmp_path / "fresh" / outfile)
+        assert resumed.identical(fresh)
+        resumed.close()
+        fresh.close()
+    assert not any(
+        x.endswith(".part") or x.endswith(".json")
+        for x in os.listdir(os.path.dirname(tmp_path / "resumed" / outfiles[1]))
+    )
+
+
+def test_synthetic_main_ensemble(tmp_path):
+    config = write_config(tmp_path / "config.yml", ["TS", "AREA"])
+    os.makedirs(tmp_path / "single")
+    os.makedirs(tmp_path / "ensemble")
+    single = _run(tmp_path / "single", load_yaml(config), 1)
+    ensemble = _run(tmp_path / "ensemble", load_yaml(config), 2, ENSEMBLE=3)
+    assert len(ensemble) == 3 * len(single)
+    assert ensemble[: len(single)] == single
+    assert "NCAR.Synthetic.r3" in ensemble[-1]
+
+    # the first member is unchanged, the others have their own seeds
+    ts = [x for x in ensemble if ".TS." in x]
+    datasets = [xr.open_dataset(tmp_path / "ensemble" / x) for x in ts]
+    reference = xr.open_dataset(tmp_path / "single" / ts[0])
+    assert datasets[0].identical(reference)
+    assert not datasets[0]["TS"].equals(datasets[1]["TS"])
+    assert not datasets[1]["TS"].equals(datasets[2]["TS"])
+    assert datasets[1]["lat"].identical(datasets[0]["lat"])
+    for dset in datasets + [reference]:
+        dset.close()
+
+    # static fields are shared through hard links
+    area = [os.stat(tmp_path / "ensemble" / x) for x in ensemble if ".AREA." in x]
+    assert len(set((x.st_dev, x.st_ino) for x in area)) == 1
+    assert area[0].st_nlink == 3
+
+
+def test_output_path_member():
+    cmip = output_path(
+        "CMIP.Synthetic", "tas", TIME_RES="mon", DATA_FORMAT="cmip", MEMBER=2
+    )
+    assert "CMIP_Synthetic_r2i1p1f1_gr1_" in cmip
+    ncar = output_path("NCAR.Synthetic", "TS", TIME_RES="day", MEMBER=2)
+    assert ncar.startswith("NCAR.Synthetic.r2/day/")
+    assert "NCAR.Synthetic.r2.TS.day.nc" in ncar
+
+
+def test_link_static_duplicates(tmp_path):
+    specs = [x for x in compile_config(config_file("CMIP", "mon")) if x.static]
+    kwargs = dict(
+        DLAT=30.0,
+        DLON=60.0,
+        STARTYEAR=1,
+        NYEARS=1,
+        CASENAME="CMIP.Synthetic",
+        DATA_FORMAT="cmip",
+        OUTPUT_URL=str(tmp_path),
+    )
+    tasks = link_static_duplicates(
+        synthetic_tasks(specs, TIME_RES="mon", **kwargs)
+        + synthetic_tasks(specs, TIME_RES="day", **kwargs)
+    )
+    assert ["LINK_TO" in x[2] for x in tasks] == [False, False, True, True]
+    assert [x[2]["LINK_TO"] for x in tasks[2:]] == [x[1] for x in tasks[:2]]
+
+    outfiles = run_tasks(tasks)
+    for mon, day in zip(outfiles[:2], outfiles[2:]):
+        assert "mon" in mon and "day" in day
+        assert os.path.samefile(mon, day)
+
+    # a different grid is a different field
+    tasks = link_static_duplicates(
+        synthetic_tasks(specs, TIME_RES="mon", **kwargs)
+        + synthetic_tasks(specs, TIME_RES="day", **dict(kwargs, DLAT=20.0))
+    )
+    assert ["LINK_TO" in x[2] for x in tasks] == [False] * 4
+
+
+def test_synthetic_main_attribute_patch(tmp_path, capsys):
+    atts = {"long_name": "Surface temperature", "cell_methods": "time: mean"}
+    config = write_config(tmp_path / "config.yml", ["TS"], {"TS": atts})
+    os.makedirs(tmp_path / "patched")
+    os.makedirs(tmp_path / "fresh")
+    outfile = _run(tmp_path / "patched", load_yaml(config), 1)[0]
+
+    # metadata-only edits are patched into the existing file
+    atts = {"long_name": "Skin temperature", "comment": "synthetic"}
+    write_config(config, ["TS"], {"TS": atts})
+    capsys.readouterr()
+    _run(tmp_path / "patched", load_yaml(config), 1)
+    assert "Updating attributes" in capsys.readouterr().out
+    _run(tmp_path / "fresh", load_yaml(config), 1)
+
+    patched = xr.open_dataset(tmp_path / "patched" / outfile)
+    fresh = xr.open_dataset(tmp_path / "fresh" / outfile)
+    assert patched.identical(fresh)
+    assert patched["TS"].attrs["long_name"] == "Skin temperature"
+    assert "cell_methods" not in patched["TS"].attrs
+    patched.close()
+    fresh.close()
+
+    # the patched file is up to date
+    _run(tmp_path / "patched", load_yaml(config), 1)
+    assert "(0 of 1 files out of date)" in capsys.readouterr().out
+
+    # attributes that change the encoding of the data are not patched
+    atts = {"long_name": "Skin temperature", "missing_value": 1.0e20}
+    write_config(config, ["TS"], {"TS": atts})
+    _run(tmp_path / "patched", load_yaml(config), 1)
+    output = capsys.readouterr().out
+    assert "Updating attributes" not in output
+    assert "(1 of 1 files out of date)" in output
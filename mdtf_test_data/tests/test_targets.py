@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+import xarray as xr
+
+fsspec = pytest.importorskip("fsspec")
+
+from mdtf_test_data.synthetic.conventions import config_file
+from mdtf_test_data.synthetic.synthetic_setup import synthetic_main
+from mdtf_test_data.synthetic.targets import resolve_output_url
+from mdtf_test_data.synthetic.variable_spec import compile_config
+
+KWARGS = dict(
+    DLAT=30.0,
+    DLON=60.0,
+    STARTYEAR=1,
+    NYEARS=1,
+    CASENAME="NCAR.Synthetic",
+    TIME_RES="day",
+    DATA_FORMAT="ncar",
+)
+
+
+def test_resolve_output_url(tmp_path):
+    assert resolve_output_url(f"file://{tmp_path}") == str(tmp_path)
+    assert resolve_output_url("out") == "out"
+    assert resolve_output_url("memory://data/") == "memory://data"
+
+
+@pytest.mark.parametrize("slab_size", [None, 100])
+def test_synthetic_main_memory(tmp_path, slab_size):
+    specs = compile_config(config_file("NCAR", "day"))[0:3]
+    url = f"memory://{tmp_path.name}"
+    remote = synthetic_main(
+        specs, SLAB_SIZE=slab_size, JOBS=2, OUTPUT_URL=url, **KWARGS
+    )
+    local = synthetic_main(specs, SLAB_SIZE=slab_size, OUTPUT_URL=tmp_path, **KWARGS)
+    assert [x.replace(url, str(tmp_path)) for x in remote] == local
+
+    fs = fsspec.filesystem("memory")
+    for outfile, path in zip(remote, local):
+        contents = fs.cat_file(outfile.split("://")[1])
+        ds_remote = xr.open_dataset(contents, engine="netcdf4")
+        ds_local = xr.open_dataset(path)
+        assert ds_remote.identical(ds_local)
+        ds_remote.close()
+        ds_local.close()
+
+    # the manifest is kept with the output
+    root = os.path.dirname(os.path.dirname(remote[0]))
+    assert fs.exists(f"{root}/.mdtf_manifest.json".split("://")[1])
+    mtimes = [fs.info(x.split("://")[1])["created"] for x in remote]
+    synthetic_main(specs, SLAB_SIZE=slab_size, OUTPUT_URL=url, **KWARGS)
+    assert mtimes == [fs.info(x.split("://")[1])["created"] for x in remote]
+    fs.rm(tmp_path.name, recursive=True)
@@ -0,0 +1,117 @@
+import json
+import os
+import pickle
+
+import pytest
+
+import numpy as np
+
+from mdtf_test_data.synthetic import VariableSpec
+from mdtf_test_data.synthetic import compile_config
+from mdtf_test_data.synthetic.variable_spec import _cache_path
+from mdtf_test_data.synthetic.variable_spec import compile_variables
+from mdtf_test_data.synthetic.variable_spec import load_yaml
+from mdtf_test_data.util.resources import resource_filename
+
+
+CONFIG = (
+    "variables :\n"
+    "  name :\n"
+    '    - "PS"\n'
+    '    - "areacello"\n'
+    "PS :\n"
+    "  atts :\n"
+    '    units : "Pa"\n'
+    "  stats :\n"
+    "    - [98000.0, 100.0]\n"
+    "areacello :\n"
+    "  atts :\n"
+    '    units : "m2"\n'
+    "  static : True\n"
+    '  grid : "tripolar"\n'
+    "  encoding :\n"
+    '    compression : "zlib"\n'
+)
+
+
+def test_compile_variables_matches_yaml():
+    config = resource_filename("config/cmip_mon.yml")
+    specs = compile_config(config, use_cache=False)
+    assert specs == compile_variables(load_yaml(config))
+    assert [x.name for x in specs] == load_yaml(config)["variables"]["name"]
+    thetao = [x for x in specs if x.name == "thetao"][0]
+    assert isinstance(thetao.stats, np.ndarray)
+    assert thetao.stats.shape == (35, 2)
+    assert thetao.nlev == 35
+    assert thetao.grid == "tripolar"
+
+
+def test_variable_spec_defaults():
+    spec = VariableSpec("dummy", attrs={"units": "K"})
+    assert spec.stats is None
+    assert spec.stats_list is None
+    assert spec.generator == "normal"
+    assert spec.grid == "standard"
+    assert not spec.static
+    assert pickle.loads(pickle.dumps(spec)) == spec
+
+
+def test_compile_config_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    config = tmp_path / "config.yml"
+    config.write_text(CONFIG)
+    cache = _cache_path(config)
+    assert os.path.dirname(cache) == str(tmp_path / "cache" / "mdtf_test_data")
+
+    specs = compile_config(config)
+    assert os.path.exists(cache)
+    assert specs[0].stats_list == [(98000.0, 100.0)]
+    assert specs[1].static and specs[1].grid == "tripolar"
+    assert specs[0].encoding is None
+    assert specs[1].encoding == {"compression": "zlib"}
+    assert compile_config(config) == specs
+
+    # a modified file is recompiled
+    config.write_text(CONFIG.replace("98000.0", "99000.0"))
+    assert compile_config(config)[0].stats_list == [(99000.0, 100.0)]
+    with open(cache, "r") as fhandle:
+        cached = json.load(fhandle)
+    assert cached["specs"][0]["stats"] == [[99000.0, 100.0]]
+    assert cached["path"] == str(config)
+
+    # caches of another version or file are ignored
+    cached["version"] = 0
+    cached["specs"][0]["stats"] = [[1.0, 1.0]]
+    with open(cache, "w") as fhandle:
+        json.dump(cached, fhandle)
+    assert compile_config(config)[0].stats_list == [(99000.0, 100.0)]
+
+
+def test_compile_config_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("MDTF_TEST_UNITS", "hPa")
+    config = tmp_path / "config.yml"
+    config.write_text(CONFIG.replace('"Pa"', '"${MDTF_TEST_UNITS}"'))
+    assert compile_config(config)[0].attrs["units"] == "hPa"
+    assert not os.path.exists(tmp_path / "cache")
+
+
+def test_load_yaml_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("MDTF_TEST_UNITS", "hPa")
+    monkeypatch.delenv("MDTF_TEST_UNSET", raising=False)
+    monkeypatch.delenv("ENVYAML_STRICT_DISABLE", raising=False)
+    config = tmp_path / "config.yml"
+    config.write_text(
+        "# comments may mention $MDTF_TEST_UNSET\n"
+        "a : $MDTF_TEST_UNITS\n"
+        'b : "${MDTF_TEST_UNSET|Pa}"\n'
+        'c : "cost: $$5 or $5"\n'
+    )
+    assert load_yaml(config) == {"a": "hPa", "b": "Pa", "c": "cost: $5 or $5"}
+
+    # unset variables without a default are an error, as with EnvYAML
+    config.write_text("a : ${MDTF_TEST_UNSET}\n")
+    with pytest.raises(ValueError, match="MDTF_TEST_UNSET"):
+        load_yaml(config)
+    monkeypatch.setenv("ENVYAML_STRICT_DISABLE", "1")
+    assert load_yaml(config) == {"a": "${MDTF_TEST_UNSET}"}
@@ -0,0 +1,67 @@
+import warnings
+
+import pytest
+
+import xarray as xr
+
+zarr = pytest.importorskip("zarr")
+
+from mdtf_test_data.synthetic import generate_synthetic_dataset
+from mdtf_test_data.synthetic import write_to_netcdf
+from mdtf_test_data.synthetic.synthetic_data import generate_synthetic_slabs
+from mdtf_test_data.synthetic.zarr_output import write_slabs_to_zarr
+from mdtf_test_data.synthetic.zarr_output import write_to_zarr
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        dict(fmt="ncar", timeres="day", stats=[(280.0, 10.0)]),
+        dict(fmt="gfdl", timeres="mon", stats=[(280.0, 10.0)] * 19),
+        dict(fmt="cmip", timeres="mon", grid="tripolar"),
+    ],
+)
+def test_write_slabs_to_zarr(tmp_path, kwargs):
+    args = (60.0, 30.0, 1, 1, "dummy")
+    attrs = {"units": "K"}
+    full = generate_synthetic_dataset(*args, attrs=attrs, **kwargs)
+    write_to_netcdf(full, tmp_path / "full.nc")
+    ntimes = len(full["time"])
+
+    slabs = generate_synthetic_slabs(*args, attrs=attrs, slab_size=5, **kwargs)
+    storage = {"compression": "zstd", "complevel": 3}
+    write_slabs_to_zarr(
+        slabs, tmp_path / "out.zarr", ntimes=ntimes, storage=storage, threads=3
+    )
+
+    assert zarr.open_array(tmp_path / "out.zarr", path="dummy").chunks[0] == 5
+
+    ds_nc = xr.open_dataset(tmp_path / "full.nc", decode_times=False)
+    ds_zarr = xr.open_zarr(tmp_path / "out.zarr", decode_times=False).load()
+    assert ds_zarr["dummy"].identical(ds_nc["dummy"])
+    assert ds_zarr["time"].identical(ds_nc["time"])
+    ds_nc.close()
+
+
+def test_write_to_zarr_static(tmp_path):
+    dset = generate_synthetic_dataset(
+        60.0, 30.0, 1, 1, "dummy", timeres="mon", fmt="cmip", static=True
+    )
+    write_to_zarr(dset, tmp_path / "static.zarr")
+    ds_zarr = xr.open_zarr(tmp_path / "static.zarr").load()
+    assert "time" not in ds_zarr.dims
+    assert ds_zarr["dummy"].equals(dset["dummy"])
+
+
+def test_write_to_zarr_warnings(tmp_path):
+    dset = generate_synthetic_dataset(
+        60.0, 30.0, 1, 1, "dummy", timeres="mon", stats=[(280.0, 10.0)]
+    )
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        write_to_zarr(dset, tmp_path / "out.zarr", slab_size=4)
+    assert not any("Consolidated metadata" in str(x.message) for x in caught)
+
+    # the warning is only silenced while writing
+    patterns = [x[1].pattern for x in warnings.filters if x[1] is not None]
+    assert not any(x.startswith("Consolidated metadata") for x in patterns)
@@ -1,2 +1,20 @@
 """ init file for util directory """
-from .rectilinear import regrid_lat_lon_dataset
+
+import importlib
+
+# public names and the modules that define them; `rectilinear` tries to
+# import xesmf, so it is only loaded when regridding is requested
+_LAZY_ATTRS = {"regrid_lat_lon_dataset": "rectilinear"}
+
+__all__ = sorted(_LAZY_ATTRS)
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        module = importlib.import_module(f".{_LAZY_ATTRS[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
@@ -5,10 +5,150 @@
 class cli_holder(object):
     "Object with command line info from argparse"
 
-    def __init__(self, convention, startyear, nyears, dlat, dlon, unittest):
+    def __init__(
+        self,
+        convention,
+        startyear,
+        nyears,
+        dlat,
+        dlon,
+        unittest,
+        compress=False,
+        jobs=1,
+        force=False,
+        plan=False,
+        max_memory=None,
+        max_disk=None,
+        slab_size=None,
+        storage=None,
+        output_format="netcdf",
+        threads=1,
+        pipeline_depth=None,
+        multi_variable=False,
+        ensemble=1,
+        output_url=None,
+        resume=False,
+    ):
         self.convention = convention
         self.startyear = startyear
         self.nyears = nyears
         self.dlat = dlat
         self.dlon = dlon
         self.unittest = unittest
+        self.compress = compress
+        self.jobs = jobs
+        self.force = force
+        self.plan = plan
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.slab_size = slab_size
+        self.storage = storage
+        self.output_format = output_format
+        self.threads = threads
+        self.pipeline_depth = pipeline_depth
+        self.multi_variable = multi_variable
+        self.ensemble = ensemble
+        self.output_url = output_url
+        self.resume = resume
+
+
+def parse_chunks(chunks):
+    """Parses a chunk specification such as "time=12,lat=90"
+
+    Parameters
+    ----------
+    chunks : str
+        Comma-separated list of dimension=size pairs
+
+    Returns
+    -------
+    dict
+        Chunk size for each dimension name, or None if `chunks` is empty
+    """
+    if chunks is None or chunks == "":
+        return None
+    result = {}
+    for item in chunks.split(","):
+        dim, size = item.split("=")
+        result[dim.strip()] = int(size)
+    return result
+
+
+def storage_options(
+    compression=None,
+    complevel=None,
+    shuffle=True,
+    chunks=None,
+    packing=None,
+    engine=None,
+    nc_format=None,
+    chunk_cache=None,
+    quantize=None,
+    least_significant_digit=None,
+    keepbits=None,
+):
+    """Collects compression, chunking, packing, quantization and engine options
+
+    Parameters
+    ----------
+    compression : str, optional
+        Compression codec, by default None
+    complevel : int, optional
+        Compression level, by default None
+    shuffle : bool, optional
+        Apply the byte shuffle filter, by default True
+    chunks : str, optional
+        Chunk specification such as "time=12,lat=90", by default None
+    packing : str, optional
+        Packed int16 output scaled from the configured "stats" or the
+        "minmax" of the data, by default None
+    engine : str, optional
+        xarray engine writing NetCDF files, by default None
+    nc_format : str, optional
+        NetCDF file format, e.g. "NETCDF3_64BIT", by default None
+    chunk_cache : int, optional
+        HDF5 chunk cache size in bytes used while writing, by default None
+    quantize : str, optional
+        Round each variable to digits derived from its "stats",
+        by default None
+    least_significant_digit : int, optional
+        Round every variable to this many decimal digits, by default None
+    keepbits : int, optional
+        Round every variable to this many mantissa bits, by default None
+
+    Returns
+    -------
+    dict or None
+        Storage options for `write_to_netcdf`, or None if no option is set
+    """
+    compression = None if compression == "none" else compression
+    chunks = parse_chunks(chunks)
+    packing = None if packing == "none" else packing
+    quantize = None if quantize == "none" else quantize
+    options = [compression, chunks, packing, engine, nc_format, chunk_cache]
+    options = options + [quantize, least_significant_digit, keepbits]
+    if all(x is None for x in options):
+        return None
+    storage = {}
+    if compression is not None:
+        storage["compression"] = compression
+        storage["shuffle"] = shuffle
+        if complevel is not None:
+            storage["complevel"] = complevel
+    if chunks is not None:
+        storage["chunks"] = chunks
+    if packing is not None:
+        storage["packing"] = packing
+    if engine is not None:
+        storage["engine"] = engine
+    if nc_format is not None:
+        storage["format"] = nc_format
+    if chunk_cache is not None:
+        storage["chunk_cache"] = chunk_cache
+    if quantize is not None:
+        storage["quantize"] = quantize
+    if least_significant_digit is not None:
+        storage["least_significant_digit"] = least_significant_digit
+    if keepbits is not None:
+        storage["keepbits"] = keepbits
+    return storage
@@ -8,6 +8,10 @@ import warnings
 
 import xarray as xr
 
+from mdtf_test_data.synthetic.planner import parse_size
+from mdtf_test_data.synthetic.synthetic_data import storage_encoding
+from mdtf_test_data.synthetic.synthetic_data import write_encoded_netcdf
+from .cli import storage_options
 from .rectilinear import regrid_lat_lon_dataset
 
 # Newer versions of xESMF are throwing an error:
@@ -46,6 +50,48 @@ def parse():
     parser.add_argument(
         "-O", dest="overwrite", action="store_true", help="Overwrite existing file"
     )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        choices=["none", "zlib", "zstd", "bzip2"],
+        default=None,
+        help="Compression codec for the output file",
+    )
+    parser.add_argument("--complevel", type=int, default=None, help="Compression level")
+    parser.add_argument(
+        "--no-shuffle",
+        dest="shuffle",
+        action="store_false",
+        help="Do not apply the byte shuffle filter before compressing",
+    )
+    parser.add_argument(
+        "--chunks",
+        type=str,
+        default=None,
+        help="Chunk sizes of output variables, e.g. time=12,lat=90,lon=180",
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        help="xarray engine writing NetCDF files",
+        choices=["netcdf4", "h5netcdf", "scipy"],
+        default=None,
+    )
+    parser.add_argument(
+        "--nc-format",
+        dest="nc_format",
+        type=str,
+        help="NetCDF file format; the scipy engine writes NetCDF3 only",
+        choices=["NETCDF4", "NETCDF4_CLASSIC", "NETCDF3_64BIT", "NETCDF3_CLASSIC"],
+        default=None,
+    )
+    parser.add_argument(
+        "--chunk-cache",
+        dest="chunk_cache",
+        type=str,
+        help="HDF5 chunk cache size used while writing, e.g. 64M",
+        default=None,
+    )
     parser.add_argument("infile", type=str, help="Path to input NetCDF file")
     return parser.parse_args()
 
@@ -60,7 +106,16 @@ if __name__ == "__main__":
     )
     _outfile = args.outfile if args.outfile is not None else "out.nc"
 
-    encoding = {}
+    storage = storage_options(
+        args.compression,
+        args.complevel,
+        args.shuffle,
+        args.chunks,
+        engine=args.engine,
+        nc_format=args.nc_format,
+        chunk_cache=parse_size(args.chunk_cache),
+    )
+
     for var in list(dset_out.variables):
         if "float" in str(dset_out[var].dtype):
             dset_out[var].encoding["_FillValue"] = 1.0e20
@@ -68,8 +123,10 @@ if __name__ == "__main__":
             dset_out[var].encoding["_FillValue"] = -999
         else:
             dset_out[var].encoding["_FillValue"] = None
+        if storage is not None:
+            dset_out[var].encoding.update(storage_encoding(dset_out[var], storage))
 
-    dset_out.to_netcdf(_outfile, encoding=encoding)
+    write_encoded_netcdf(dset_out, _outfile, storage=storage)
 
     if args.overwrite is True:
         print(f"Overwrite existing file {_infile}")
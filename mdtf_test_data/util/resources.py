@@ -0,0 +1,30 @@
+""" Lookup of data files packaged with mdtf_test_data """
+
+__all__ = ["resource_filename"]
+
+import os
+
+try:
+    from importlib.resources import files as _files
+except ImportError:  # Python < 3.9
+    _files = None
+
+
+def resource_filename(path):
+    """Returns the file system path of a packaged data file
+
+    Parameters
+    ----------
+    path : str
+        Path relative to the mdtf_test_data package, e.g.
+        "resources/ocean_static_5deg.nc"
+
+    Returns
+    -------
+    str
+        Absolute path to the file
+    """
+    if _files is None:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return os.path.join(root, path)
+    return str(_files("mdtf_test_data").joinpath(path))
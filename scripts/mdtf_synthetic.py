@@ -2,21 +2,35 @@
 """ mdtf_test_data driver program """
 import sys
 import mdtf_test_data
-from mdtf_test_data.synthetic.synthetic_setup import synthetic_main
 from mdtf_test_data.util.cli import cli_holder
+from mdtf_test_data.util.cli import storage_options
+from mdtf_test_data.synthetic.conventions import config_file
+from mdtf_test_data.synthetic.conventions import convention_grid
+from mdtf_test_data.synthetic.conventions import resolve_conventions
+from mdtf_test_data.synthetic.conventions import CONVENTIONS
 import argparse
-import pkg_resources as pkgr
-from envyaml import EnvYAML
 
 MDTF_PACKAGE_PATH = mdtf_test_data.__path__[0]
 
 
 def read_yaml(file_name):
-    """A function to read YAML files"""
-    config = EnvYAML(file_name)
+    """A function to read YAML files into a list of variable specs"""
+    from mdtf_test_data.synthetic.variable_spec import compile_config
+
+    config = compile_config(file_name)
     return config
 
 
+def write_references(outputs, mode):
+    """Writes the reference files of the outputs of a run, see `--references`"""
+    if mode == "none":
+        return
+    from mdtf_test_data.synthetic.references import write_output_references
+
+    written = write_output_references(outputs, MODE=mode)
+    print(f"Wrote {len(written)} reference files")
+
+
 def main():
     """The the central nervous system of the mdtf_test_data package"""
     print("Starting mdtf_test_data")
@@ -28,9 +42,10 @@ def main():
         "--convention",
         "-c",
         type=str,
-        help="Model convention",
-        choices=["GFDL", "CESM", "NCAR", "CMIP"],
-        required=True,
+        nargs="+",
+        help="Model convention(s), or `all` for every convention",
+        choices=["GFDL", "CESM", "NCAR", "CMIP", "all"],
+        required=False,
         default="",
     )
     parser.add_argument(
@@ -61,17 +76,336 @@ def main():
         required=False,
         default=20.0,
     )
+    parser.add_argument(
+        "--gather-wet-points",
+        dest="compress",
+        action="store_true",
+        help="Store tripolar ocean fields on wet points only (CF compression by gathering)",
+        required=False,
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        help="Number of worker processes used to generate variables",
+        required=False,
+        default=1,
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Regenerate all files, even those the output manifest shows as up to date",
+        required=False,
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Report estimated size, memory and runtime of each file without generating data",
+        required=False,
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=str,
+        help="Memory budget, e.g. 8G; refuse files that exceed it and limit concurrent jobs",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--max-disk",
+        type=str,
+        help="Disk budget, e.g. 100G; refuse runs whose output exceeds it",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--slab-size",
+        type=int,
+        help="Generate and write time-dependent variables this many time levels at a time",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        help="Compression codec for output files",
+        choices=["none", "zlib", "zstd", "bzip2"],
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--complevel",
+        type=int,
+        help="Compression level",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--no-shuffle",
+        dest="shuffle",
+        action="store_false",
+        help="Do not apply the byte shuffle filter before compressing",
+        required=False,
+    )
+    parser.add_argument(
+        "--chunks",
+        type=str,
+        help="Chunk sizes of output variables, e.g. time=12,lat=90,lon=180",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--pack",
+        type=str,
+        help="Store variables as int16 scaled from the configured stats or the data min/max",
+        choices=["none", "stats", "minmax"],
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--quantize",
+        type=str,
+        help="Round each variable to a precision derived from its configured stats",
+        choices=["none", "stats"],
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--least-significant-digit",
+        dest="least_significant_digit",
+        type=int,
+        help="Round every variable to this many decimal digits",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--keepbits",
+        type=int,
+        help="Round every variable to this many mantissa bits (bit rounding)",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        help="xarray engine writing NetCDF files",
+        choices=["netcdf4", "h5netcdf", "scipy"],
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--nc-format",
+        dest="nc_format",
+        type=str,
+        help="NetCDF file format; the scipy engine writes NetCDF3 only",
+        choices=["NETCDF4", "NETCDF4_CLASSIC", "NETCDF3_64BIT", "NETCDF3_CLASSIC"],
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--chunk-cache",
+        dest="chunk_cache",
+        type=str,
+        help="HDF5 chunk cache size used while writing, e.g. 64M",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        type=str,
+        help="Output file format",
+        choices=["netcdf", "zarr"],
+        required=False,
+        default="netcdf",
+    )
+    parser.add_argument(
+        "--write-threads",
+        dest="threads",
+        type=int,
+        help="Number of threads writing the chunks of each Zarr store",
+        required=False,
+        default=1,
+    )
+    parser.add_argument(
+        "--pipeline",
+        dest="pipeline_depth",
+        type=int,
+        help="Write files in a separate process, queueing up to this many datasets or slabs",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--multi-variable",
+        action="store_true",
+        help="Write the variables of each frequency to a few shared files instead of one file per variable",
+        required=False,
+    )
+    parser.add_argument(
+        "--ensemble",
+        type=int,
+        help="Number of ensemble members, each generated with its own random seed",
+        required=False,
+        default=1,
+    )
+    parser.add_argument(
+        "--output-url",
+        dest="output_url",
+        type=str,
+        help="Directory or fsspec URL to write output to, e.g. memory://data or s3://bucket/data",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the files an interrupted run was writing in slabs from their last checkpoint",
+        required=False,
+    )
+    parser.add_argument(
+        "--work-plan",
+        dest="work_plan",
+        type=str,
+        metavar="FILE",
+        help="Work plan file used by --shards, --shard and --finalize",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        help="Write a work plan splitting the run into N shards instead of generating",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--piece-size",
+        dest="piece_size",
+        type=int,
+        help="Split time-dependent variables of a work plan into pieces of N time levels",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--shard",
+        type=int,
+        help="Generate shard I (numbered from 0) of a work plan",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--finalize",
+        action="store_true",
+        help="Check that every shard of a work plan is complete and stitch split variables",
+        required=False,
+    )
+    parser.add_argument(
+        "--keep-split",
+        dest="keep_split",
+        action="store_true",
+        help="Leave the pieces of split variables as they are when finalizing",
+        required=False,
+    )
+    parser.add_argument(
+        "--references",
+        type=str,
+        help="Write JSON reference files opening the NetCDF outputs as Zarr datasets, "
+        + "one per variable or one per output directory and grid",
+        choices=["none", "variable", "tree"],
+        required=False,
+        default="none",
+    )
+    parser.add_argument(
+        "--serve",
+        type=str,
+        metavar="ADDRESS",
+        help="Run a generation service on host:port or a Unix socket path instead of generating once",
+        required=False,
+        default=None,
+    )
     parser.add_argument(
         "--unittest", "-ut", action="store_true", help="Run unit tests", required=False
     )
     args = parser.parse_args()
+    sharded = args.shards is not None or args.shard is not None or args.finalize
+    if sharded and args.work_plan is None:
+        parser.error("--shards, --shard and --finalize require --work-plan")
+    if [args.shards is not None, args.shard is not None, args.finalize].count(True) > 1:
+        parser.error("--shards, --shard and --finalize are separate steps")
+    if args.serve is None and args.shard is None and not args.finalize:
+        if not args.convention:
+            parser.error("the following arguments are required: --convention/-c")
+
+    # the generators, xarray and friends are only needed once the command
+    # line is valid, so `--help` and usage errors return immediately
+    from mdtf_test_data.synthetic.synthetic_setup import link_static_duplicates
+    from mdtf_test_data.synthetic.synthetic_setup import run_tasks
+    from mdtf_test_data.synthetic.synthetic_setup import synthetic_tasks
+    from mdtf_test_data.synthetic.planner import check_budget
+    from mdtf_test_data.synthetic.planner import parse_size
+    from mdtf_test_data.synthetic.planner import plan_tasks
+    from mdtf_test_data.synthetic.planner import print_plan
+
+    if args.serve is not None:
+        from mdtf_test_data.synthetic.service import serve
+
+        assert args.jobs >= 1, "Error: number of jobs must be at least 1"
+        try:
+            serve(args.serve, JOBS=args.jobs)
+        except ValueError as exc:
+            print(f"Error: {exc}")
+            sys.exit(1)
+        return
+
+    if args.shard is not None or args.finalize:
+        from mdtf_test_data.synthetic.shards import finalize_work_plan
+        from mdtf_test_data.synthetic.shards import run_shard
+
+        assert args.jobs >= 1, "Error: number of jobs must be at least 1"
+        if args.shard is not None:
+            run_shard(args.work_plan, args.shard, JOBS=args.jobs)
+            return
+        try:
+            outputs = finalize_work_plan(args.work_plan, KEEP_SPLIT=args.keep_split)
+        except ValueError as exc:
+            print(f"Error: {exc}")
+            sys.exit(1)
+        write_references(outputs, args.references)
+        return
+
     cli_info = cli_holder(
-        args.convention,
+        resolve_conventions(args.convention),
         args.startyear,
         args.nyears,
         args.dlat,
         args.dlon,
         args.unittest,
+        compress=args.compress,
+        jobs=args.jobs,
+        force=args.force,
+        plan=args.plan,
+        max_memory=parse_size(args.max_memory),
+        max_disk=parse_size(args.max_disk),
+        slab_size=args.slab_size,
+        storage=storage_options(
+            args.compression,
+            args.complevel,
+            args.shuffle,
+            args.chunks,
+            args.pack,
+            engine=args.engine,
+            nc_format=args.nc_format,
+            chunk_cache=parse_size(args.chunk_cache),
+            quantize=args.quantize,
+            least_significant_digit=args.least_significant_digit,
+            keepbits=args.keepbits,
+        ),
+        output_format=args.output_format,
+        threads=args.threads,
+        pipeline_depth=args.pipeline_depth,
+        multi_variable=args.multi_variable,
+        ensemble=args.ensemble,
+        output_url=args.output_url,
+        resume=args.resume,
     )
 
     assert (
@@ -80,6 +414,15 @@ def main():
     assert (
         cli_info.dlon <= 60.0 and cli_info.dlon >= 0.5
     ), "Error: dlon value is invalid; valid range is [0.5 60.0]"
+    assert cli_info.jobs >= 1, "Error: number of jobs must be at least 1"
+    assert (
+        cli_info.slab_size is None or cli_info.slab_size >= 1
+    ), "Error: slab size must be at least 1"
+    assert cli_info.threads >= 1, "Error: number of write threads must be at least 1"
+    assert (
+        cli_info.pipeline_depth is None or cli_info.pipeline_depth >= 1
+    ), "Error: pipeline depth must be at least 1"
+    assert cli_info.ensemble >= 1, "Error: ensemble size must be at least 1"
 
     if cli_info.unittest:
         try:
@@ -117,66 +460,89 @@ def main():
             )
             sys.exit(retcode_4)
 
-    if cli_info.convention == "GFDL":
-        print("Importing GFDL variable information")
-        input_data = pkgr.resource_filename("mdtf_test_data", "config/gfdl_day.yml")
-        input_data = read_yaml(input_data)
-
-        print("Calling Synthetic Data Generator for GFDL data")
-        synthetic_main(
-            input_data,
-            DLAT=cli_info.dlat,
-            DLON=cli_info.dlon,
-            STARTYEAR=cli_info.startyear,
-            NYEARS=cli_info.nyears,
-            CASENAME="GFDL.Synthetic",
-            TIME_RES="day",
-            DATA_FORMAT="gfdl",
-        )
-    elif cli_info.convention == "CESM" or cli_info.convention == "NCAR":
-        print("Importing NCAR variable information")
-        time_res = ["mon", "day", "3hr", "1hr"]
-        for t in time_res:
-            input_data = pkgr.resource_filename(
-                "mdtf_test_data", f"config/ncar_{t}.yml"
-            )
-            input_data = read_yaml(input_data)
-            dlat = cli_info.dlat
-            dlon = cli_info.dlon
-            if t == "day":
-                dlat = 5.0
-                dlon = 5.0
-            print("Calling Synthetic Data Generator for NCAR data")
-            synthetic_main(
-                input_data,
-                DLAT=dlat,
-                DLON=dlon,
-                STARTYEAR=cli_info.startyear,
-                NYEARS=cli_info.nyears,
-                CASENAME="NCAR.Synthetic",
-                TIME_RES=t,
-                DATA_FORMAT="ncar",
-            )
-    if cli_info.convention == "CMIP":
-        print("Importing CMIP variable information")
-        time_res = ["mon", "day"]
-        for t in time_res:
-            input_data = pkgr.resource_filename(
-                "mdtf_test_data", f"config/cmip_{t}.yml"
+    tasks = []
+    for convention in cli_info.convention:
+        settings = CONVENTIONS[convention]
+        print(f"Importing {convention} variable information")
+        for t in settings["time_res"]:
+            input_data = read_yaml(config_file(convention, t))
+            dlat, dlon = convention_grid(
+                convention, t, DLAT=cli_info.dlat, DLON=cli_info.dlon
             )
-            input_data = read_yaml(input_data)
-
-            print("Calling Synthetic Data Generator for CMIP data")
-            synthetic_main(
-                input_data,
-                DLAT=cli_info.dlat,
-                DLON=cli_info.dlon,
-                STARTYEAR=cli_info.startyear,
-                NYEARS=cli_info.nyears,
-                CASENAME="CMIP.Synthetic",
-                TIME_RES=t,
-                DATA_FORMAT="cmip",
+            for member in range(1, cli_info.ensemble + 1):
+                tasks += synthetic_tasks(
+                    input_data,
+                    DLAT=dlat,
+                    DLON=dlon,
+                    STARTYEAR=cli_info.startyear,
+                    NYEARS=cli_info.nyears,
+                    CASENAME=settings["casename"],
+                    TIME_RES=t,
+                    DATA_FORMAT=settings["fmt"],
+                    COMPRESS=cli_info.compress,
+                    SLAB_SIZE=cli_info.slab_size,
+                    STORAGE=cli_info.storage,
+                    OUTPUT_FORMAT=cli_info.output_format,
+                    THREADS=cli_info.threads,
+                    MULTI_VARIABLE=cli_info.multi_variable,
+                    MEMBER=member,
+                    OUTPUT_URL=cli_info.output_url,
+                    CREATE_DIRS=not cli_info.plan,
+                )
+
+    tasks = link_static_duplicates(tasks)
+    if args.shards is not None:
+        from mdtf_test_data.synthetic.shards import write_work_plan
+
+        work_plan = write_work_plan(
+            tasks,
+            args.work_plan,
+            SHARDS=args.shards,
+            PIECE_SIZE=args.piece_size,
+            FORCE=cli_info.force,
+        )
+        print(
+            f"Wrote {len(work_plan['units'])} units in {args.shards} shards "
+            + f"to {args.work_plan}"
+        )
+        return
+
+    # the planner benchmarks this machine and checksums existing outputs,
+    # so it only runs for a dry run or a budget
+    plan, jobs = None, cli_info.jobs
+    budget = cli_info.max_memory is not None or cli_info.max_disk is not None
+    if cli_info.plan or budget:
+        plan = plan_tasks(
+            tasks, FORCE=cli_info.force, PIPELINE_DEPTH=cli_info.pipeline_depth
+        )
+        error = None
+        try:
+            jobs = check_budget(
+                plan,
+                max_memory=cli_info.max_memory,
+                max_disk=cli_info.max_disk,
+                JOBS=cli_info.jobs,
             )
+        except ValueError as exc:
+            error = exc
+        if cli_info.plan:
+            print_plan(plan, JOBS=jobs)
+        if error is not None:
+            print(f"Error: {error}")
+            sys.exit(1)
+        if cli_info.plan:
+            return
+
+    print(f"Calling Synthetic Data Generator for {', '.join(cli_info.convention)} data")
+    outputs = run_tasks(
+        tasks,
+        JOBS=jobs,
+        FORCE=cli_info.force,
+        PIPELINE_DEPTH=cli_info.pipeline_depth,
+        RESUME=cli_info.resume,
+        PLAN=plan,
+    )
+    write_references(outputs, args.references)
 
 
 if __name__ == "__main__":